@@ -0,0 +1,334 @@
+"""Throughput benchmarks for gdc-fastq-splitter.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.bench --records 200000 --output results.json
+
+Every benchmark reports records/sec and MB/sec (of uncompressed fastq) as
+JSON, so the results of different versions can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from gdc_fastq_splitter import VERSION
+from gdc_fastq_splitter.handler import main_handler
+from gdc_fastq_splitter.fastq.illumina import infer_fastq_type, ReadKeyResolver
+from gdc_fastq_splitter.fastq.reader import (
+    FastqReader,
+    RawFastqReader,
+    FastqBlockReader,
+)
+from gdc_fastq_splitter.fastq.report import BaseReport, ReportWithBarcodes
+from gdc_fastq_splitter.fastq.validate import RecordValidator
+from gdc_fastq_splitter.fastq.writer import FastqWriter
+from gdc_fastq_splitter.utils import get_logger
+
+from benchmarks.synthetic import SyntheticFastq, SEQID_FORMATS
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """Register a benchmark function"""
+    BENCHMARKS.append(func)
+    return func
+
+
+class Case:
+    """The inputs shared by the benchmarks of one seqid format and compression"""
+
+    def __init__(self, workdir, synthetic, gzipped):
+        self.workdir = workdir
+        self.synthetic = synthetic
+        self.gzipped = gzipped
+        self.label = "{0}-{1}".format(
+            synthetic.seqid_format, "gzip" if gzipped else "plain"
+        )
+        ext = ".fq.gz" if gzipped else ".fq"
+        self.fastq_a = os.path.join(workdir, "{0}_R1{1}".format(self.label, ext))
+        self.fastq_b = os.path.join(workdir, "{0}_R2{1}".format(self.label, ext))
+        self.size = synthetic.write(self.fastq_a, read_pair="1")
+        synthetic.write(self.fastq_b, read_pair="2")
+        self.records = synthetic.records
+        self.record_cls = infer_fastq_type(self.fastq_a)[1]
+
+    def output_prefix(self, name):
+        outdir = os.path.join(self.workdir, "out", name)
+        if os.path.isdir(outdir):
+            shutil.rmtree(outdir)
+        os.makedirs(outdir)
+        return os.path.join(outdir, "out_")
+
+    def batches(self):
+        reader = FastqBlockReader(
+            self.fastq_a, record_cls=self.record_cls.raw_record_cls
+        )
+        try:
+            return [list(batch) for batch in reader.batches()]
+        finally:
+            reader.close()
+
+    def raw_batches(self):
+        reader = FastqBlockReader(
+            self.fastq_a, record_cls=self.record_cls.raw_record_cls
+        )
+        try:
+            return list(reader.batches())
+        finally:
+            reader.close()
+
+    def headers(self):
+        reader = FastqBlockReader(
+            self.fastq_a, record_cls=self.record_cls.raw_record_cls
+        )
+        try:
+            return [h for batch in reader.batches() for h in batch.headers]
+        finally:
+            reader.close()
+
+
+@benchmark
+def reader_decoded(case, options):
+    """FastqReader decoding every record"""
+    reader = FastqReader(case.fastq_a, record_cls=case.record_cls)
+    try:
+        for _ in reader:
+            pass
+    finally:
+        reader.close()
+    return case.records, case.size
+
+
+@benchmark
+def reader_raw(case, options):
+    """RawFastqReader reading one raw record at a time"""
+    reader = RawFastqReader(case.fastq_a, record_cls=case.record_cls.raw_record_cls)
+    try:
+        for _ in reader:
+            pass
+    finally:
+        reader.close()
+    return case.records, case.size
+
+
+@benchmark
+def reader_block(case, options):
+    """FastqBlockReader splitting blocks into batches"""
+    reader = FastqBlockReader(
+        case.fastq_a,
+        record_cls=case.record_cls.raw_record_cls,
+        threads=options.threads,
+    )
+    try:
+        for _ in reader.batches():
+            pass
+    finally:
+        reader.close()
+    return case.records, case.size
+
+
+@benchmark
+def seqid_parse(case, options):
+    """Full sequence identifier parsing of every record"""
+    headers = [h.decode("utf-8") for h in case.headers()]
+    from_string = case.record_cls.seqid_cls.from_string
+    start = time.perf_counter()
+    for header in headers:
+        from_string(header).flowcell
+    return case.records, case.size, time.perf_counter() - start
+
+
+@benchmark
+def seqid_resolver(case, options):
+    """Read keys resolved by the prefix cache"""
+    headers = case.headers()
+    resolver = ReadKeyResolver(case.record_cls.seqid_cls)
+    start = time.perf_counter()
+    for _ in map(resolver, headers):
+        pass
+    return case.records, case.size, time.perf_counter() - start
+
+
+@benchmark
+def writer(case, options):
+    """FastqWriter compressing batches of records"""
+    batches = case.batches()
+    fname = case.output_prefix("writer") + "writer.fq.gz"
+    start = time.perf_counter()
+    writer = FastqWriter(fname, threads=options.threads)
+    try:
+        for records in batches:
+            writer.write_records(records)
+    finally:
+        writer.close()
+    return case.records, case.size, time.perf_counter() - start
+
+
+@benchmark
+def report_updates(case, options):
+    """Report updates for batches of records"""
+    batches = case.batches()
+    report_cls = ReportWithBarcodes if hasattr(batches[0][0], "index") else BaseReport
+    report = report_cls("report.json", "fastq.fq.gz")
+    start = time.perf_counter()
+    for records in batches:
+        report.add_records(records)
+    return case.records, case.size, time.perf_counter() - start
+
+
+@benchmark
+def validate(case, options):
+    """RecordValidator checking batches of raw records"""
+    batches = case.raw_batches()
+    validator = RecordValidator(case.fastq_a)
+    start = time.perf_counter()
+    for batch in batches:
+        validator.add(batch)
+    seconds = time.perf_counter() - start
+    validator.check()
+    return case.records, case.size, seconds
+
+
+@benchmark
+def main_single(case, options):
+    """End to end main_handler on a single fastq"""
+    args = argparse.Namespace(
+        fastq_a=case.fastq_a,
+        fastq_b=None,
+        output_prefix=case.output_prefix("single"),
+        threads=options.threads,
+        processes=options.processes,
+    )
+    main_handler(args)
+    return case.records, case.size
+
+
+@benchmark
+def main_validate(case, options):
+    """End to end main_handler on a single fastq with --validate"""
+    args = argparse.Namespace(
+        fastq_a=case.fastq_a,
+        fastq_b=None,
+        output_prefix=case.output_prefix("validate"),
+        threads=options.threads,
+        processes=options.processes,
+        validate=True,
+    )
+    main_handler(args)
+    return case.records, case.size
+
+
+@benchmark
+def main_paired(case, options):
+    """End to end main_handler on paired fastqs"""
+    args = argparse.Namespace(
+        fastq_a=case.fastq_a,
+        fastq_b=case.fastq_b,
+        output_prefix=case.output_prefix("paired"),
+        threads=options.threads,
+        processes=options.processes,
+    )
+    main_handler(args)
+    return 2 * case.records, 2 * case.size
+
+
+def run_benchmark(func, case, options):
+    """Run a benchmark `options.repeat` times and keep the fastest run"""
+    best = None
+    for _ in range(options.repeat):
+        start = time.perf_counter()
+        result = func(case, options)
+        seconds = time.perf_counter() - start
+        if len(result) == 3:
+            records, size, seconds = result
+        else:
+            records, size = result
+        best = seconds if best is None else min(best, seconds)
+    return {
+        "name": func.__name__,
+        "case": case.label,
+        "description": func.__doc__,
+        "seconds": round(best, 6),
+        "records": records,
+        "bytes": size,
+        "records_per_sec": round(records / best, 1) if best else None,
+        "mb_per_sec": round(size / best / 1e6, 3) if best else None,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="gdc-fastq-splitter benchmarks")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--read-length", type=int, default=150)
+    parser.add_argument("--flowcells", type=int, default=1)
+    parser.add_argument("--lanes", type=int, default=4)
+    parser.add_argument("--barcodes", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--seqid-format", choices=SEQID_FORMATS, action="append", default=None
+    )
+    parser.add_argument(
+        "--compression", choices=("plain", "gzip"), action="append", default=None
+    )
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--only", action="append", help="Only run benchmarks with these names"
+    )
+    parser.add_argument("--workdir", help="Directory for the generated files")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    options = parser.parse_args(args=args)
+
+    get_logger("benchmarks").info("Running benchmarks")
+    workdir = options.workdir or tempfile.mkdtemp(prefix="gdc-fastq-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for seqid_format in options.seqid_format or SEQID_FORMATS:
+            synthetic = SyntheticFastq(
+                records=options.records,
+                seqid_format=seqid_format,
+                flowcells=options.flowcells,
+                lanes=options.lanes,
+                barcodes=options.barcodes,
+                read_length=options.read_length,
+                seed=options.seed,
+            )
+            for compression in options.compression or ("plain", "gzip"):
+                case = Case(workdir, synthetic, compression == "gzip")
+                for func in BENCHMARKS:
+                    if options.only and func.__name__ not in options.only:
+                        continue
+                    results.append(run_benchmark(func, case, options))
+    finally:
+        if not options.workdir:
+            shutil.rmtree(workdir)
+
+    report = {
+        "version": VERSION,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": {
+            k: v for k, v in vars(options).items() if k not in ("output", "workdir")
+        },
+        "results": results,
+    }
+    if options.output:
+        with open(options.output, "wt") as o:
+            json.dump(report, o, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Deterministic synthetic fastq generator for the benchmarks"""
+import gzip
+import random
+
+SEQID_FORMATS = ("barcode", "nobarcode")
+
+
+class SyntheticFastq:
+    """Generates fastq records spread over flowcells, lanes and barcodes.
+    Records come in contiguous runs of one read group, the way they do in
+    real Illumina fastqs. The same options and seed always give the same
+    bytes."""
+
+    def __init__(
+        self,
+        records=100000,
+        seqid_format="barcode",
+        flowcells=1,
+        lanes=4,
+        barcodes=8,
+        read_length=150,
+        run_length=5000,
+        seed=0,
+    ):
+        """
+        Constructor.
+
+        :param records: the number of records in each fastq
+        :param seqid_format: 'barcode' for the modern Casava format or
+        'nobarcode' for the `/1` format
+        :param flowcells: the number of flowcells
+        :param lanes: the number of lanes per flowcell
+        :param barcodes: the number of distinct barcodes
+        :param read_length: the length of every read
+        :param run_length: the number of contiguous records of one read group
+        :param seed: the random seed
+        """
+        if seqid_format not in SEQID_FORMATS:
+            raise ValueError("Unknown seqid format {0}".format(seqid_format))
+        self.records = records
+        self.seqid_format = seqid_format
+        self.flowcells = flowcells
+        self.lanes = lanes
+        self.barcodes = barcodes
+        self.read_length = read_length
+        self.run_length = run_length
+        self.seed = seed
+
+    @property
+    def read_groups(self):
+        return [
+            ("HFC{0:04d}XX".format(flowcell), lane)
+            for flowcell in range(self.flowcells)
+            for lane in range(1, self.lanes + 1)
+        ]
+
+    def _barcode(self, rng):
+        return "+".join("".join(rng.choice("ACGT") for _ in range(8)) for _ in range(2))
+
+    def iter_chunks(self, read_pair="1", chunk_records=10000):
+        """Generator of chunks of fastq bytes for one mate"""
+        rng = random.Random(self.seed)
+        groups = self.read_groups
+        barcodes = [self._barcode(rng) for _ in range(self.barcodes)]
+        # A pool of reads is reused so generating is cheap compared to parsing
+        sequences = [
+            "".join(rng.choice("ACGTN") for _ in range(self.read_length))
+            for _ in range(64)
+        ]
+        qualities = [
+            "".join(rng.choice("#,:FF") for _ in range(self.read_length))
+            for _ in range(64)
+        ]
+
+        lines = []
+        for i in range(self.records):
+            flowcell, lane = groups[(i // self.run_length) % len(groups)]
+            prefix = "@A00123:8:{0}:{1}:{2}:{3}:{4}".format(
+                flowcell, lane, 1101 + i % 50, i % 32000, i // 32000
+            )
+            if self.seqid_format == "barcode":
+                seqid = "{0} {1}:N:0:{2}".format(
+                    prefix, read_pair, barcodes[rng.randrange(self.barcodes)]
+                )
+            else:
+                seqid = "{0}/{1}".format(prefix, read_pair)
+            lines.append(
+                "{0}\n{1}\n+\n{2}\n".format(
+                    seqid, sequences[i % 64], qualities[(i * 7) % 64]
+                )
+            )
+            if len(lines) == chunk_records:
+                yield "".join(lines).encode("utf-8")
+                lines = []
+        if lines:
+            yield "".join(lines).encode("utf-8")
+
+    def write(self, fname, read_pair="1", compresslevel=1):
+        """
+        Write one mate to a file, gzip compressed if the name ends in .gz.
+
+        :return: the number of uncompressed bytes written
+        """
+        size = 0
+        if fname.endswith(".gz"):
+            fh = gzip.open(fname, "wb", compresslevel=compresslevel)
+        else:
+            fh = open(fname, "wb")
+        with fh:
+            for chunk in self.iter_chunks(read_pair=read_pair):
+                fh.write(chunk)
+                size += len(chunk)
+        return size
@@ -6,12 +6,42 @@ from signal import signal, SIGPIPE, SIG_DFL
 from gdc_fastq_splitter import VERSION
 from gdc_fastq_splitter.utils import get_logger
 from gdc_fastq_splitter.handler import main_handler
+from gdc_fastq_splitter.fastq.compression import CODECS, DEFAULT_CODEC, get_codec
+from gdc_fastq_splitter.fastq.qc import qc_available
+from gdc_fastq_splitter.progress import PROGRESS_INTERVAL
+from gdc_fastq_splitter.fastq.writer import CHECKSUMS, DEFAULT_CHECKSUMS
 
-signal(SIGPIPE, SIG_DFL)
+
+def parse_checksums(value):
+    """Parse the comma separated list of the --checksums option"""
+    if value == "none":
+        return ()
+    checksums = tuple(value.split(","))
+    for checksum in checksums:
+        if checksum not in CHECKSUMS:
+            raise argparse.ArgumentTypeError("Unknown checksum {0}".format(checksum))
+    return checksums
+
+
+def parse_memory(value):
+    """Parse a size in bytes of the --max-memory option, with an optional K, M
+    or G binary suffix"""
+    units = {"K": 2**10, "M": 2**20, "G": 2**30}
+    scale = units.get(value[-1:].upper(), 1)
+    try:
+        size = int(float(value[:-1] if scale > 1 else value) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid memory size {0}".format(value))
+    if size <= 0:
+        raise argparse.ArgumentTypeError("Invalid memory size {0}".format(value))
+    return size
 
 
 def main(args=None):
     """The main method for gdc-fastq-splitter"""
+    # Set here rather than on import, so worker processes that import this
+    # module keep the SIGPIPE action of the handler (see `pipe_errors`)
+    signal(SIGPIPE, SIG_DFL)
     start = time.time()
     logger = get_logger("gdc-fastq-splitter")
 
@@ -21,16 +51,279 @@ def main(args=None):
     parser.add_argument(
         "-o",
         "--output-prefix",
-        required=True,
         type=str,
-        help="The output prefix to use for output files.",
+        help="The output prefix to use for output files. Required unless "
+        "--manifest is used.",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Split a batch of fastqs listed in a TSV (or a .json list of "
+        "objects) with fastq_a, fastq_b (empty for single fastqs) and "
+        "output_prefix columns, instead of the fastq arguments. All of the "
+        "fastqs are split by one pool of --processes workers (one per CPU by "
+        "default), largest first, and a combined summary is written to "
+        "<manifest>.summary.json.",
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of threads used to decompress and compress each fastq. "
+        "When greater than 1, the input is decompressed in background threads "
+        "(BGZF inputs in parallel), outputs are gzip compressed in independent "
+        "blocks in parallel, and each output is written in its own thread. [1]",
+    )
+
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of processes used to split each fastq. When greater "
+        "than 1, uncompressed and BGZF fastqs are split into byte ranges "
+        "that are processed in parallel. [1]",
+    )
+
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Fully parse and validate the sequence identifier of every "
+        "record instead of caching read keys by their "
+        "instrument:run:flowcell:lane prefix.",
+    )
+
+    parser.add_argument(
+        "--metrics-json",
+        action="store_true",
+        help="Write the wall and CPU time spent per stage, the bytes in and out "
+        "and the records per read key of each fastq to "
+        "<output_prefix><fastq basename>.metrics.json.",
     )
 
-    parser.add_argument("fastq_a", help="Fastq file to process")
     parser.add_argument(
-        "fastq_b", nargs="?", help="If paired, the mate fastq file to process"
+        "--profile",
+        action="store_true",
+        help="Profile the processing of each fastq with cProfile and dump the "
+        "stats to <output_prefix><fastq basename>.pstats. The range workers "
+        "of --processes are not included.",
+    )
+
+    parser.add_argument(
+        "--max-barcodes",
+        type=int,
+        default=None,
+        help="Approximate the barcode frequencies of each report, keeping the "
+        "counts of at most this many barcodes with the Space-Saving algorithm. "
+        "Counts are upper bounds and the error bounds are added to the report. "
+        "By default every barcode is counted exactly.",
+    )
+
+    parser.add_argument(
+        "--max-open-files",
+        type=int,
+        default=None,
+        help="Maximum number of output fastqs kept open per input fastq (per "
+        "range with --processes). The least recently used outputs are closed, "
+        "ending their gzip member, and reopened in append mode when needed. "
+        "By default every output stays open.",
+    )
+
+    parser.add_argument(
+        "--scan-only",
+        action="store_true",
+        help="Only write the report of each read group and a summary of the "
+        "fastq to <output_prefix><fastq basename>.summary.json, from the "
+        "sequence identifiers alone. No fastqs are written.",
+    )
+
+    parser.add_argument(
+        "--write-run-index",
+        action="store_true",
+        help="Write the runs of consecutive records with the same read key, "
+        "with their offsets and lengths in bytes and records of the "
+        "uncompressed fastq, to <output_prefix><fastq basename>.runs.tsv.",
+    )
+
+    parser.add_argument(
+        "--from-run-index",
+        action="store_true",
+        help="Split each fastq by copying the runs of its "
+        "<output_prefix><fastq basename>.runs.tsv, written by an earlier "
+        "--write-run-index split of the same unchanged file, instead of "
+        "parsing its records. The fastqs must be regular files; they are split "
+        "serially.",
+    )
+
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=None,
+        help="Save a checkpoint of the progress every this many records to "
+        "<output_prefix><fastq basename>.checkpoint.json. Checkpointed fastqs "
+        "are processed serially. [10000000 with --resume]",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume each fastq from its last checkpoint, if there is one, "
+        "and keep saving checkpoints.",
+    )
+
+    parser.add_argument(
+        "--checksums",
+        type=parse_checksums,
+        default=DEFAULT_CHECKSUMS,
+        help="Comma separated checksums of each compressed output fastq to "
+        "compute while it is written and add to its report: any of {0}, or "
+        "'none'. [md5]".format(", ".join(CHECKSUMS)),
+    )
+
+    parser.add_argument(
+        "--qc",
+        action="store_true",
+        help="Add the read length distribution, mean and per-position "
+        "quality and GC content of each read group to its report. Requires "
+        "numpy.",
+    )
+
+    parser.add_argument(
+        "--codec",
+        choices=list(CODECS),
+        default=DEFAULT_CODEC,
+        help="How to compress the output fastqs: gzip with zlib, fast (gzip "
+        "level 1, for scratch outputs), none (uncompressed .fq), or by piping "
+        "them through the pigz, gzip (gzip-exe) or zstd (.fq.zst) program on "
+        "the PATH. [gzip]",
+    )
+
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        default=None,
+        help="The compression level of the codec. [6 for gzip, pigz and "
+        "gzip-exe, 1 for fast, 3 for zstd]",
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        type=parse_memory,
+        default=None,
+        help="Memory budget of the records buffered before they are "
+        "compressed, e.g. 512M or 2G, shared by all of the outputs (and by the "
+        "processes of --processes, paired fastqs and --manifest). Each output "
+        "gets a share of it that follows its share of the records, and hands "
+        "its buffer to the compressor in one large write when it is full; over "
+        "the budget, the largest buffers are flushed first. The records queued "
+        "for the writer threads of --threads are included; the input blocks "
+        "read ahead and the compressors are not. By default, records are "
+        "compressed as they are written.",
+    )
+
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=PROGRESS_INTERVAL,
+        help="Log the progress of each fastq every this many seconds: the "
+        "records and uncompressed and compressed input bytes per second, and "
+        "the percent done and ETA for fastqs that are regular files. 0 logs "
+        "the record count every 1000000 records instead. [60]",
+    )
+
+    parser.add_argument(
+        "--heartbeat",
+        action="store_true",
+        help="Also write the progress of each fastq to "
+        "<output_prefix><fastq basename>.progress.json at every interval, with "
+        "a status of running, done or failed.",
+    )
+
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Check every record while splitting: the @ and + lines, the "
+        "sequence and quality lengths and their characters. The split fails "
+        "after writing the outputs, listing the numbers of the invalid records.",
+    )
+
+    parser.add_argument(
+        "--lockstep",
+        action="store_true",
+        help="Split paired fastqs in one process, reading both in lockstep "
+        "batches and checking that the read names of the mates match record "
+        "by record. A mismatch stops the split at the first one. Each mate is "
+        "compressed in its own thread.",
+    )
+
+    parser.add_argument(
+        "--interleaved",
+        action="store_true",
+        help="The fastq is interleaved, with each first mate followed by its "
+        "second mate. Both mates are split into their R1 and R2 outputs in a "
+        "single pass, checking that the mates alternate and match record by "
+        "record like --lockstep.",
+    )
+
+    parser.add_argument(
+        "fastq_a",
+        nargs="?",
+        help="Fastq file to process, gzip compressed or not. It can be a named "
+        "pipe, or - to read it from stdin.",
+    )
+    parser.add_argument(
+        "fastq_b",
+        nargs="?",
+        help="If paired, the mate fastq file to process, which can also be a "
+        "named pipe or -",
     )
     options = parser.parse_args(args=args)
+    if options.manifest and options.fastq_a:
+        parser.error("--manifest can not be used with fastq arguments")
+    if not options.manifest:
+        if not options.output_prefix:
+            parser.error("the following arguments are required: -o/--output-prefix")
+        if not options.fastq_a:
+            parser.error("the following arguments are required: fastq_a")
+    if options.qc and not qc_available():
+        parser.error("--qc requires numpy")
+    if options.lockstep and not options.fastq_b:
+        parser.error("--lockstep requires a pair of fastq arguments")
+    if options.interleaved:
+        if options.fastq_b or options.manifest:
+            parser.error("--interleaved requires a single fastq argument")
+        if options.write_run_index:
+            parser.error("--interleaved can not be used with --write-run-index")
+    if options.from_run_index:
+        for name in (
+            "write_run_index",
+            "validate",
+            "lockstep",
+            "interleaved",
+            "checkpoint_interval",
+            "resume",
+        ):
+            if getattr(options, name):
+                parser.error(
+                    "--from-run-index can not be used with --{0}".format(
+                        name.replace("_", "-")
+                    )
+                )
+    for name in ("lockstep", "interleaved"):
+        if not getattr(options, name):
+            continue
+        if options.processes > 1 or options.profile:
+            parser.error(
+                "--{0} can not be used with --processes or --profile".format(name)
+            )
+        if options.checkpoint_interval or options.resume:
+            parser.error("--{0} can not be used with checkpoints".format(name))
+    try:
+        get_codec(options.codec, level=options.compression_level)
+    except ValueError as e:
+        parser.error(str(e))
     main_handler(options)
     logger.info("Finished. Took {0:.2f} seconds".format(time.time() - start))
 
@@ -0,0 +1,243 @@
+"""Module containing the Python API to split fastq files from other programs.
+A `FastqSplitter` yields the runs of records of each read group as they are
+read, writes them with the writers of `handler.split_batches`, which can be
+created by a sink, and keeps the report of each read group up to date as it
+goes:
+
+    splitter = FastqSplitter("input.fq.gz", sink=MemorySink())
+    for read_key, batch in splitter:
+        print(read_key, len(batch), splitter.reports[read_key].record_counts)
+"""
+import collections
+import io
+import logging
+import os
+
+from gdc_fastq_splitter.fastq.compression import open_fastq, peek_line
+from gdc_fastq_splitter.fastq.illumina import ReadKeyResolver, get_fastq_type
+from gdc_fastq_splitter.fastq.reader import FastqBlockReader
+from gdc_fastq_splitter.fastq.writer import ReportWriter, create_report
+from gdc_fastq_splitter.handler import BatchSplitter, open_writer
+from gdc_fastq_splitter.options import SplitOptions
+
+
+class SinkWriter(ReportWriter):
+    """Writer class that updates the report of a read group and hands the raw
+    bytes of its records to a sink"""
+
+    def __init__(self, sink, read_key, reporter, metrics=None, **kwargs):
+        """
+        Constructor.
+
+        :param sink: the `Sink` the records are written to
+        :param read_key: the read key of the read group
+        :param reporter: the report of the read group
+        :param metrics: a `StageMetrics` object to record the time spent
+        """
+        super().__init__(reporter, write_report=False, metrics=metrics)
+        self.sink = sink
+        self.read_key = read_key
+
+    def __iadd__(self, record):
+        self.write_records([record])
+        return self
+
+    def write_records(self, records, data=None):
+        if data is None:
+            data = b"".join(map(bytes, records))
+        super().write_records(records, data)
+        if self.reporter.qc is not None:
+            with self.metrics.stage("qc"):
+                self.reporter.qc.add(data)
+        with self.metrics.stage("write"):
+            self.sink.write(self.read_key, data)
+
+
+class Sink:
+    """Base sink of the records of each read group. It creates a `SinkWriter`
+    for each read group and discards the records; subclasses write or hand
+    them on."""
+
+    extension = ".fq"
+
+    def open_writer(self, record, output_prefix, options, metrics=None, **kwargs):
+        """
+        Create the writer of the read group of a record (see
+        `handler.open_writer`).
+
+        :param record: the first record of the read group
+        :param output_prefix: the prefix of the output fastq and report names
+        :param options: the `SplitOptions` of the split
+        :param metrics: a `StageMetrics` object to record the time spent
+        """
+        _, reporter = create_report(
+            record,
+            output_prefix,
+            max_barcodes=options.max_barcodes,
+            qc=options.qc,
+            extension=self.extension,
+        )
+        self.open(record.read_key, reporter)
+        return SinkWriter(self, record.read_key, reporter, metrics=metrics)
+
+    def open(self, read_key, reporter):
+        """
+        Start a read group, before its first records are written.
+
+        :param read_key: the read key of the read group
+        :param reporter: the report of the read group, which is updated with
+        the records before they are written
+        """
+
+    def write(self, read_key, data):
+        """Write the raw bytes of records of a read group"""
+
+    def close(self):
+        """Finish every read group once the fastq is done"""
+
+
+class MemorySink(Sink):
+    """Sink that keeps the raw bytes of each read group in memory"""
+
+    def __init__(self):
+        self.outputs = collections.OrderedDict()
+
+    def open(self, read_key, reporter):
+        self.outputs[read_key] = io.BytesIO()
+
+    def write(self, read_key, data):
+        self.outputs[read_key].write(data)
+
+    def getvalue(self, read_key):
+        """Get the raw bytes of the records of a read group"""
+        return self.outputs[read_key].getvalue()
+
+
+class CallbackSink(Sink):
+    """Sink that calls a function with the read key and raw bytes of the
+    records of each read group as they are written"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, read_key, data):
+        self.callback(read_key, data)
+
+
+class FileSink(Sink):
+    """Sink that writes each read group to `<output_prefix><read key>_R<pair>`
+    with the extension of the codec of the `SplitOptions`, with the writers of
+    the CLI, so the outputs are compressed and checksummed and their report
+    JSONs are written the same way."""
+
+    def __init__(self, write_reports=True):
+        """
+        Constructor.
+
+        :param write_reports: if True, the report JSONs are written when the
+        fastq is done
+        """
+        self.write_reports = write_reports
+
+    def open_writer(self, record, output_prefix, options, **kwargs):
+        if not self.write_reports:
+            kwargs["write_report"] = False
+        return open_writer(record, output_prefix, options, **kwargs)
+
+
+class FastqSplitter:
+    """Splits a fastq into its read groups as it is read. Iterating over the
+    splitter yields a tuple of the read key and the `FastqBatch` of each run
+    of records of the same read group, in the order of the fastq, after the
+    batch was added to the report of its read group and written by the sink.
+    The reports are in `reports` by read key while the fastq is split."""
+
+    def __init__(self, source, sink=None, output_prefix="", options=None, metrics=None):
+        """
+        Constructor.
+
+        :param source: the fastq file path, which is decompressed if its magic
+        bytes are those of gzip (see `open_fastq`), or a readable binary file
+        object of the uncompressed fastq
+        :param sink: the `Sink` that creates the writers of the read groups;
+        by default the records are only added to the reports
+        :param output_prefix: the prefix of the output fastq and report names
+        :param options: the `SplitOptions` of the split, e.g. the `codec`,
+        `checksums`, `max_open_files` and `qc`
+        :param metrics: a `StageMetrics` object to record the time spent
+        """
+        self.source = source
+        self.sink = Sink() if sink is None else sink
+        self.output_prefix = output_prefix
+        self.options = SplitOptions() if options is None else options
+        self.metrics = metrics
+        self.fastq_type = None
+        self.record_count = 0
+        self.reports = collections.OrderedDict()
+
+    def __iter__(self):
+        options = self.options
+        if isinstance(self.source, str):
+            fobj = open_fastq(self.source, threads=options.threads)
+            name = self.source
+        else:
+            fobj = self.source
+            name = getattr(fobj, "name", "<stream>")
+
+        try:
+            # The first line is replayed after the type is inferred from it, so
+            # the source is only read once and can be a pipe
+            line, head = peek_line(fobj)
+            if not line:
+                return
+            self.fastq_type = get_fastq_type(line.decode("utf-8"))
+            record_cls = self.fastq_type[1].raw_record_cls
+            reader = FastqBlockReader(
+                name,
+                record_cls=record_cls,
+                block_size=options.block_size,
+                metrics=self.metrics,
+                fobj=head,
+            )
+            splitter = BatchSplitter(
+                self.output_prefix,
+                os.path.basename(str(name)),
+                logging.getLogger(__name__),
+                options=options,
+                resolver=ReadKeyResolver(record_cls.seqid_cls, strict=options.strict),
+                metrics=self.metrics,
+                sink=self.sink,
+            )
+            try:
+                for batch in reader.batches():
+                    for read_key, start, end in splitter.add(batch):
+                        if read_key not in self.reports:
+                            self.reports[read_key] = splitter.writers[read_key].reporter
+                        yield (read_key, batch.slice(start, end))
+                    self.record_count = splitter.count
+            finally:
+                splitter.close()
+            splitter.log_summary()
+        finally:
+            if fobj is not self.source:
+                fobj.close()
+            self.sink.close()
+
+    def run(self):
+        """
+        Split the whole fastq.
+
+        :return: the reports by read key
+        """
+        for _ in self:
+            pass
+        return self.reports
+
+
+def split_fastq(source, sink=None, **kwargs):
+    """
+    Split a whole fastq into a sink (see `FastqSplitter`).
+
+    :return: the reports by read key
+    """
+    return FastqSplitter(source, sink=sink, **kwargs).run()
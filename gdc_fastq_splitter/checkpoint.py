@@ -0,0 +1,145 @@
+"""Module containing the checkpoints of the splitting of a fastq file, so a
+split that was interrupted can be resumed from its last checkpoint instead of
+starting over.
+"""
+import json
+import os
+
+from gdc_fastq_splitter.pipeline import ThreadedWriter
+from gdc_fastq_splitter.fastq.report import report_from_state
+from gdc_fastq_splitter.fastq.runs import RunIndex
+
+CHECKPOINT_VERSION = 2
+CHECKPOINT_INTERVAL = 10000000
+
+
+class Checkpoint:
+    """Saves the progress of the splitting of one fastq file every `interval`
+    records: the offset in the uncompressed input, the record count, the size
+    of each output and the state of each report. Every output is suspended
+    first, so each one ends on a complete gzip member and is appended to with
+    a new member afterwards."""
+
+    def __init__(self, fname, input_file, interval=CHECKPOINT_INTERVAL):
+        """
+        Constructor.
+
+        :param fname: the checkpoint JSON file path
+        :param input_file: the fastq file being split
+        :param interval: the number of records between checkpoints
+        """
+        self.fname = fname
+        self.input_file = input_file
+        self.interval = interval
+        self.state = None
+
+    @property
+    def offset(self):
+        return self.state["offset"] if self.state else 0
+
+    @property
+    def record_count(self):
+        return self.state["record_count"] if self.state else 0
+
+    def load(self):
+        """
+        Load the last checkpoint, if there is one, and truncate the outputs
+        to their size at that checkpoint.
+
+        :return: True if a checkpoint was loaded
+        """
+        if not os.path.exists(self.fname):
+            return False
+        with open(self.fname, "rt") as fh:
+            state = json.load(fh)
+
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint {0}".format(self.fname))
+        # A fastq rewritten at the same size has another modification time
+        stat = os.stat(self.input_file)
+        if (state["fastq_size"], state["fastq_mtime_ns"]) != (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            raise ValueError(
+                "Checkpoint {0} was saved for a different fastq {1}".format(
+                    self.fname, state["fastq_filename"]
+                )
+            )
+        for output in state["outputs"].values():
+            if output["fname"] is not None:
+                with open(output["fname"], "r+b") as fh:
+                    fh.truncate(output["size"])
+        self.state = state
+        return True
+
+    def reports(self):
+        """Restore the reports of the last checkpoint by read key"""
+        if not self.state:
+            return {}
+        return {
+            key: report_from_state(output["report"])
+            for key, output in self.state["outputs"].items()
+        }
+
+    def run_index(self):
+        """Restore the `RunIndex` of the last checkpoint"""
+        index = RunIndex()
+        if self.state:
+            for key, _, byte_length, _, record_count in self.state["runs"]:
+                index.add(key, byte_length, record_count)
+        return index
+
+    def save(self, writers, offset, count, run_index=None):
+        """
+        Suspend the writers and save a checkpoint.
+
+        :param writers: the writers by read key
+        :param offset: the offset of the next record in the uncompressed input
+        :param count: the number of records written
+        :param run_index: the `RunIndex` of the records written, if any
+        """
+        for writer in writers.values():
+            writer.suspend()
+        for writer in writers.values():
+            if isinstance(writer, ThreadedWriter):
+                writer.wait()
+
+        sizes = {}
+        for key, writer in writers.items():
+            if writer.fname is not None:
+                # The outputs must be on disk before the checkpoint is saved
+                with open(writer.fname, "rb") as fh:
+                    os.fsync(fh.fileno())
+                sizes[key] = os.path.getsize(writer.fname)
+
+        stat = os.stat(self.input_file)
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "fastq_filename": os.path.basename(self.input_file),
+            "fastq_size": stat.st_size,
+            "fastq_mtime_ns": stat.st_mtime_ns,
+            "offset": offset,
+            "record_count": count,
+            "outputs": {
+                key: {
+                    "fname": writer.fname,
+                    "size": sizes.get(key),
+                    "report": writer.reporter.get_state(),
+                }
+                for key, writer in writers.items()
+            },
+            "runs": [] if run_index is None else run_index.runs,
+        }
+        tmp = self.fname + ".tmp"
+        with open(tmp, "wt") as o:
+            json.dump(state, o, sort_keys=True)
+            o.flush()
+            os.fsync(o.fileno())
+        os.replace(tmp, self.fname)
+        self.state = state
+
+    def remove(self):
+        """Remove the checkpoint once the fastq is done"""
+        if os.path.exists(self.fname):
+            os.remove(self.fname)
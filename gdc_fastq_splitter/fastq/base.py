@@ -21,10 +21,42 @@ class SequenceIdentifier(metaclass=ABCMeta):
         return self.seqid
 
 
+class RawFastqRecord:
+    """The base class for a Fastq record that keeps the raw bytes of the
+    4-line block. Only the sequence identifier line is ever inspected, and
+    the block is written out untouched.
+    """
+
+    __slots__ = ("raw", "header")
+    seqid_cls = SequenceIdentifier
+
+    def __init__(self, raw, header):
+        """
+        Constructor.
+
+        :param raw: the raw bytes of the record, including the line endings
+        :param header: the raw bytes of the sequence identifier line without
+        the line ending
+        """
+        self.raw = raw
+        self.header = header
+
+    @property
+    def seqid(self):
+        return self.seqid_cls.from_string(self.header.decode("utf-8"))
+
+    def __str__(self):
+        return self.raw.decode("utf-8")
+
+    def __bytes__(self):
+        return self.raw
+
+
 class FastqRecord:
     """The base class for a Fastq record"""
 
     seqid_cls = SequenceIdentifier
+    raw_record_cls = RawFastqRecord
 
     def __init__(self, seqid, sequence, qid, qual):
         self.seqid = self.seqid_cls.from_string(seqid)
@@ -0,0 +1,798 @@
+"""Module containing file objects for compressing and decompressing fastq files"""
+import collections
+import contextlib
+import gzip
+import io
+import os
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import zlib
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from gdc_fastq_splitter.pipeline import BackgroundIterator, QUEUE_SIZE
+
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+GZIP_MAGIC = b"\x1f\x8b"
+STDIN = "-"
+DICTIONARY_SIZE = 32 * 1024
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+BGZF_SUBFIELD = b"BC\x02\x00"
+
+
+def parse_bgzf_header(header):
+    """
+    Get the total size of a BGZF block from its first 18 bytes.
+
+    :param header: the first bytes of the block
+    :return: the size of the block in bytes or None if this is not a BGZF block
+    """
+    if len(header) < 18 or header[:4] != BGZF_MAGIC:
+        return None
+    if header[12:16] != BGZF_SUBFIELD:
+        return None
+    return struct.unpack("<H", header[16:18])[0] + 1
+
+
+def is_bgzf(fname):
+    """Check whether a file is BGZF compressed (blocked gzip)"""
+    with open(fname, "rb") as fh:
+        return parse_bgzf_header(fh.read(18)) is not None
+
+
+def is_gzip(fname):
+    """Check whether a file is gzip compressed from its magic bytes"""
+    with open(fname, "rb") as fh:
+        return fh.read(2) == GZIP_MAGIC
+
+
+def is_seekable_file(fname):
+    """Check whether an input is a regular file that can be read more than
+    once, unlike stdin or a named pipe"""
+    return fname != STDIN and os.path.isfile(fname)
+
+
+def read_bgzf_block(fh):
+    """
+    Read the next BGZF block from a binary file object.
+
+    :return: the compressed bytes of the block or b"" at the end of the file
+    """
+    header = fh.read(18)
+    if not header:
+        return b""
+    size = parse_bgzf_header(header)
+    if size is None:
+        raise ValueError("Invalid BGZF block at offset {0}".format(fh.tell() - 18))
+    block = header + fh.read(size - 18)
+    if len(block) != size:
+        raise ValueError("Truncated BGZF block at offset {0}".format(fh.tell()))
+    return block
+
+
+def inflate_bgzf_block(block):
+    """Decompress a single BGZF block"""
+    return zlib.decompress(block, 16 + zlib.MAX_WBITS)
+
+
+def inflate_bgzf_blocks(blocks):
+    """Decompress a list of BGZF blocks into one chunk of bytes"""
+    return b"".join([inflate_bgzf_block(block) for block in blocks])
+
+
+def find_bgzf_block(fh, offset, window=256 * 1024):
+    """
+    Find the offset of the first BGZF block that starts at or after `offset`.
+    A candidate is only accepted when the block after it also starts with a
+    valid BGZF header or the file ends.
+
+    :param fh: a seekable binary file object
+    :param offset: the offset to start searching from
+    :return: the offset of the block or None if there are no more blocks
+    """
+    while True:
+        fh.seek(offset)
+        data = fh.read(window + 18)
+        if len(data) < 18:
+            return None
+        pos = data.find(BGZF_MAGIC)
+        while pos != -1 and pos <= window:
+            size = parse_bgzf_header(data[pos : pos + 18])
+            if size is not None:
+                fh.seek(offset + pos + size)
+                following = fh.read(18)
+                if not following or parse_bgzf_header(following) is not None:
+                    return offset + pos
+            pos = data.find(BGZF_MAGIC, pos + 1)
+        offset += window
+
+
+def deflate_block(data, compresslevel, dictionary=b"", last=False):
+    """
+    Compress one block into raw deflate data that can be concatenated with the
+    blocks before and after it. This is run in the worker threads; zlib
+    releases the GIL while it compresses.
+
+    :param data: the uncompressed bytes of the block
+    :param compresslevel: the zlib compression level
+    :param dictionary: the end of the previous block used to prime the compressor
+    :param last: if True, this is the final block of the stream
+    :return: the compressed bytes of the block
+    """
+    if dictionary:
+        compressor = zlib.compressobj(
+            compresslevel,
+            zlib.DEFLATED,
+            -zlib.MAX_WBITS,
+            zlib.DEF_MEM_LEVEL,
+            zlib.Z_DEFAULT_STRATEGY,
+            dictionary,
+        )
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Writable gzip file that compresses independent blocks on a pool of
+    threads the same way pigz does. Each block is primed with the last 32 KiB
+    of the block before it and ends on a byte boundary, so the compressed
+    blocks are joined in order into a single standard gzip member.
+    """
+
+    def __init__(
+        self,
+        fname=None,
+        mode="wb",
+        compresslevel=6,
+        threads=2,
+        executor=None,
+        fileobj=None,
+        block_size=1024 * 1024,
+    ):
+        """
+        Constructor.
+
+        :param fname: the output file path, only used when `fileobj` is None
+        :param mode: 'wb' to create a new file or 'ab' to append a new member
+        :param compresslevel: the zlib compression level
+        :param threads: the number of compression threads
+        :param executor: a shared executor to use instead of creating one
+        :param fileobj: a binary file object to write to instead of `fname`
+        :param block_size: the number of uncompressed bytes in each block
+        """
+        super().__init__()
+        if mode not in ("wb", "ab"):
+            raise ValueError("Invalid mode {0}".format(mode))
+
+        self.fname = fname
+        self.compresslevel = compresslevel
+        self.block_size = block_size
+        self._own_fileobj = fileobj is None
+        self.fileobj = open(fname, mode) if fileobj is None else fileobj
+        self._own_executor = executor is None
+        self._executor = ThreadPoolExecutor(threads) if executor is None else executor
+        self._max_pending = 2 * max(threads, 1)
+        self._pending = collections.deque()
+        self._chunks = []
+        self._buffered = 0
+        self._dictionary = b""
+        self._crc = 0
+        self._size = 0
+        self.fileobj.write(GZIP_HEADER)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            self._submit(b"".join(self._chunks))
+            self._chunks = []
+            self._buffered = 0
+        return len(data)
+
+    def _submit(self, data, last=False):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._pending.append(
+            self._executor.submit(
+                deflate_block, data, self.compresslevel, self._dictionary, last
+            )
+        )
+        self._dictionary = data[-DICTIONARY_SIZE:]
+        while len(self._pending) > self._max_pending:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._submit(b"".join(self._chunks), last=True)
+            self._chunks = []
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+            self.fileobj.write(struct.pack("<II", self._crc, self._size & 0xFFFFFFFF))
+            self.fileobj.flush()
+        finally:
+            if self._own_fileobj:
+                self.fileobj.close()
+            if self._own_executor:
+                self._executor.shutdown()
+            super().close()
+
+
+class ProcessWriter(io.RawIOBase):
+    """Writable file object that compresses by piping the bytes written
+    through an external program, e.g. pigz or zstd. The program writes the
+    compressed stream to its stdout, which is copied to a binary file object
+    in a background thread, so the output can still be checksummed and
+    counted as it is written. If the program exits early, writing to it
+    raises an error with its exit status and stderr (see `pipe_errors`)."""
+
+    def __init__(self, args, fileobj, block_size=1024 * 1024):
+        """
+        Constructor.
+
+        :param args: the command line of the program, which must compress its
+        stdin to its stdout
+        :param fileobj: the binary file object to write the compressed bytes to
+        :param block_size: the number of compressed bytes copied at a time
+        """
+        super().__init__()
+        self.args = args
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self._error = None
+        # A file does not fill up like a pipe that is only read on errors
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._stderr
+        )
+        self._thread = threading.Thread(
+            target=self._copy, name="compress-" + args[0], daemon=True
+        )
+        self._thread.start()
+
+    def _copy(self):
+        read = self.process.stdout.read
+        try:
+            for chunk in iter(lambda: read(self.block_size), b""):
+                self.fileobj.write(chunk)
+        except BaseException as e:
+            self._error = e
+            # Keep draining so the program does not block on a full pipe
+            while read(self.block_size):
+                pass
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            self._raise_exited()
+        return len(data)
+
+    def _raise_exited(self):
+        """Raise an error with the exit status and stderr of the program once
+        it has exited"""
+        returncode = self.process.wait()
+        self._stderr.seek(0)
+        stderr = self._stderr.read().decode("utf-8", "replace").strip()
+        message = "{0} exited with status {1}".format(" ".join(self.args), returncode)
+        if stderr:
+            message += ": {0}".format(stderr)
+        raise IOError(message)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                # The program exited early, which its exit status tells
+                pass
+            self._thread.join()
+            returncode = self.process.wait()
+            self.process.stdout.close()
+            if self._error is not None:
+                raise self._error
+            if returncode:
+                self._raise_exited()
+            self.fileobj.flush()
+        finally:
+            self._stderr.close()
+            super().close()
+
+
+class Codec:
+    """Output codec that writes fastqs uncompressed. Codecs wrap the binary
+    file object of an output with a writable file object that compresses the
+    bytes written to it; closing that file object ends the compressed stream
+    without closing the output, and reopening the output in append mode
+    starts a new stream that is concatenated to the one before it."""
+
+    name = "none"
+    extension = ".fq"
+    default_level = None
+    levels = ()
+
+    def __init__(self, level=None):
+        """
+        Constructor.
+
+        :param level: the compression level, or None for the codec default
+        """
+        if level is not None and level not in self.levels:
+            raise ValueError(
+                "Invalid compression level {0} for codec {1}".format(level, self.name)
+            )
+        self.level = self.default_level if level is None else level
+
+    def __repr__(self):
+        return "{0}(level={1})".format(self.__class__.__name__, self.level)
+
+    def open(self, fileobj, fname, mode="wb", threads=1, executor=None):
+        """
+        Wrap an output opened in `mode`.
+
+        :param fileobj: the binary file object of the output
+        :param fname: the output file path
+        :param mode: 'wb' for a new output or 'ab' to append to one
+        :param threads: the number of threads to compress with
+        :param executor: a shared executor for the compression threads
+        :return: a writable binary file object
+        """
+        return fileobj
+
+
+class GzipCodec(Codec):
+    """Output codec that gzip compresses with zlib, in parallel blocks (see
+    `ParallelGzipWriter`) when there is more than one thread."""
+
+    name = "gzip"
+    extension = ".fq.gz"
+    default_level = 6
+    levels = range(10)
+
+    def open(self, fileobj, fname, mode="wb", threads=1, executor=None):
+        if threads > 1:
+            return ParallelGzipWriter(
+                fname,
+                mode=mode,
+                compresslevel=self.level,
+                threads=threads,
+                executor=executor,
+                fileobj=fileobj,
+            )
+        return gzip.GzipFile(
+            filename=fname,
+            mode=mode,
+            compresslevel=self.level,
+            fileobj=fileobj,
+            mtime=0,
+        )
+
+
+class FastGzipCodec(GzipCodec):
+    """Gzip codec that defaults to level 1, for scratch outputs that are
+    read once right away"""
+
+    name = "fast"
+    default_level = 1
+
+
+class ProcessCodec(Codec, metaclass=ABCMeta):
+    """Output codec that compresses with an external program on the PATH
+    (see `ProcessWriter`)"""
+
+    program = None
+
+    def __init__(self, level=None):
+        super().__init__(level=level)
+        if not self.available():
+            raise ValueError(
+                "Codec {0} requires {1} on the PATH".format(self.name, self.program)
+            )
+
+    @classmethod
+    def available(cls):
+        """Check whether the program of the codec is on the PATH"""
+        return shutil.which(cls.program) is not None
+
+    @abstractmethod
+    def command(self, threads):
+        """Get the command line that compresses stdin to stdout"""
+
+    def open(self, fileobj, fname, mode="wb", threads=1, executor=None):
+        return ProcessWriter(self.command(threads), fileobj)
+
+
+class PigzCodec(ProcessCodec):
+    """Gzip codec that compresses with pigz"""
+
+    name = "pigz"
+    program = "pigz"
+    extension = ".fq.gz"
+    default_level = 6
+    levels = range(10)
+
+    def command(self, threads):
+        return [
+            self.program,
+            "-c",
+            "-n",
+            "-{0}".format(self.level),
+            "-p",
+            str(max(threads, 1)),
+        ]
+
+
+class GzipProcessCodec(ProcessCodec):
+    """Gzip codec that compresses with the gzip program"""
+
+    name = "gzip-exe"
+    program = "gzip"
+    extension = ".fq.gz"
+    default_level = 6
+    levels = range(1, 10)
+
+    def command(self, threads):
+        return [self.program, "-c", "-n", "-{0}".format(self.level)]
+
+
+class ZstdCodec(ProcessCodec):
+    """Zstandard codec that compresses with the zstd program"""
+
+    name = "zstd"
+    program = "zstd"
+    extension = ".fq.zst"
+    default_level = 3
+    levels = range(1, 23)
+
+    def command(self, threads):
+        args = [self.program, "-c", "-q", "-{0}".format(self.level)]
+        if self.level > 19:
+            args.append("--ultra")
+        if threads > 1:
+            args.append("-T{0}".format(threads))
+        return args
+
+
+@contextlib.contextmanager
+def pipe_errors(codec):
+    """
+    Context manager that makes the writes to the program of a `ProcessCodec`
+    raise `BrokenPipeError` if it exits early, so `ProcessWriter` can report
+    it, instead of this process being killed by SIGPIPE without a message.
+    This is only needed when SIGPIPE has its default action, e.g. the CLI
+    sets it so that piping its logs to `head` exits quietly. The action can
+    only be changed in the main thread, and forked worker processes inherit
+    it.
+
+    :param codec: the `Codec` of the outputs
+    """
+    if (
+        not isinstance(codec, ProcessCodec)
+        or threading.current_thread() is not threading.main_thread()
+        or signal.getsignal(signal.SIGPIPE) != signal.SIG_DFL
+    ):
+        yield
+        return
+    signal.signal(signal.SIGPIPE, signal.SIG_IGN)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+CODECS = collections.OrderedDict(
+    (codec.name, codec)
+    for codec in (
+        GzipCodec,
+        FastGzipCodec,
+        Codec,
+        PigzCodec,
+        GzipProcessCodec,
+        ZstdCodec,
+    )
+)
+DEFAULT_CODEC = "gzip"
+
+
+def get_codec(name=DEFAULT_CODEC, level=None):
+    """
+    Create an output codec by name.
+
+    :param name: the name of the codec, any of `CODECS`
+    :param level: the compression level, or None for the codec default
+    :return: the `Codec`
+    """
+    if name not in CODECS:
+        raise ValueError("Unknown codec {0}".format(name))
+    return CODECS[name](level=level)
+
+
+class PrefixReader(io.RawIOBase):
+    """Readable file object that replays bytes already read from the start of
+    another binary file object before reading the rest of it, so inputs that
+    can only be read once, like pipes, can be peeked at. Seeking is passed on
+    to the file object if it is seekable."""
+
+    def __init__(self, prefix, fileobj):
+        """
+        Constructor.
+
+        :param prefix: the bytes read from the start of `fileobj`
+        :param fileobj: the binary file object to read the rest from
+        """
+        super().__init__()
+        self.fileobj = fileobj
+        self._prefix = memoryview(prefix)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            size = min(len(b), len(self._prefix))
+            b[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        return self.fileobj.readinto(b)
+
+    def seekable(self):
+        return self.fileobj.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Can only seek from the start")
+        self._prefix = self._prefix[:0]
+        return self.fileobj.seek(offset)
+
+    def tell(self):
+        return self.fileobj.tell() - len(self._prefix)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.fileobj.close()
+        finally:
+            super().close()
+
+
+class CountingReader(io.RawIOBase):
+    """Readable binary file object that calls a function with the number of
+    bytes of each read from another one, e.g. to track the offset in a
+    compressed input"""
+
+    def __init__(self, fileobj, on_read):
+        super().__init__()
+        self.fileobj = fileobj
+        self.on_read = on_read
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        size = self.fileobj.readinto(b)
+        if size:
+            self.on_read(size)
+        return size
+
+    def seekable(self):
+        return self.fileobj.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.fileobj.close()
+        finally:
+            super().close()
+
+
+class GzipReader(gzip.GzipFile):
+    """Readable gzip file of a binary file object that is closed with it"""
+
+    def __init__(self, fileobj):
+        super().__init__(fileobj=fileobj, mode="rb")
+        self._input = fileobj
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._input.close()
+
+
+class ReadAheadReader(io.RawIOBase):
+    """Readable file object that reads ahead from another binary file object
+    in a background thread, so decompression overlaps with parsing. Reads may
+    return fewer bytes than requested."""
+
+    def __init__(self, fileobj, block_size=1024 * 1024, maxsize=QUEUE_SIZE):
+        """
+        Constructor.
+
+        :param fileobj: the binary file object to read from, e.g. a GzipFile
+        :param block_size: the number of bytes read at a time
+        :param maxsize: the maximum number of blocks read ahead
+        """
+        super().__init__()
+        self.fileobj = fileobj
+        self._chunks = BackgroundIterator(
+            self.iter_chunks(block_size), maxsize=maxsize, name="read-ahead"
+        )
+        self._iter = iter(self._chunks)
+        self._buffer = b""
+        self._pos = 0
+
+    def iter_chunks(self, block_size):
+        """Generator of the chunks of bytes read in the background thread"""
+        read = self.fileobj.read
+        while True:
+            chunk = read(block_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        if self._pos >= len(self._buffer):
+            self._buffer = next(self._iter, b"")
+            self._pos = 0
+        return len(self._buffer) - self._pos
+
+    def read(self, size=-1):
+        available = self._fill()
+        if size is None or size < 0 or size >= available:
+            data = self._buffer[self._pos :] if self._pos else self._buffer
+            self._pos = len(self._buffer)
+        else:
+            data = self._buffer[self._pos : self._pos + size]
+            self._pos += size
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._chunks.close()
+            self.fileobj.close()
+        finally:
+            super().close()
+
+
+class BgzfReader(ReadAheadReader):
+    """Readable file object for BGZF files. The compressed blocks are read in
+    a background thread and inflated in parallel by a pool of threads."""
+
+    def __init__(self, fileobj, threads=2, blocks_per_task=16, maxsize=QUEUE_SIZE):
+        """
+        Constructor.
+
+        :param fileobj: the binary file object of the compressed file
+        :param threads: the number of decompression threads
+        :param blocks_per_task: the number of BGZF blocks inflated per task
+        :param maxsize: the maximum number of chunks read ahead
+        """
+        self.threads = threads
+        self.blocks_per_task = blocks_per_task
+        self._executor = ThreadPoolExecutor(threads)
+        super().__init__(fileobj, maxsize=maxsize)
+
+    def iter_chunks(self, block_size):
+        pending = collections.deque()
+        group = []
+        while True:
+            block = read_bgzf_block(self.fileobj)
+            if block:
+                group.append(block)
+            if group and (not block or len(group) == self.blocks_per_task):
+                pending.append(self._executor.submit(inflate_bgzf_blocks, group))
+                group = []
+            while pending and (not block or len(pending) > 2 * self.threads):
+                yield pending.popleft().result()
+            if not block:
+                return
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._executor.shutdown()
+
+
+def open_input(fname):
+    """
+    Open an input once for reading bytes and get its first bytes. The input
+    is rewound if it is seekable, and otherwise the first bytes are replayed
+    (see `PrefixReader`).
+
+    :param fname: the file path, the path of a named pipe or '-' for stdin
+    :return: a tuple containing the binary file object and up to the first 18
+    bytes, enough to tell gzip and BGZF apart
+    """
+    if fname == STDIN:
+        # Another file object of stdin, so closing it leaves sys.stdin alone
+        fh = open(sys.stdin.fileno(), "rb", closefd=False)
+    else:
+        fh = open(fname, "rb")
+    magic = fh.read(18)
+    if fh.seekable():
+        fh.seek(0)
+    else:
+        fh = PrefixReader(magic, fh)
+    return fh, magic
+
+
+def open_fastq(fname, threads=1, on_read=None):
+    """
+    Open a fastq file for reading bytes. Gzip files are detected by their
+    magic bytes and are decompressed. The input is only opened once, so it
+    can be stdin ('-') or a named pipe.
+
+    :param fname: the fastq file path, the path of a named pipe or '-' for stdin
+    :param threads: when greater than 1, the file is read ahead and
+    decompressed in background threads; BGZF files are inflated by this many
+    threads. Other gzip members can only be inflated in order.
+    :param on_read: if set, a function called with the number of bytes of each
+    read of the file as it is stored, i.e. before it is decompressed
+    :return: a readable binary file object
+    """
+    fh, magic = open_input(fname)
+    if on_read is not None:
+        fh = CountingReader(fh, on_read)
+    if threads > 1 and parse_bgzf_header(magic) is not None:
+        return BgzfReader(fh, threads=threads)
+    fobj = GzipReader(fh) if magic[:2] == GZIP_MAGIC else fh
+    return ReadAheadReader(fobj) if threads > 1 else fobj
+
+
+def peek_line(fobj, block_size=64 * 1024):
+    """
+    Read the first line of a readable binary file object without losing it.
+
+    :param fobj: the file object, e.g. from `open_fastq`
+    :param block_size: the number of bytes read at a time
+    :return: a tuple containing the first line without its line break and a
+    file object that reads the whole input from the start (see `PrefixReader`)
+    """
+    chunks = []
+    while True:
+        chunk = fobj.read(block_size)
+        chunks.append(chunk)
+        if not chunk or b"\n" in chunk:
+            break
+    head = b"".join(chunks)
+    line = head.split(b"\n", 1)[0].rstrip(b"\r")
+    return line, PrefixReader(head, fobj)
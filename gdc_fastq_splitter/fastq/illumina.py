@@ -1,9 +1,9 @@
 """Module containing classes for parsing fastq files that adhere to illumina formats"""
-import gzip
 import inspect
 import sys
 
 import gdc_fastq_splitter.fastq.base as base
+from gdc_fastq_splitter.fastq.compression import open_fastq, peek_line
 
 
 class IlluminaSequenceIdentifier(base.SequenceIdentifier):
@@ -98,8 +98,71 @@ class IlluminaSequenceIdentifierNoBarcode(base.SequenceIdentifier):
         return True
 
 
+class IlluminaRawFastqRecord(base.RawFastqRecord):
+    """Bytes-native version of `IlluminaFastqRecord`. The fields are sliced
+    out of the sequence identifier bytes only when they are requested."""
+
+    __slots__ = ()
+    seqid_cls = IlluminaSequenceIdentifier
+
+    @property
+    def read_key(self):
+        parts = self.header.split(b":", 4)
+        return "{0}_{1}".format(parts[2].decode("utf-8"), int(parts[3]))
+
+    @property
+    def index(self):
+        index = self.header[self.header.rindex(b":") + 1 :]
+        return index.decode("utf-8") if index else None
+
+    @property
+    def read_pair(self):
+        """The read pair, or None if the sequence identifier has no comment"""
+        parts = self.header.split(b" ", 1)
+        if len(parts) < 2:
+            return None
+        return parts[1].split(b":", 1)[0].decode("utf-8")
+
+    @property
+    def flowcell(self):
+        return self.header.split(b":", 3)[2].decode("utf-8")
+
+    @property
+    def lane(self):
+        return int(self.header.split(b":", 4)[3])
+
+
+class IlluminaNoBarcodeRawFastqRecord(base.RawFastqRecord):
+    """Bytes-native version of `IlluminaNoBarcodeFastqRecord`."""
+
+    __slots__ = ()
+    seqid_cls = IlluminaSequenceIdentifierNoBarcode
+
+    @property
+    def read_key(self):
+        parts = self.header.split(b":", 4)
+        return "{0}_{1}".format(parts[2].decode("utf-8"), int(parts[3]))
+
+    @property
+    def read_pair(self):
+        """The read pair, or None if the sequence identifier has no /1 or /2"""
+        parts = self.header.rsplit(b"/", 1)
+        if len(parts) < 2:
+            return None
+        return parts[1].decode("utf-8")
+
+    @property
+    def flowcell(self):
+        return self.header.split(b":", 3)[2].decode("utf-8")
+
+    @property
+    def lane(self):
+        return int(self.header.split(b":", 4)[3])
+
+
 class IlluminaFastqRecord(base.FastqRecord):
     seqid_cls = IlluminaSequenceIdentifier
+    raw_record_cls = IlluminaRawFastqRecord
 
     def __init__(self, seqid, sequence, qid, qual):
         super().__init__(seqid, sequence, qid, qual)
@@ -131,6 +194,7 @@ class IlluminaFastqRecord(base.FastqRecord):
 
 class IlluminaNoBarcodeFastqRecord(base.FastqRecord):
     seqid_cls = IlluminaSequenceIdentifierNoBarcode
+    raw_record_cls = IlluminaNoBarcodeRawFastqRecord
 
     def __init__(self, seqid, sequence, qid, qual):
         super().__init__(seqid, sequence, qid, qual)
@@ -156,9 +220,64 @@ class IlluminaNoBarcodeFastqRecord(base.FastqRecord):
         return cls.seqid_cls.is_valid(seqid)
 
 
-def infer_fastq_type(fil):
+class ReadKeyResolver:
+    """Resolves the read key of raw sequence identifiers. Every record of a
+    read group shares the same `instrument:run:flowcell:lane:` prefix, so the
+    read key is cached by prefix and the common case is one slice and one dict
+    lookup. A sequence identifier is only fully parsed when its prefix has not
+    been seen before, or for every record in strict mode.
     """
-    Infer the type of fastq based on the first line.
+
+    def __init__(self, seqid_cls, strict=False, max_prefixes=4096):
+        """
+        Constructor.
+
+        :param seqid_cls: the sequence identifier class used to parse
+        :param strict: if True, fully parse and validate every identifier
+        :param max_prefixes: the cache is cleared when it grows past this size
+        """
+        self.seqid_cls = seqid_cls
+        self.strict = strict
+        self.max_prefixes = max_prefixes
+        self.misses = 0
+        self._cache = {}
+        self._lengths = []
+
+    def __call__(self, header):
+        """Get the read key of the raw sequence identifier bytes"""
+        if not self.strict:
+            cache = self._cache
+            for length in self._lengths:
+                key = cache.get(header[:length])
+                if key is not None:
+                    return key
+        return self._resolve(header)
+
+    def _resolve(self, header):
+        self.misses += 1
+        seqid = self.seqid_cls.from_string(header.decode("utf-8"))
+        key = "{0.flowcell}_{0.lane}".format(seqid)
+        if self.strict:
+            return key
+
+        if len(self._cache) >= self.max_prefixes:
+            self._cache.clear()
+            self._lengths = []
+        # The prefix ends at the colon after the lane; any identifier that
+        # starts with it has the same instrument, run, flowcell and lane
+        length = len(b":".join(header.split(b":", 4)[:4])) + 1
+        self._cache[header[:length]] = key
+        if length not in self._lengths:
+            self._lengths.insert(0, length)
+        return key
+
+
+def get_fastq_type(line):
+    """
+    Get the type of fastq of a sequence identifier line.
+
+    :param line: the first line of the fastq
+    :return: a tuple containing the name and the record class of the type
     """
 
     def predicate(obj):
@@ -170,21 +289,23 @@ def infer_fastq_type(fil):
             and hasattr(obj, "is_valid_seqid")
         )
 
-    fh = gzip.open(fil, "rt") if fil.endswith(".gz") else open(fil, "rt")
+    # mod = sys.modules["gdc_fastq_splitter.fastq.illumina"]
+    mod = sys.modules["gdc_fastq_splitter.fastq.illumina"]
+    # Get all available seqidentifier types
+    for m in inspect.getmembers(mod, predicate):
+        if m[1].is_valid_seqid(line):
+            return m
+    raise Exception("Unable to determine the type of fastq")
 
-    cls_mod = None
+
+def infer_fastq_type(fil):
+    """
+    Infer the type of fastq based on the first line.
+    """
+    fh = open_fastq(fil)
 
     try:
-        line = fh.readline().rstrip("\r\n")
-        # mod = sys.modules["gdc_fastq_splitter.fastq.illumina"]
-        mod = sys.modules["gdc_fastq_splitter.fastq.illumina"]
-        # Get all available seqidentifier types
-        for m in inspect.getmembers(mod, predicate):
-            if m[1].is_valid_seqid(line):
-                cls_mod = m
-                break
+        line, fh = peek_line(fh)
     finally:
         fh.close()
-    if not cls_mod:
-        raise Exception("Unable to determine the type of fastq")
-    return cls_mod
+    return get_fastq_type(line.decode("utf-8"))
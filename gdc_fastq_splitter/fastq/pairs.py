@@ -0,0 +1,174 @@
+"""Module containing the reading of the two mate fastqs of paired reads in
+lockstep, or of an interleaved fastq with both mates. The batches of both
+mates are cut to the same records, and the names of the mates are checked
+record by record on their raw sequence identifiers, so a desynchronized pair
+fails at the first mismatch.
+"""
+from gdc_fastq_splitter.fastq.reader import FastqBatch
+
+
+def mate_names(headers):
+    """
+    Get the read names of raw sequence identifiers, without the comment after
+    the first space or an old-style /1 or /2 mate suffix.
+
+    :param headers: the list of raw sequence identifiers
+    :return: the list of names
+    """
+    names = [header.split(b" ", 1)[0] for header in headers]
+    if names and names[0][-2:] in (b"/1", b"/2"):
+        names = [name[:-2] if name[-2:] in (b"/1", b"/2") else name for name in names]
+    return names
+
+
+def check_mates(batch_a, batch_b, offset=0, fnames=(None, None)):
+    """
+    Check that two batches of mates have the same read names. The read key is
+    part of the name, so the mates also have the same read keys.
+
+    :param batch_a: the `FastqBatch` of the first mates
+    :param batch_b: the `FastqBatch` of the second mates
+    :param offset: the number of records before the batches used in errors
+    :param fnames: the names of the fastqs used in errors
+    """
+    i = find_mismatch(batch_a.headers, batch_b.headers)
+    if i is not None:
+        raise ValueError(
+            "Mates do not match at record {0} of fastqs {1} and {2}: "
+            "{3} != {4}".format(
+                offset + i + 1,
+                fnames[0],
+                fnames[1],
+                batch_a.headers[i].decode("utf-8", "replace"),
+                batch_b.headers[i].decode("utf-8", "replace"),
+            )
+        )
+
+
+def find_mismatch(headers_a, headers_b):
+    """Get the index of the first pair of raw sequence identifiers with
+    different read names, or None if they all match"""
+    names_a = mate_names(headers_a)
+    names_b = mate_names(headers_b)
+    if names_a == names_b:
+        return None
+    for i, (name_a, name_b) in enumerate(zip(names_a, names_b)):
+        if name_a != name_b:
+            return i
+    return None
+
+
+def iter_mate_batches(batches_a, batches_b, fnames=(None, None)):
+    """
+    Generator of pairs of `FastqBatch` objects of the two mate fastqs with
+    the same number of records, checked with `check_mates`.
+
+    :param batches_a: an iterable of the batches of the first mate fastq
+    :param batches_b: an iterable of the batches of the second mate fastq
+    :param fnames: the names of the fastqs used in errors
+    """
+    batches_a = iter(batches_a)
+    batches_b = iter(batches_b)
+    batch_a = batch_b = None
+    count = 0
+    while True:
+        if not batch_a:
+            batch_a = next(batches_a, None)
+        if not batch_b:
+            batch_b = next(batches_b, None)
+        if batch_a is None or batch_b is None:
+            if batch_a is not None or batch_b is not None:
+                raise ValueError(
+                    "Fastq {0} has more records than its mate {1} after {2} "
+                    "records".format(
+                        *(fnames if batch_b is None else fnames[::-1]), count
+                    )
+                )
+            return
+
+        size = min(len(batch_a), len(batch_b))
+        if size == len(batch_a) == len(batch_b):
+            pair = (batch_a, batch_b)
+            batch_a = batch_b = None
+        else:
+            pair = (batch_a.slice(0, size), batch_b.slice(0, size))
+            batch_a = batch_a.slice(size, len(batch_a))
+            batch_b = batch_b.slice(size, len(batch_b))
+        check_mates(*pair, offset=count, fnames=fnames)
+        count += size
+        yield pair
+
+
+def join_records(raws, headers, record_cls):
+    """Create a `FastqBatch` of records from the list of their raw bytes"""
+    starts = [0]
+    for raw in raws:
+        starts.append(starts[-1] + len(raw))
+    return FastqBatch(b"".join(raws), starts, headers, record_cls=record_cls)
+
+
+def iter_interleaved_batches(batches, fname=None):
+    """
+    Generator of pairs of `FastqBatch` objects of the first and second mates
+    of an interleaved fastq, where each first mate is followed by its second
+    mate. The mates are checked to alternate by their read pair and to have
+    the same read names. A first mate at the end of a batch is carried over to
+    the next one.
+
+    :param batches: an iterable of the batches of the interleaved fastq
+    :param fname: the name of the fastq used in errors
+    """
+    carry = None
+    count = 0
+    for batch in batches:
+        data = batch.data
+        starts = batch.starts
+        raws = [data[starts[i] : starts[i + 1]] for i in range(len(batch))]
+        headers = list(batch.headers)
+        if carry is not None:
+            raws.insert(0, carry[0])
+            headers.insert(0, carry[1])
+        size = len(headers) - len(headers) % 2
+        carry = (raws[size], headers[size]) if size < len(headers) else None
+        if not size:
+            continue
+
+        pair = []
+        for mate, read_pair in ((0, "1"), (1, "2")):
+            mates = join_records(
+                raws[mate:size:2], headers[mate:size:2], batch.record_cls
+            )
+            for i, record in enumerate(mates.header_records()):
+                if record.read_pair != read_pair:
+                    raise ValueError(
+                        "Record {0} of interleaved fastq {1} is not mate {2}: "
+                        "{3}".format(
+                            count + 2 * i + mate + 1,
+                            fname,
+                            read_pair,
+                            record.header.decode("utf-8", "replace"),
+                        )
+                    )
+            pair.append(mates)
+
+        i = find_mismatch(pair[0].headers, pair[1].headers)
+        if i is not None:
+            raise ValueError(
+                "Mates do not match at records {0} and {1} of interleaved fastq "
+                "{2}: {3} != {4}".format(
+                    count + 2 * i + 1,
+                    count + 2 * i + 2,
+                    fname,
+                    pair[0].headers[i].decode("utf-8", "replace"),
+                    pair[1].headers[i].decode("utf-8", "replace"),
+                )
+            )
+        count += size
+        yield tuple(pair)
+
+    if carry is not None:
+        raise ValueError(
+            "Interleaved fastq {0} has no mate for its last record {1}".format(
+                fname, count + 1
+            )
+        )
@@ -0,0 +1,171 @@
+"""Module containing the QC statistics of the records of a read group. The
+statistics are computed in bulk with NumPy over the raw bytes of each batch
+of records, so they are optional and only available when NumPy is installed.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PHRED_OFFSET = 33
+NEWLINE = 10
+CARRIAGE_RETURN = 13
+GC_BASES = b"GCgc"
+
+
+def qc_available():
+    """Check whether NumPy is installed for the QC statistics"""
+    return np is not None
+
+
+def _add_padded(a, b):
+    """Add two 1D arrays of possibly different lengths"""
+    if len(a) < len(b):
+        a, b = b, a
+    a = a.copy()
+    a[: len(b)] += b
+    return a
+
+
+def _histogram(counts):
+    return {str(i): int(c) for i, c in enumerate(counts) if c}
+
+
+class QcStats:
+    """Accumulates the read length distribution, quality and GC content of
+    records. Qualities are Phred+33."""
+
+    _ARRAYS = (
+        "length_counts",
+        "position_quality",
+        "position_bases",
+        "quality_counts",
+        "mean_quality_counts",
+        "gc_counts",
+    )
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("The QC statistics require numpy")
+        self.read_count = 0
+        self.length_counts = np.zeros(0, dtype=np.int64)
+        self.position_quality = np.zeros(0, dtype=np.int64)
+        self.position_bases = np.zeros(0, dtype=np.int64)
+        self.quality_counts = np.zeros(0, dtype=np.int64)
+        self.mean_quality_counts = np.zeros(0, dtype=np.int64)
+        self.gc_counts = np.zeros(101, dtype=np.int64)
+        self.gc_bases = 0
+        self._gc_table = np.zeros(256, dtype=bool)
+        self._gc_table[np.frombuffer(GC_BASES, dtype=np.uint8)] = True
+
+    def add(self, data):
+        """
+        Add the records of a chunk of raw fastq bytes.
+
+        :param data: the bytes of one or more complete 4-line records
+        """
+        arr = np.frombuffer(data, dtype=np.uint8)
+        newlines = np.flatnonzero(arr == NEWLINE)
+        if len(newlines) < 4:
+            return
+        # Each line starts after the newline before it
+        ends = newlines[: len(newlines) // 4 * 4].reshape(-1, 4)
+        starts = np.empty_like(ends)
+        starts[:, 1:] = ends[:, :-1] + 1
+        starts[1:, 0] = ends[:-1, 3] + 1
+        starts[0, 0] = 0
+        seq_starts, seq_ends = starts[:, 1], ends[:, 1]
+        qual_starts, qual_ends = starts[:, 3], ends[:, 3]
+        if (arr[seq_ends - 1] == CARRIAGE_RETURN).any():
+            seq_ends = seq_ends - (arr[seq_ends - 1] == CARRIAGE_RETURN)
+            qual_ends = qual_ends - (arr[qual_ends - 1] == CARRIAGE_RETURN)
+        lengths = seq_ends - seq_starts
+        qual_lengths = qual_ends - qual_starts
+        if (lengths != qual_lengths).any():
+            raise ValueError("Sequence and quality lengths differ")
+
+        self.read_count += len(lengths)
+        self.length_counts = _add_padded(self.length_counts, np.bincount(lengths))
+        total = int(lengths.sum())
+        if not total:
+            return
+
+        # The index of every base in `arr` and its position in its read
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(total) - np.repeat(offsets, lengths)
+        quals = arr[np.repeat(qual_starts, lengths) + positions].astype(np.int64)
+        quals -= PHRED_OFFSET
+        if quals.min() < 0:
+            raise ValueError("Quality scores below the Phred+33 range")
+        bases = arr[np.repeat(seq_starts, lengths) + positions]
+
+        self.quality_counts = _add_padded(self.quality_counts, np.bincount(quals))
+        self.position_quality = _add_padded(
+            self.position_quality,
+            np.bincount(positions, weights=quals).astype(np.int64),
+        )
+        self.position_bases = _add_padded(self.position_bases, np.bincount(positions))
+
+        nonempty = lengths > 0
+        reads_quality = np.add.reduceat(quals, offsets[nonempty])
+        mean_quality = np.rint(reads_quality / lengths[nonempty]).astype(np.int64)
+        self.mean_quality_counts = _add_padded(
+            self.mean_quality_counts, np.bincount(mean_quality)
+        )
+
+        gc = self._gc_table[bases]
+        self.gc_bases += int(gc.sum())
+        reads_gc = np.add.reduceat(gc.astype(np.int64), offsets[nonempty])
+        percent = np.rint(100 * reads_gc / lengths[nonempty]).astype(np.int64)
+        self.gc_counts += np.bincount(percent, minlength=101)
+
+    def merge(self, other):
+        """Add the statistics of another set of records"""
+        self.read_count += other.read_count
+        self.gc_bases += other.gc_bases
+        for name in self._ARRAYS:
+            setattr(self, name, _add_padded(getattr(self, name), getattr(other, name)))
+
+    def to_dict(self):
+        bases = int(self.position_bases.sum())
+        lengths = np.arange(len(self.length_counts))
+        covered = self.position_bases > 0
+        return {
+            "read_count": self.read_count,
+            "base_count": bases,
+            "read_length": {
+                "min": int(lengths[self.length_counts > 0].min())
+                if self.read_count
+                else None,
+                "max": int(len(self.length_counts) - 1) if self.read_count else None,
+                "mean": round(bases / self.read_count, 3) if self.read_count else None,
+                "distribution": _histogram(self.length_counts),
+            },
+            "mean_quality": round(int(self.position_quality.sum()) / bases, 3)
+            if bases
+            else None,
+            "quality_distribution": _histogram(self.quality_counts),
+            "read_mean_quality_distribution": _histogram(self.mean_quality_counts),
+            "per_position_mean_quality": [
+                round(float(q), 3)
+                for q in self.position_quality[covered] / self.position_bases[covered]
+            ],
+            "gc_content": round(self.gc_bases / bases, 5) if bases else None,
+            "read_gc_percent_distribution": _histogram(self.gc_counts),
+        }
+
+    def get_state(self):
+        """Get the JSON serializable state to restore the statistics from"""
+        state = {"read_count": self.read_count, "gc_bases": self.gc_bases}
+        for name in self._ARRAYS:
+            state[name] = getattr(self, name).tolist()
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.read_count = state["read_count"]
+        stats.gc_bases = state["gc_bases"]
+        for name in cls._ARRAYS:
+            setattr(stats, name, np.array(state[name], dtype=np.int64))
+        return stats
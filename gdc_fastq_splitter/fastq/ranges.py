@@ -0,0 +1,162 @@
+"""Module containing functions for splitting a single fastq file into byte
+ranges that start and end on record boundaries, so the ranges can be processed
+independently. Uncompressed files are split on byte offsets and BGZF files
+are split on BGZF block boundaries.
+"""
+import mmap
+import os
+
+from gdc_fastq_splitter.fastq.compression import (
+    is_bgzf,
+    is_gzip,
+    is_seekable_file,
+    find_bgzf_block,
+    inflate_bgzf_block,
+    read_bgzf_block,
+)
+
+
+def find_record_start(data, pos):
+    """
+    Find the first record that starts at or after `pos`. A record starts on
+    a line beginning with '@' whose third line begins with '+'. A quality line
+    may begin with '@', but then the third line is the sequence of the next
+    record, which can not begin with '+'.
+
+    :param data: bytes-like object supporting find and slicing, e.g. a mmap
+    :param pos: the offset to start searching from
+    :return: the offset of the record start or -1 if there is none
+    """
+    if pos > 0 and data[pos - 1 : pos] != b"\n":
+        pos = data.find(b"\n", pos) + 1
+        if pos == 0:
+            return -1
+
+    size = len(data)
+    while pos < size:
+        sequence = data.find(b"\n", pos) + 1
+        if sequence == 0:
+            return -1
+        if data[pos : pos + 1] == b"@":
+            qid = data.find(b"\n", sequence) + 1
+            if qid == 0:
+                return -1
+            if data[qid : qid + 1] == b"+":
+                return pos
+        pos = sequence
+    return -1
+
+
+def plan_fastq_ranges(fname, n):
+    """
+    Split a fastq into at most `n` ranges that start and end on records.
+    For uncompressed files the ranges are (start, end) byte offsets. For BGZF
+    files each end point is a (block offset, uncompressed offset) pair, where
+    the uncompressed offset is counted from the start of that block; an end of
+    None means the end of the file.
+
+    :param fname: the fastq file path
+    :param n: the number of ranges wanted
+    :return: a list of ranges or None if the file can not be split
+    """
+    if not is_seekable_file(fname):
+        return None
+    if is_bgzf(fname):
+        return _plan_bgzf_ranges(fname, n)
+    elif is_gzip(fname):
+        return None
+
+    size = os.path.getsize(fname)
+    if size == 0:
+        return []
+    with open(fname, "rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            points = []
+            for i in range(n):
+                start = find_record_start(mm, size * i // n)
+                points.append(size if start == -1 else start)
+    points.append(size)
+    return [(a, b) for a, b in zip(points, points[1:]) if a < b]
+
+
+def _find_bgzf_record_start(fh, offset):
+    """Find the first record starting in or after the BGZF block at `offset`"""
+    block_offset = find_bgzf_block(fh, offset)
+    if block_offset is None:
+        return None
+    fh.seek(block_offset)
+    data = b""
+    while True:
+        block = read_bgzf_block(fh)
+        if not block:
+            return None
+        data += inflate_bgzf_block(block)
+        start = find_record_start(data, 0)
+        if start != -1:
+            return (block_offset, start)
+
+
+def _plan_bgzf_ranges(fname, n):
+    size = os.path.getsize(fname)
+    points = []
+    with open(fname, "rb") as fh:
+        for i in range(n):
+            point = _find_bgzf_record_start(fh, size * i // n)
+            if point is None:
+                break
+            if not points or point != points[-1]:
+                points.append(point)
+    return list(zip(points, points[1:] + [None]))
+
+
+def iter_file_range(fname, start, end, block_size=4 * 1024 * 1024, on_read=None):
+    """Generator of raw blocks of an uncompressed fastq between two offsets.
+    If set, `on_read` is called with the size of each block read."""
+    with open(fname, "rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for pos in range(start, end, block_size):
+                block = mm[pos : min(pos + block_size, end)]
+                if on_read is not None:
+                    on_read(len(block))
+                yield block
+
+
+def iter_bgzf_range(fname, start, end, block_size=4 * 1024 * 1024, on_read=None):
+    """Generator of raw uncompressed blocks of a BGZF fastq between two
+    (block offset, uncompressed offset) points, see `plan_fastq_ranges`. If
+    set, `on_read` is called with the size of each compressed block read."""
+    block_offset, start_pos = start
+    end_pos = None
+    pos = 0
+    chunks = []
+    buffered = 0
+    with open(fname, "rb") as fh:
+        fh.seek(block_offset)
+        while True:
+            if end is not None and block_offset == end[0]:
+                end_pos = pos + end[1]
+            if end_pos is not None and pos >= end_pos:
+                break
+
+            block = read_bgzf_block(fh)
+            if not block:
+                break
+            block_offset += len(block)
+            if on_read is not None:
+                on_read(len(block))
+            data = inflate_bgzf_block(block)
+            lo = max(start_pos - pos, 0)
+            hi = len(data) if end_pos is None else min(end_pos - pos, len(data))
+            pos += len(data)
+            if lo >= hi:
+                continue
+
+            chunks.append(data[lo:hi])
+            buffered += hi - lo
+            if buffered >= block_size:
+                yield b"".join(chunks)
+                chunks = []
+                buffered = 0
+
+    if chunks:
+        yield b"".join(chunks)
@@ -1,20 +1,31 @@
 """Module containing base reader class"""
-import gzip
 import io
+import itertools
+import operator
 
-from gdc_fastq_splitter.fastq.base import FastqRecord
+from gdc_fastq_splitter.fastq.base import FastqRecord, RawFastqRecord
+from gdc_fastq_splitter.fastq.compression import open_fastq
+from gdc_fastq_splitter.metrics import NULL_METRICS
 
 
 class FastqReader:
     """Base fastq reader"""
 
-    def __init__(self, fname, record_cls=FastqRecord):
+    def __init__(self, fname, record_cls=FastqRecord, threads=1, fobj=None):
+        """
+        Constructor.
+
+        :param fname: the fastq file path, or '-' for stdin (see `open_fastq`)
+        :param record_cls: the record class to create
+        :param threads: if greater than 1, the input is decompressed in
+        background threads (see `open_fastq`)
+        :param fobj: the fastq opened with `open_fastq` already, e.g. to infer
+        its type from its first line, instead of opening it again
+        """
         self.fname = fname
         self.record_cls = record_cls
         self._next = None
-        self.fobj = (
-            gzip.open(fname, "rb") if fname.endswith(".gz") else open(fname, "rb")
-        )
+        self.fobj = open_fastq(fname, threads=threads) if fobj is None else fobj
         self.f = io.BufferedReader(self.fobj)
 
     def __iter__(self):
@@ -40,3 +51,216 @@ class FastqReader:
     def close(self):
         """ Close the reader """
         self.fobj.close()
+
+
+class RawFastqReader(FastqReader):
+    """Fastq reader that never decodes the records. Each record keeps the
+    raw bytes of its 4-line block so it can be written out untouched."""
+
+    def __init__(self, fname, record_cls=RawFastqRecord, threads=1, fobj=None):
+        super().__init__(fname, record_cls=record_cls, threads=threads, fobj=fobj)
+
+    def next(self):
+        readline = self.f.readline
+        seqid = readline()
+        sequence = readline()
+        qid = readline()
+        qual = readline()
+
+        if qual.rstrip(b"\r\n"):
+            if not qual.endswith(b"\n"):
+                qual += b"\n"
+            record = self.record_cls(
+                b"".join((seqid, sequence, qid, qual)), seqid.rstrip(b"\r\n")
+            )
+            self._next = record
+            return record
+        else:
+            self._next = None
+            raise StopIteration
+
+
+class FastqBatch:
+    """A batch of complete records sliced from one block of a fastq file.
+    The records are only materialized when the batch is iterated."""
+
+    __slots__ = ("data", "starts", "headers", "record_cls")
+
+    def __init__(self, data, starts, headers, record_cls=RawFastqRecord):
+        """
+        Constructor.
+
+        :param data: the block of raw bytes the records were found in
+        :param starts: the start offset of each record in `data` followed by
+        the end offset of the last record
+        :param headers: the sequence identifier bytes of each record
+        :param record_cls: the raw record class to create
+        """
+        self.data = data
+        self.starts = starts
+        self.headers = headers
+        self.record_cls = record_cls
+
+    @classmethod
+    def from_block(cls, data, record_cls=RawFastqRecord):
+        """
+        Split all of the complete records out of a block of bytes. The end
+        of the returned batch is the offset where the incomplete record
+        left over at the end of the block starts.
+        """
+        # The block is split into lines in one call and the size of each record
+        # is the sum of the lengths of its 4 lines, so no Python code runs per
+        # record
+        lines = data.split(b"\n")
+        end = 4 * ((len(lines) - 1) // 4)
+        headers = lines[0:end:4]
+        add = operator.add
+        sizes = map(
+            add,
+            map(add, map(len, headers), map(len, lines[1:end:4])),
+            map(add, map(len, lines[2:end:4]), map(len, lines[3:end:4])),
+        )
+        starts = [0]
+        starts.extend(itertools.accumulate(map((4).__add__, sizes)))
+
+        if b"\r" in data:
+            headers = [header.rstrip(b"\r") for header in headers]
+        return cls(data, starts, headers, record_cls=record_cls)
+
+    @property
+    def end(self):
+        return self.starts[-1]
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __iter__(self):
+        data = self.data
+        starts = self.starts
+        record_cls = self.record_cls
+        for i, header in enumerate(self.headers):
+            yield record_cls(data[starts[i] : starts[i + 1]], header)
+
+    def header_records(self, start=0, end=None):
+        """List the records from index `start` to `end` with only their
+        sequence identifier and no raw bytes, for when only the read keys and
+        barcodes are needed"""
+        record_cls = self.record_cls
+        return [record_cls(b"", header) for header in self.headers[start:end]]
+
+    def slice(self, start, end):
+        """Get the batch of the records from index `start` to `end`, which
+        shares the block of bytes of this batch"""
+        return FastqBatch(
+            self.data,
+            self.starts[start : end + 1],
+            self.headers[start:end],
+            record_cls=self.record_cls,
+        )
+
+    def tobytes(self):
+        """Get the raw bytes of all of the records of the batch"""
+        return self.data[self.starts[0] : self.starts[-1]]
+
+
+def iter_batches(blocks, record_cls=RawFastqRecord, fname=None, metrics=None):
+    """
+    Generator of `FastqBatch` objects split out of an iterable of raw blocks.
+    The incomplete record at the end of each block is carried over to the
+    next one.
+
+    :param blocks: an iterable of raw blocks of bytes starting on a record
+    :param record_cls: the raw record class to create
+    :param fname: the name of the fastq used in error messages
+    :param metrics: a `StageMetrics` object to record the time spent parsing
+    """
+    metrics = NULL_METRICS if metrics is None else metrics
+    carry = b""
+    for chunk in blocks:
+        with metrics.stage("parse"):
+            data = carry + chunk if carry else chunk
+            batch = FastqBatch.from_block(data, record_cls=record_cls)
+            carry = data[batch.end :]
+        if batch.headers:
+            yield batch
+
+    if carry.strip():
+        if not carry.endswith(b"\n"):
+            carry += b"\n"
+        batch = FastqBatch.from_block(carry, record_cls=record_cls)
+        if carry[batch.end :].strip():
+            raise ValueError("Truncated record at the end of fastq {0}".format(fname))
+        yield batch
+
+
+class FastqBlockReader(RawFastqReader):
+    """Raw fastq reader that pulls large blocks from the input and splits
+    them into batches of records in bulk."""
+
+    def __init__(
+        self,
+        fname,
+        record_cls=RawFastqRecord,
+        block_size=4 * 1024 * 1024,
+        threads=1,
+        metrics=None,
+        fobj=None,
+    ):
+        super().__init__(fname, record_cls=record_cls, threads=threads, fobj=fobj)
+        self.block_size = block_size
+        self.metrics = NULL_METRICS if metrics is None else metrics
+        self._records = None
+
+    def blocks(self):
+        """Generator of raw blocks of bytes until the file is exhausted"""
+        read = self.f.read
+        metrics = self.metrics
+        while True:
+            with metrics.stage("decompress"):
+                chunk = read(self.block_size)
+            if not chunk:
+                return
+            metrics.count("input_bytes", len(chunk))
+            yield chunk
+
+    def skip(self, offset):
+        """Skip to an offset of the uncompressed fastq, which must be the start
+        of a record, e.g. to resume processing it"""
+        with self.metrics.stage("decompress"):
+            if self.f.seekable():
+                self.f.seek(offset)
+                pos = self.f.tell()
+            else:
+                pos = 0
+                while pos < offset:
+                    chunk = self.f.read(min(self.block_size, offset - pos))
+                    if not chunk:
+                        break
+                    pos += len(chunk)
+        if pos != offset:
+            raise ValueError(
+                "Can not skip to offset {0} of fastq {1}".format(offset, self.fname)
+            )
+
+    def batches(self, blocks=None):
+        """
+        Generator of `FastqBatch` objects until the file is exhausted.
+
+        :param blocks: an iterable of raw blocks to split instead of reading
+        them with `blocks`, e.g. when they are read in another thread
+        """
+        return iter_batches(
+            self.blocks() if blocks is None else blocks,
+            record_cls=self.record_cls,
+            fname=self.fname,
+            metrics=self.metrics,
+        )
+
+    def next(self):
+        if self._records is None:
+            self._records = itertools.chain.from_iterable(self.batches())
+        record = next(self._records, None)
+        self._next = record
+        if record is None:
+            raise StopIteration
+        return record
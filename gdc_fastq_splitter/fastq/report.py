@@ -1,7 +1,95 @@
 """Module containing classes for generating reports from Fastq files"""
 import os
+import heapq
+import itertools
 import json
 from collections import Counter
+from collections.abc import Mapping
+
+from gdc_fastq_splitter.fastq.qc import QcStats
+
+
+class SpaceSavingCounter(Mapping):
+    """Approximate counter that keeps at most `capacity` items using the
+    Space-Saving algorithm. When a new item arrives and the counter is full,
+    the item with the lowest count is replaced and the new item inherits its
+    count as error. Counts are therefore never under-estimated, every item
+    more frequent than total / capacity is kept, and the true count of an item
+    is between `count - error` and `count`."""
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Invalid capacity {0}".format(capacity))
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # Holds one (count, order, item) entry per item. Counts only grow, so
+        # an entry is stale when its count is lower than the current one.
+        self._heap = []
+        self._order = itertools.count()
+
+    def __getitem__(self, item):
+        return self.counts[item]
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def max_error(self):
+        """The largest possible over-estimate of any count"""
+        return max(self.errors.values(), default=0)
+
+    def _push(self, count, item):
+        heapq.heappush(self._heap, (count, next(self._order), item))
+
+    def _pop_min(self):
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            current = self.counts[item]
+            if current == count:
+                return count, item
+            self._push(current, item)
+
+    def add(self, item, count=1, error=0):
+        """Add `count` occurrences of an item"""
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+            self.errors[item] += error
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = error
+            self._push(count, item)
+        else:
+            floor, evicted = self._pop_min()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[item] = floor + count
+            self.errors[item] = floor + error
+            self._push(floor + count, item)
+
+    def update(self, items):
+        """Add the occurrences of an iterable of items or the counts of a
+        mapping. Items are counted exactly first, so a batch with few
+        distinct items only touches the sketch once per item."""
+        if isinstance(items, SpaceSavingCounter):
+            for item, count in items.counts.items():
+                self.add(item, count, items.errors[item])
+            return
+        if not isinstance(items, Mapping):
+            items = Counter(items)
+        for item, count in sorted(items.items(), key=lambda x: -x[1]):
+            self.add(item, count)
+
+    def most_common(self, n=None):
+        """List the `n` items with the highest counts, like `Counter`"""
+        if n is None:
+            return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)
+        return heapq.nlargest(n, self.counts.items(), key=lambda x: x[1])
 
 
 class BaseReport:
@@ -12,27 +100,95 @@ class BaseReport:
     ):
         self._report_filename = report_filename
         self.report_filename = os.path.basename(report_filename)
+        self._fastq_filename = fastq_filename
         self.fastq_filename = os.path.basename(fastq_filename)
         self.flowcell_barcode = flowcell_barcode
         self.lane_number = lane_number
         self.record_counts = 0
+        self.uncompressed_bytes = None
+        self.compressed_bytes = None
+        self.checksums = {}
+        self.qc = None
 
     def __iadd__(self, record):
         self.record_counts += 1
         return self
 
+    def add_records(self, records):
+        """Update the report with a list of records"""
+        self.record_counts += len(records)
+
+    def set_output(self, uncompressed_bytes, compressed_bytes, checksums):
+        """Set the sizes and checksums of the output fastq"""
+        self.uncompressed_bytes = uncompressed_bytes
+        self.compressed_bytes = compressed_bytes
+        self.checksums = checksums
+
+    def _output_metadata(self):
+        if self.uncompressed_bytes is None:
+            return {}
+        metadata = {
+            "uncompressed_bytes": self.uncompressed_bytes,
+            "compressed_bytes": self.compressed_bytes,
+        }
+        metadata.update(self.checksums)
+        return metadata
+
+    def merge(self, other):
+        """Add the counts of another report of the same read group. The
+        compressed size and checksums of the merged output must be set again
+        with `set_output`."""
+        self.record_counts += other.record_counts
+        if other.qc is not None:
+            self.qc.merge(other.qc)
+        if other.uncompressed_bytes is not None:
+            self.uncompressed_bytes = other.uncompressed_bytes + (
+                self.uncompressed_bytes or 0
+            )
+
+    def get_state(self):
+        """Get the JSON serializable state the report can be restored from
+        with `report_from_state`"""
+        return {
+            "report_filename": self._report_filename,
+            "fastq_filename": self._fastq_filename,
+            "flowcell_barcode": self.flowcell_barcode,
+            "lane_number": self.lane_number,
+            "record_count": self.record_counts,
+            "uncompressed_bytes": self.uncompressed_bytes,
+            "qc": None if self.qc is None else self.qc.get_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        report = cls(
+            state["report_filename"],
+            state["fastq_filename"],
+            flowcell_barcode=state["flowcell_barcode"],
+            lane_number=state["lane_number"],
+        )
+        report.record_counts = state["record_count"]
+        report.uncompressed_bytes = state.get("uncompressed_bytes")
+        if state.get("qc") is not None:
+            report.qc = QcStats.from_state(state["qc"])
+        return report
+
     def __str__(self):
         return json.dumps(self.to_dict(), indent=2, sort_keys=True)
 
     def to_dict(self):
-        return {
+        data = {
             "metadata": {
                 "fastq_filename": self.fastq_filename,
                 "flowcell_barcode": self.flowcell_barcode,
                 "lane_number": self.lane_number,
                 "record_count": self.record_counts,
+                **self._output_metadata(),
             }
         }
+        if self.qc is not None:
+            data["qc"] = self.qc.to_dict()
+        return data
 
     def write_to_json(self):
         with open(self._report_filename, "wt") as o:
@@ -40,10 +196,17 @@ class BaseReport:
 
 
 class ReportWithBarcodes(BaseReport):
-    """Report that contains barcode frequencies."""
+    """Report that contains barcode frequencies. The frequencies are counted
+    exactly unless `max_barcodes` is set, in which case at most that many
+    barcodes are kept in a `SpaceSavingCounter`."""
 
     def __init__(
-        self, report_filename, fastq_filename, flowcell_barcode=None, lane_number=None
+        self,
+        report_filename,
+        fastq_filename,
+        flowcell_barcode=None,
+        lane_number=None,
+        max_barcodes=None,
     ):
         super().__init__(
             report_filename,
@@ -51,7 +214,10 @@ class ReportWithBarcodes(BaseReport):
             flowcell_barcode=flowcell_barcode,
             lane_number=lane_number,
         )
-        self.barcode_frequency = Counter()
+        if max_barcodes:
+            self.barcode_frequency = SpaceSavingCounter(max_barcodes)
+        else:
+            self.barcode_frequency = Counter()
 
     @property
     def most_common_barcode(self):
@@ -62,21 +228,81 @@ class ReportWithBarcodes(BaseReport):
             return None
 
     def _add_barcode(self, barcode):
-        self.barcode_frequency[barcode] += 1
+        if isinstance(self.barcode_frequency, SpaceSavingCounter):
+            self.barcode_frequency.add(barcode)
+        else:
+            self.barcode_frequency[barcode] += 1
 
     def __iadd__(self, record):
         self.record_counts += 1
         self._add_barcode(record.index)
         return self
 
+    def add_records(self, records):
+        self.record_counts += len(records)
+        self.barcode_frequency.update([record.index for record in records])
+
+    def merge(self, other):
+        super().merge(other)
+        self.barcode_frequency.update(other.barcode_frequency)
+
+    def get_state(self):
+        state = super().get_state()
+        state["barcode_frequency"] = dict(self.barcode_frequency)
+        if isinstance(self.barcode_frequency, SpaceSavingCounter):
+            state["max_barcodes"] = self.barcode_frequency.capacity
+            state["barcode_errors"] = dict(self.barcode_frequency.errors)
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        report = cls(
+            state["report_filename"],
+            state["fastq_filename"],
+            flowcell_barcode=state["flowcell_barcode"],
+            lane_number=state["lane_number"],
+            max_barcodes=state.get("max_barcodes"),
+        )
+        report.record_counts = state["record_count"]
+        report.uncompressed_bytes = state.get("uncompressed_bytes")
+        if state.get("qc") is not None:
+            report.qc = QcStats.from_state(state["qc"])
+        if "max_barcodes" in state:
+            for barcode, count in state["barcode_frequency"].items():
+                report.barcode_frequency.add(
+                    barcode, count, state["barcode_errors"][barcode]
+                )
+        else:
+            report.barcode_frequency.update(state["barcode_frequency"])
+        return report
+
     def to_dict(self):
-        return {
+        data = {
             "metadata": {
                 "fastq_filename": self.fastq_filename,
                 "flowcell_barcode": self.flowcell_barcode,
                 "multiplex_barcode": self.most_common_barcode,
                 "lane_number": self.lane_number,
                 "record_count": self.record_counts,
+                **self._output_metadata(),
             },
             "barcode_frequency": dict(self.barcode_frequency),
         }
+        if isinstance(self.barcode_frequency, SpaceSavingCounter):
+            data["barcode_frequency_error"] = {
+                "max_barcodes": self.barcode_frequency.capacity,
+                "max_error": self.barcode_frequency.max_error,
+                "errors": {
+                    bc: err for bc, err in self.barcode_frequency.errors.items() if err
+                },
+            }
+        if self.qc is not None:
+            data["qc"] = self.qc.to_dict()
+        return data
+
+
+def report_from_state(state):
+    """Restore a report from the state returned by its `get_state`"""
+    if "barcode_frequency" in state:
+        return ReportWithBarcodes.from_state(state)
+    return BaseReport.from_state(state)
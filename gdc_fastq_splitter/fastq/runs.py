@@ -0,0 +1,140 @@
+"""Module containing the runs of read keys of a fastq file. The records of a
+read group usually come in long contiguous runs, so each run is handed to the
+writers as one range of bytes, and the runs can be saved as a sidecar index of
+the fastq that later splits copy the runs from without parsing the records.
+"""
+import itertools
+import os
+
+RUN_INDEX_COLUMNS = (
+    "read_key",
+    "byte_offset",
+    "byte_length",
+    "record_offset",
+    "record_count",
+)
+
+
+def find_runs(keys):
+    """
+    Find the runs of equal consecutive read keys.
+
+    :param keys: the list of read keys of a batch of records
+    :return: a list of (read key, start, end) tuples of the record indexes
+    """
+    if not keys:
+        return []
+    if keys.count(keys[0]) == len(keys):
+        return [(keys[0], 0, len(keys))]
+
+    runs = []
+    start = 0
+    for key, group in itertools.groupby(keys):
+        end = start + sum(1 for _ in group)
+        runs.append((key, start, end))
+        start = end
+    return runs
+
+
+class RunIndex:
+    """Run-length index of the read keys of a fastq file. Each run has the
+    offset and length of its records in the uncompressed fastq, both in bytes
+    and in records. Runs are added in order and a run of the same read key as
+    the one before it extends it. The index also keeps the barcode frequencies
+    of each read key, which the reports of a split from the index need."""
+
+    def __init__(self):
+        self.runs = []
+        self.byte_count = 0
+        self.record_count = 0
+        self.barcodes = {}
+
+    def __len__(self):
+        return len(self.runs)
+
+    def __iter__(self):
+        return iter(self.runs)
+
+    def add(self, key, byte_length, record_count):
+        """Add a run that starts where the last one ended"""
+        last = self.runs[-1] if self.runs else None
+        if last is not None and last[0] == key:
+            last[2] += byte_length
+            last[4] += record_count
+        else:
+            self.runs.append(
+                [key, self.byte_count, byte_length, self.record_count, record_count]
+            )
+        self.byte_count += byte_length
+        self.record_count += record_count
+
+    def extend(self, other):
+        """Add the runs of the index of the part of the fastq that follows"""
+        for key, _, byte_length, _, record_count in other.runs:
+            self.add(key, byte_length, record_count)
+
+    def record_counts(self):
+        """Get the number of records of each read key"""
+        counts = {}
+        for key, _, _, _, record_count in self.runs:
+            counts[key] = counts.get(key, 0) + record_count
+        return counts
+
+    def write(self, fname, input_file=None):
+        """
+        Write the runs to a TSV file. Comment lines before the runs have the
+        barcode frequencies of each read key and the size and modification
+        time of the fastq, which `read` checks.
+
+        :param input_file: the fastq the runs were found in, if it is a regular
+        file; the index of a stream can not be read back
+        """
+        with open(fname, "wt") as o:
+            if input_file is not None:
+                stat = os.stat(input_file)
+                o.write("#fastq_size\t{0}\n".format(stat.st_size))
+                o.write("#fastq_mtime_ns\t{0}\n".format(stat.st_mtime_ns))
+            for key, frequency in self.barcodes.items():
+                for barcode, count in frequency.items():
+                    o.write("#barcode\t{0}\t{1}\t{2}\n".format(key, barcode, count))
+            o.write("\t".join(RUN_INDEX_COLUMNS) + "\n")
+            for run in self.runs:
+                o.write("\t".join(map(str, run)) + "\n")
+
+    @classmethod
+    def read(cls, fname, input_file):
+        """Read an index written by `write` for a fastq, which must not have
+        changed since"""
+        index = cls()
+        fastq = {}
+        with open(fname, "rt") as fh:
+            line = fh.readline()
+            while line.startswith("#"):
+                fields = line[1:].rstrip("\n").split("\t")
+                if fields[0] == "barcode":
+                    frequency = index.barcodes.setdefault(fields[1], {})
+                    frequency[fields[2]] = int(fields[3])
+                else:
+                    fastq[fields[0]] = int(fields[1])
+                line = fh.readline()
+            if tuple(line.rstrip("\n").split("\t")) != RUN_INDEX_COLUMNS:
+                raise ValueError("Invalid run index {0}".format(fname))
+            for line in fh:
+                key, _, byte_length, _, record_count = line.rstrip("\n").split("\t")
+                index.add(key, int(byte_length), int(record_count))
+
+        if "fastq_size" not in fastq:
+            raise ValueError(
+                "Run index {0} was not written for a regular file".format(fname)
+            )
+        stat = os.stat(input_file)
+        if (fastq["fastq_size"], fastq["fastq_mtime_ns"]) != (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            raise ValueError(
+                "Fastq {0} changed since its run index {1} was written".format(
+                    input_file, fname
+                )
+            )
+        return index
@@ -0,0 +1,142 @@
+"""Module containing the validation of fastq records. The records of each
+batch are checked in bulk: the lines are split out of the raw bytes of the
+whole batch at once, the lengths are compared as lists, and the characters of
+all of the sequences and qualities are checked with a single `bytes.translate`
+each. Records are only looked at one by one once a batch is known to have an
+invalid record, to find which ones.
+"""
+import itertools
+
+VALID_BASES = b"ACGTURYSWKMBDHVNacgturyswkmbdhvn."
+VALID_QUALITIES = bytes(range(33, 127))
+MAX_ISSUES = 100
+
+
+def _preview(value, size=20):
+    text = value.decode("utf-8", "replace")
+    return text if len(text) <= size else text[:size] + "..."
+
+
+def check_batch(batch):
+    """
+    Check the records of a `FastqBatch`: the sequence identifier starts with
+    @, the separator line is + optionally followed by the sequence identifier,
+    the sequence and quality have the same length, the bases are IUPAC codes
+    or . and the qualities are printable Phred+33 characters.
+
+    :param batch: the `FastqBatch` to check
+    :return: a list of the index in the batch and the problem of each invalid
+    record, in order
+    """
+    count = len(batch)
+    if not count:
+        return []
+    data = batch.data[batch.starts[0] : batch.starts[-1]]
+    lines = data.split(b"\n")
+    end = 4 * count
+    seqs = lines[1:end:4]
+    pluses = lines[2:end:4]
+    quals = lines[3:end:4]
+    if b"\r" in data:
+        seqs = [line.rstrip(b"\r") for line in seqs]
+        pluses = [line.rstrip(b"\r") for line in pluses]
+        quals = [line.rstrip(b"\r") for line in quals]
+    headers = batch.headers
+
+    issues = {}
+    if not all(map(bytes.startswith, headers, itertools.repeat(b"@"))):
+        for i, header in enumerate(headers):
+            if not header.startswith(b"@"):
+                issues.setdefault(i, "sequence identifier does not start with @")
+    if pluses.count(b"+") != count:
+        for i, plus in enumerate(pluses):
+            if plus != b"+" and plus != b"+" + headers[i][1:]:
+                issues.setdefault(
+                    i, "invalid separator line '{0}'".format(_preview(plus))
+                )
+    seq_lengths = list(map(len, seqs))
+    qual_lengths = list(map(len, quals))
+    if seq_lengths != qual_lengths:
+        for i, (seq_length, qual_length) in enumerate(zip(seq_lengths, qual_lengths)):
+            if seq_length != qual_length:
+                issues.setdefault(
+                    i,
+                    "sequence and quality lengths differ ({0} != {1})".format(
+                        seq_length, qual_length
+                    ),
+                )
+    for name, lines, valid in (
+        ("bases", seqs, VALID_BASES),
+        ("qualities", quals, VALID_QUALITIES),
+    ):
+        if not b"".join(lines).translate(None, valid):
+            continue
+        for i, line in enumerate(lines):
+            invalid = line.translate(None, valid)
+            if invalid:
+                issues.setdefault(
+                    i, "invalid {0} '{1}'".format(name, _preview(invalid))
+                )
+    return sorted(issues.items())
+
+
+class RecordValidator:
+    """Checks the batches of records of a fastq as they are split (see
+    `check_batch`) and keeps the record numbers of the invalid ones"""
+
+    def __init__(self, fname, max_issues=MAX_ISSUES):
+        """
+        Constructor.
+
+        :param fname: the name of the fastq used in errors
+        :param max_issues: the maximum number of invalid records kept; the
+        rest are only counted
+        """
+        self.fname = fname
+        self.max_issues = max_issues
+        self.record_count = 0
+        self.invalid_count = 0
+        self.issues = []
+
+    def add(self, batch):
+        """Check the next `FastqBatch` of the fastq"""
+        for i, issue in check_batch(batch):
+            self._add_issue(self.record_count + i + 1, issue)
+        self.record_count += len(batch)
+
+    def _add_issue(self, record, issue):
+        self.invalid_count += 1
+        if len(self.issues) < self.max_issues:
+            self.issues.append((record, issue))
+
+    def merge(self, other):
+        """Add the invalid records of a validator of the next part of the
+        fastq, e.g. of a range of it"""
+        for record, issue in other.issues:
+            self._add_issue(self.record_count + record, issue)
+        self.invalid_count += other.invalid_count - len(other.issues)
+        self.record_count += other.record_count
+
+    def check(self, logger=None):
+        """
+        Raise an error listing the invalid records, if there are any.
+
+        :param logger: if set, each invalid record kept is also logged
+        """
+        if not self.invalid_count:
+            return
+        if logger is not None:
+            for record, issue in self.issues:
+                logger.error(
+                    "Invalid record {0} of fastq {1}: {2}".format(
+                        record, self.fname, issue
+                    )
+                )
+        records = ", ".join(str(record) for record, _ in self.issues[:10])
+        if self.invalid_count > 10:
+            records += ", ..."
+        raise ValueError(
+            "Fastq {0} has {1} invalid records out of {2}: {3}".format(
+                self.fname, self.invalid_count, self.record_count, records
+            )
+        )
@@ -1,58 +1,552 @@
 """Module containing writer classes for writing Fastq files"""
-import gzip
+import collections
+import hashlib
 import io
+import os
+import threading
+import zlib
+from gdc_fastq_splitter.fastq.compression import Codec, GzipCodec
+from gdc_fastq_splitter.metrics import NULL_METRICS, TimedFile
+from gdc_fastq_splitter.fastq.qc import QcStats
 from gdc_fastq_splitter.fastq.report import BaseReport, ReportWithBarcodes
+from gdc_fastq_splitter.utils import format_size
+
+
+CHECKSUMS = ("md5", "sha256", "crc32")
+DEFAULT_CHECKSUMS = ("md5",)
+MIN_BUFFER_SIZE = 64 * 1024
+
+
+class OutputChecksums:
+    """Running checksums and size of the compressed bytes of an output"""
+
+    def __init__(self, algorithms=DEFAULT_CHECKSUMS):
+        """
+        Constructor.
+
+        :param algorithms: the checksums to compute, any of `CHECKSUMS`
+        """
+        for algorithm in algorithms:
+            if algorithm not in CHECKSUMS:
+                raise ValueError("Unknown checksum {0}".format(algorithm))
+        self.hashes = {
+            algorithm: hashlib.new(algorithm)
+            for algorithm in algorithms
+            if algorithm != "crc32"
+        }
+        self.crc32 = 0 if "crc32" in algorithms else None
+        self.size = 0
+
+    def update(self, data):
+        for h in self.hashes.values():
+            h.update(data)
+        if self.crc32 is not None:
+            self.crc32 = zlib.crc32(data, self.crc32)
+        self.size += len(data)
+
+    def update_from_file(self, fname, block_size=4 * 1024 * 1024):
+        """Add the bytes of a file, e.g. the part of an output written before"""
+        with open(fname, "rb") as fh:
+            for chunk in iter(lambda: fh.read(block_size), b""):
+                self.update(chunk)
+
+    def to_dict(self):
+        data = {algorithm: h.hexdigest() for algorithm, h in self.hashes.items()}
+        if self.crc32 is not None:
+            data["crc32"] = "{0:08x}".format(self.crc32)
+        return data
+
+
+class ChecksumFile(io.RawIOBase):
+    """Wraps a writable binary file object to compute the `OutputChecksums`
+    of the bytes written as they are written."""
+
+    def __init__(self, fileobj, checksums):
+        super().__init__()
+        self.fileobj = fileobj
+        self.checksums = checksums
+
+    @property
+    def name(self):
+        return self.fileobj.name
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.checksums.update(data)
+        self.fileobj.write(data)
+        return len(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+        finally:
+            self.fileobj.close()
+
+
+def create_report(record, prefix, max_barcodes=None, qc=False, extension=".fq.gz"):
+    """
+    Create the report of the read group of a record.
+
+    :param record: the first record of the read group
+    :param prefix: the output prefix
+    :param max_barcodes: if set, the barcode frequencies are approximated
+    keeping at most this many barcodes
+    :param qc: if True, the report also has `QcStats` of the records
+    :param extension: the extension of the output fastq of the codec
+    :return: a tuple containing the output path without extension and the report
+    """
+    fbase = "{0}{1}_R{2}".format(prefix, record.read_key, record.read_pair)
+    fname = "{0}{1}".format(fbase, extension)
+    rname = "{0}.report.json".format(fbase)
+    if hasattr(record, "index"):
+        reporter = ReportWithBarcodes(
+            rname,
+            fname,
+            flowcell_barcode=record.flowcell,
+            lane_number=record.lane,
+            max_barcodes=max_barcodes,
+        )
+    else:
+        reporter = BaseReport(
+            rname, fname, flowcell_barcode=record.flowcell, lane_number=record.lane
+        )
+    if qc:
+        reporter.qc = QcStats()
+    return fbase, reporter
+
+
+class BufferBudget:
+    """Shares a memory budget between the write buffers of the writers of a
+    split. Each writer buffers its records up to its share of the budget,
+    which follows its share of the bytes written so far, and then hands them
+    to its compressor in one large write. As soon as the buffers of all of the
+    writers are over the budget, the largest ones are flushed until they fit.
+    The records queued for writer threads (see `ThreadedWriter`) are part of
+    the budget too. The budget can be shared by writers that write in
+    different threads."""
+
+    def __init__(self, max_bytes, min_buffer=MIN_BUFFER_SIZE):
+        """
+        Constructor.
+
+        :param max_bytes: the maximum number of bytes buffered by all writers
+        :param min_buffer: the buffer size of the writers with little traffic,
+        as long as the budget has room for one per writer
+        """
+        self.max_bytes = max_bytes
+        self.min_buffer = min_buffer
+        self.writers = 0
+        self.used = 0
+        self.queued = 0
+        self.peak = 0
+        self.flushes = 0
+        self._total = 0
+        # The bytes in the buffer of each writer
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def register(self, writer):
+        """Add a writer sharing the budget"""
+        with self._lock:
+            self.writers += 1
+            self._buffers[writer] = 0
+
+    def limit(self, traffic):
+        """Get the buffer size of a writer that buffered `traffic` bytes"""
+        share = self.max_bytes * traffic // max(self._total, 1)
+        return max(share, min(self.min_buffer, self.max_bytes // max(self.writers, 1)))
+
+    def add(self, writer, traffic, size):
+        """
+        Add the bytes of a write to the buffer of a writer.
+
+        :param writer: the writer
+        :param traffic: the bytes buffered by the writer so far, with these
+        :param size: the bytes of the write
+        :return: the writers that should flush their buffers: the writer if its
+        buffer is full, and the writers with the largest buffers if the budget
+        is exceeded
+        """
+        with self._lock:
+            self.used += size
+            self._total += size
+            self._buffers[writer] += size
+            self.peak = max(self.peak, self.used)
+            flush = []
+            if self._buffers[writer] >= self.limit(traffic):
+                flush.append(writer)
+            excess = self.used - self.max_bytes
+            if excess > 0:
+                buffers = self._buffers
+                for other in sorted(buffers, key=buffers.get, reverse=True):
+                    if excess <= 0 or not buffers[other]:
+                        break
+                    if other not in flush:
+                        flush.append(other)
+                    excess -= buffers[other]
+            return flush
+
+    def release(self, writer, size):
+        """Remove the bytes of the flushed buffer of a writer"""
+        with self._lock:
+            self.used -= size
+            self._buffers[writer] -= size
+            self.flushes += 1
+
+    def queue(self, size):
+        """Add the bytes of records queued for a writer thread"""
+        with self._lock:
+            self.used += size
+            self.queued += size
+            self.peak = max(self.peak, self.used)
+
+    def dequeue(self, size):
+        """Remove the bytes of records taken off the queue of a writer thread,
+        before they are written"""
+        with self._lock:
+            self.used -= size
+            self.queued -= size
+
+    def __str__(self):
+        return "{0} of {1} buffered by {2} writers, {3} queued (peak {4})".format(
+            format_size(self.used),
+            format_size(self.max_bytes),
+            self.writers,
+            format_size(self.queued),
+            format_size(self.peak),
+        )
 
 
 class FastqWriter:
     """Base Fastq writer class"""
 
-    def __init__(self, fname, **kwargs):
+    def __init__(
+        self,
+        fname,
+        threads=1,
+        executor=None,
+        metrics=None,
+        append=False,
+        checksums=DEFAULT_CHECKSUMS,
+        codec=None,
+        budget=None,
+        **kwargs
+    ):
+        """
+        Constructor.
+
+        :param fname: the output file path
+        :param threads: if greater than 1, outputs are compressed by this many
+        threads, e.g. gzip outputs in parallel blocks
+        :param executor: a shared executor for the parallel gzip compression
+        :param metrics: a `StageMetrics` object to record the time spent
+        compressing and writing
+        :param append: if True, the output is not opened until the first write
+        and is then appended to, like a suspended writer
+        :param checksums: the checksums of the compressed output to compute
+        while it is written, any of `CHECKSUMS`
+        :param codec: the `Codec` of the output; by default it is gzip
+        compressed if it ends in .gz and uncompressed otherwise
+        :param budget: a `BufferBudget` that sizes the buffer of the records
+        written before they are compressed; without one, records are
+        compressed as they are written
+        """
+        if codec is None:
+            codec = GzipCodec() if fname.endswith(".gz") else Codec()
         self.fname = fname
-        self.fobj = (
-            gzip.open(self.fname, mode="wb", compresslevel=6)
-            if self.fname.endswith(".gz")
-            else open(self.fname, "wb")
-        )
-        self.f = io.BufferedWriter(self.fobj)
+        self.codec = codec
+        self.threads = threads
+        self.executor = executor
+        self.metrics = NULL_METRICS if metrics is None else metrics
+        self.checksums = OutputChecksums(checksums)
+        self.output_bytes = 0
+        self.f = None
+        self.budget = budget
+        self._buffer = []
+        self._buffered = 0
+        self._traffic = 0
+        # The buffer may be flushed by the thread of another writer sharing
+        # the budget
+        self._buffer_lock = threading.Lock()
+        if budget is not None:
+            budget.register(self)
+        if not append:
+            self._open("wb")
+        elif os.path.exists(fname):
+            self.checksums.update_from_file(fname)
 
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+    def _open(self, mode):
+        self.raw = open(self.fname, mode)
+        if self.metrics is not NULL_METRICS:
+            self.raw = TimedFile(
+                self.raw, self.metrics, counter="compressed_output_bytes"
+            )
+        self.raw = ChecksumFile(self.raw, self.checksums)
+        self.fobj = self.codec.open(
+            self.raw,
+            self.fname,
+            mode=mode,
+            threads=self.threads,
+            executor=self.executor,
+        )
+        self.f = io.BufferedWriter(self.fobj)
+
+    @property
+    def suspended(self):
+        return self.f is None
+
+    def suspend(self):
+        """Close the output file to release its file descriptor and compressor.
+        A compressed output ends its current gzip member or zstd frame; the
+        next write reopens the file in append mode and starts a new one."""
+        self._close()
+
     def __iadd__(self, record):
-        self.f.write(bytes(record))
+        if self.f is None:
+            self._open("ab")
+        data = bytes(record)
+        self._write(data)
+        self.output_bytes += len(data)
         return self
 
-    def close(self):
+    def _write(self, data):
+        if self.budget is None:
+            self.f.write(data)
+            return
+        with self._buffer_lock:
+            self._buffer.append(data)
+            self._buffered += len(data)
+            self._traffic += len(data)
+            flush = self.budget.add(self, self._traffic, len(data))
+        for writer in flush:
+            writer.flush_buffer()
+
+    def flush_buffer(self):
+        """Hand the buffered records to the compressor in one write"""
+        with self._buffer_lock:
+            if not self._buffer:
+                return
+            data = self._buffer[0]
+            if len(self._buffer) > 1:
+                data = b"".join(self._buffer)
+            self._buffer = []
+            self.f.write(data)
+            self.budget.release(self, self._buffered)
+            self._buffered = 0
+
+    def write_records(self, records, data=None):
+        """
+        Write a list of records with a single write call.
+
+        :param records: the list of records
+        :param data: the raw bytes of the records if they are already joined,
+        e.g. a run of records sliced from the input
+        """
+        if self.f is None:
+            self._open("ab")
+        with self.metrics.stage("compress"):
+            if data is None:
+                data = b"".join(map(bytes, records))
+            self._write(data)
+        self.output_bytes += len(data)
+        self.metrics.count("output_bytes", len(data))
+
+    def _close(self):
+        if self.f is None:
+            return
+        with self.metrics.stage("compress"):
+            self.flush_buffer()
         self.f.flush()
         self.fobj.close()
+        if self.fobj is not self.raw:
+            self.raw.close()
+        self.f = None
+
+    def close(self):
+        self._close()
+
+
+class WriterPool:
+    """Limits the number of writers with an open output file. When a writer
+    that is not open is used and the limit is reached, the least recently
+    used writers are suspended (see `FastqWriter.suspend`)."""
+
+    def __init__(self, writers, max_open=None):
+        """
+        Constructor.
+
+        :param writers: the dictionary of writers by key
+        :param max_open: the maximum number of open writers, or None for no limit
+        """
+        self.writers = writers
+        self.max_open = max_open
+        self.suspended = 0
+        self._open = collections.OrderedDict()
+
+    def reset(self):
+        """Forget the open writers, after all of them were suspended"""
+        self._open.clear()
+
+    def use(self, key):
+        """Mark the writer of a key, which may not be created yet, as the most
+        recently used one and make room for it to be open"""
+        if not self.max_open:
+            return
+        if key in self._open:
+            self._open.move_to_end(key)
+            return
+        while len(self._open) >= self.max_open:
+            lru, _ = self._open.popitem(last=False)
+            self.writers[lru].suspend()
+            self.suspended += 1
+        self._open[key] = True
 
 
 class FastqWriterWithReport(FastqWriter):
     """Writer class with a report"""
 
-    def __init__(self, fname, reporter, **kwargs):
+    def __init__(self, fname, reporter, write_report=True, **kwargs):
         super().__init__(fname, **kwargs)
         self.reporter = reporter
+        self.write_report = write_report
 
     @classmethod
-    def from_record_and_prefix(cls, record, prefix):
-        report_cls = ReportWithBarcodes if hasattr(record, "index") else BaseReport
-        fbase = "{0}{1}_R{2}".format(prefix, record.read_key, record.read_pair)
-        fname = "{0}.fq.gz".format(fbase)
-        rname = "{0}.report.json".format(fbase)
-        return cls(
-            fname,
-            report_cls(
-                rname, fname, flowcell_barcode=record.flowcell, lane_number=record.lane
-            ),
+    def from_record_and_prefix(
+        cls,
+        record,
+        prefix,
+        part=None,
+        max_barcodes=None,
+        qc=False,
+        codec=None,
+        **kwargs
+    ):
+        """
+        Create the writer for the read group of a record.
+
+        :param record: the first record of the read group
+        :param prefix: the output prefix
+        :param part: if not None, write to a part file that is merged into the
+        output later; the report is then not written on close
+        :param max_barcodes: if set, the barcode frequencies are approximated
+        keeping at most this many barcodes
+        :param qc: if True, QC statistics of the records are added to the report
+        :param codec: the `Codec` of the output, gzip by default
+        """
+        codec = GzipCodec() if codec is None else codec
+        fbase, reporter = create_report(
+            record, prefix, max_barcodes=max_barcodes, qc=qc, extension=codec.extension
+        )
+        if part is None:
+            return cls(reporter._fastq_filename, reporter, codec=codec, **kwargs)
+        pname = "{0}.part{1}{2}".format(fbase, part, codec.extension)
+        return cls(pname, reporter, write_report=False, codec=codec, **kwargs)
+
+    @classmethod
+    def from_report(cls, reporter, codec=None, **kwargs):
+        """Create the writer that appends to the output of an existing report,
+        e.g. one restored from a checkpoint"""
+        codec = GzipCodec() if codec is None else codec
+        if not reporter._fastq_filename.endswith(codec.extension):
+            raise ValueError(
+                "Output {0} was not written with codec {1}".format(
+                    reporter._fastq_filename, codec.name
+                )
+            )
+        writer = cls(
+            reporter._fastq_filename, reporter, append=True, codec=codec, **kwargs
+        )
+        writer.output_bytes = reporter.uncompressed_bytes or 0
+        return writer
+
+    def _update_report(self):
+        self.reporter.set_output(
+            self.output_bytes, self.checksums.size, self.checksums.to_dict()
         )
 
     def __iadd__(self, record):
         self.reporter += record
-        self.f.write(bytes(record))
-        return self
+        if self.reporter.qc is not None:
+            self.reporter.qc.add(bytes(record))
+        return super().__iadd__(record)
+
+    def suspend(self):
+        super().suspend()
+        self._update_report()
+
+    def write_records(self, records, data=None):
+        with self.metrics.stage("report"):
+            self.reporter.add_records(records)
+        if self.reporter.qc is not None:
+            with self.metrics.stage("qc"):
+                if data is None:
+                    data = b"".join(map(bytes, records))
+                self.reporter.qc.add(data)
+        super().write_records(records, data)
 
     def close(self):
         super().close()
-        self.reporter.write_to_json()
+        self._update_report()
+        if self.write_report:
+            self.reporter.write_to_json()
+
+
+class ReportWriter:
+    """Writer class that only updates a report and writes no fastq, used to
+    scan fastq files"""
+
+    fname = None
+
+    def __init__(self, reporter, write_report=True, metrics=None, **kwargs):
+        """
+        Constructor.
+
+        :param reporter: the report of the read group
+        :param write_report: if True, the report is written on close
+        :param metrics: a `StageMetrics` object to record the time spent
+        updating the report
+        """
+        self.reporter = reporter
+        self.write_report = write_report
+        self.metrics = NULL_METRICS if metrics is None else metrics
+
+    @classmethod
+    def from_record_and_prefix(
+        cls, record, prefix, part=None, max_barcodes=None, **kwargs
+    ):
+        """
+        Create the report writer for the read group of a record. The report
+        of a range `part` is merged later and is not written on close.
+        """
+        _, reporter = create_report(record, prefix, max_barcodes=max_barcodes)
+        return cls(reporter, write_report=part is None, **kwargs)
+
+    @classmethod
+    def from_report(cls, reporter, **kwargs):
+        """Create the report writer of an existing report"""
+        return cls(reporter, **kwargs)
+
+    def __iadd__(self, record):
+        self.reporter += record
+        return self
+
+    def write_records(self, records, data=None):
+        with self.metrics.stage("report"):
+            self.reporter.add_records(records)
+
+    def suspend(self):
+        pass
+
+    def close(self):
+        if self.write_report:
+            self.reporter.write_to_json()
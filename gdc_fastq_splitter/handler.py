@@ -1,86 +1,1188 @@
 """Module containing top-level functions for parsing and splitting
 the fastq files.
 """
+import cProfile
+import functools
+import json
 import multiprocessing
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from gdc_fastq_splitter.utils import get_logger
-from gdc_fastq_splitter.fastq.reader import FastqReader
-from gdc_fastq_splitter.fastq.writer import FastqWriterWithReport
-from gdc_fastq_splitter.fastq.illumina import infer_fastq_type
+from gdc_fastq_splitter.utils import format_size, get_logger
+from gdc_fastq_splitter.manifest import get_summary_filename, read_manifest
+from gdc_fastq_splitter.checkpoint import Checkpoint, CHECKPOINT_INTERVAL
+from gdc_fastq_splitter.options import SplitOptions
+from gdc_fastq_splitter.metrics import (
+    NULL_METRICS,
+    StageMetrics,
+    iter_timed,
+    write_metrics_json,
+)
+from gdc_fastq_splitter.progress import (
+    NULL_PROGRESS,
+    PROGRESS_INTERVAL,
+    ProgressReporter,
+    SharedProgress,
+)
+from gdc_fastq_splitter.pipeline import (
+    BackgroundConsumer,
+    BackgroundIterator,
+    ThreadedWriter,
+)
+from gdc_fastq_splitter.fastq.reader import (
+    FastqReader,
+    FastqBlockReader,
+    iter_batches,
+)
+from gdc_fastq_splitter.fastq.compression import (
+    STDIN,
+    is_seekable_file,
+    open_fastq,
+    peek_line,
+    pipe_errors,
+)
+from gdc_fastq_splitter.fastq.pairs import (
+    iter_interleaved_batches,
+    iter_mate_batches,
+)
+from gdc_fastq_splitter.fastq.runs import RunIndex, find_runs
+from gdc_fastq_splitter.fastq.validate import RecordValidator
+from gdc_fastq_splitter.fastq.ranges import (
+    plan_fastq_ranges,
+    iter_file_range,
+    iter_bgzf_range,
+)
+from gdc_fastq_splitter.fastq.writer import (
+    BufferBudget,
+    FastqWriterWithReport,
+    OutputChecksums,
+    ReportWriter,
+    WriterPool,
+)
+from gdc_fastq_splitter.fastq.illumina import (
+    get_fastq_type,
+    infer_fastq_type,
+    ReadKeyResolver,
+)
 
 
-def process_fastq(
-    input_file, output_prefix, logger_name="fastq_processing", log_itvl=1000000
-):
+def open_writer(record, output_prefix, options, pipeline=False, **kwargs):
+    """
+    Create the writer of the read group of a record.
+
+    :param record: the first record of the read group
+    :param output_prefix: output prefix
+    :param options: the `SplitOptions` of the split; with `scan_only`, the
+    writer only updates the report
+    :param pipeline: if True, the writer writes in its own thread
+    :param kwargs: passed to the writer, e.g. the `part` and `budget`
+    """
+    writer_cls = ReportWriter if options.scan_only else FastqWriterWithReport
+    writer = writer_cls.from_record_and_prefix(
+        record,
+        output_prefix,
+        threads=options.threads,
+        max_barcodes=options.max_barcodes,
+        checksums=options.checksums,
+        qc=options.qc,
+        codec=options.codec,
+        **kwargs
+    )
+    return ThreadedWriter(writer) if pipeline else writer
+
+
+class BatchSplitter:
+    """Splits batches of records into separate readgroup level fastq files,
+    one batch at a time, e.g. to hand each batch on once it is written (see
+    `split_batches` and `api.FastqSplitter`). The writers are in `writers` by
+    read key and the number of records split is in `count`."""
+
+    def __init__(
+        self,
+        output_prefix,
+        ibase,
+        logger,
+        options=None,
+        pipeline=False,
+        part=None,
+        resolver=None,
+        metrics=None,
+        run_index=None,
+        checkpoint=None,
+        progress=None,
+        validator=None,
+        sink=None,
+    ):
+        """
+        Constructor.
+
+        :param output_prefix: output prefix
+        :param ibase: the basename of the input used in logs
+        :param logger: the logger to use
+        :param options: the `SplitOptions` of the split, whose `max_memory` is
+        the budget of the write buffers of this split alone. With `scan_only`,
+        only the reports are updated from the headers of the `FastqBatch`
+        objects and no fastq is written
+        :param pipeline: if True, each writer writes in its own thread
+        :param part: if not None, write to part files that are merged later
+        :param resolver: a `ReadKeyResolver` used to get the read keys from the
+        headers of `FastqBatch` objects instead of from each record
+        :param metrics: a `StageMetrics` object to record the time spent per
+        stage
+        :param run_index: a `RunIndex` the runs of read keys of `FastqBatch`
+        objects are added to
+        :param checkpoint: a `Checkpoint` that is saved periodically; if it was
+        loaded, the split continues with its reports and counts, and the
+        batches must start at its offset
+        :param progress: a `ProgressReporter` the records and bytes split are
+        added to, which logs the progress at a time interval instead of every
+        `log_itvl` records
+        :param validator: a `RecordValidator` that checks each `FastqBatch`
+        :param sink: an `api.Sink` that creates the writer of each read group
+        instead of `open_writer`
+        """
+        self.options = options = SplitOptions() if options is None else options
+        self.output_prefix = output_prefix
+        self.ibase = ibase
+        self.logger = logger
+        self.pipeline = pipeline
+        self.part = part
+        self.resolver = resolver
+        self.metrics = metrics
+        self.run_index = run_index
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.validator = validator
+        self.open_writer = open_writer if sink is None else sink.open_writer
+        threads = options.threads
+        self.executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        self.budget = None
+        if options.max_memory and not options.scan_only:
+            self.budget = BufferBudget(options.max_memory)
+        self.count = 0
+        self.offset = 0
+        self.writers = {}
+        self.pool = WriterPool(self.writers, max_open=options.max_open_files)
+        if checkpoint is not None:
+            self.count = checkpoint.record_count
+            self.offset = checkpoint.offset
+            writer_cls = ReportWriter if options.scan_only else FastqWriterWithReport
+            for key, reporter in checkpoint.reports().items():
+                writer = writer_cls.from_report(
+                    reporter,
+                    threads=threads,
+                    executor=self.executor,
+                    metrics=metrics,
+                    checksums=options.checksums,
+                    codec=options.codec,
+                    budget=self.budget,
+                )
+                self.writers[key] = ThreadedWriter(writer) if pipeline else writer
+
+    def add(self, batch):
+        """
+        Split a batch of records.
+
+        :param batch: a list or `FastqBatch` of records
+        :return: the list of (read key, start, end) tuples of the record
+        indexes of the runs of read keys of a `FastqBatch` with a `resolver`
+        """
+        options = self.options
+        stage = (NULL_METRICS if self.metrics is None else self.metrics).stage
+        writers = self.writers
+        runs = []
+        if self.validator is not None:
+            with stage("validate"):
+                self.validator.add(batch)
+        with stage("parse"):
+            # The records and the byte ranges of the runs of each read key
+            groups = {}
+            if self.resolver is None:
+                for record in batch:
+                    group = groups.get(record.read_key)
+                    if group is None:
+                        groups[record.read_key] = ([record], None)
+                    else:
+                        group[0].append(record)
+            else:
+                keys = list(map(self.resolver, batch.headers))
+                starts = batch.starts
+                runs = find_runs(keys)
+                for key, start, end in runs:
+                    if self.run_index is not None:
+                        self.run_index.add(
+                            key, starts[end] - starts[start], end - start
+                        )
+                    records = batch.header_records(start, end)
+                    group = groups.get(key)
+                    if group is None:
+                        group = groups[key] = (records, [])
+                    else:
+                        group[0].extend(records)
+                    if not options.scan_only:
+                        group[1].append(batch.data[starts[start] : starts[end]])
+
+        for key, (records, chunks) in groups.items():
+            self.pool.use(key)
+            if key not in writers:
+                self.logger.info(
+                    "Found read key {0} in fastq {1}".format(key, self.ibase)
+                )
+                writers[key] = self.open_writer(
+                    records[0],
+                    self.output_prefix,
+                    options,
+                    pipeline=self.pipeline,
+                    part=self.part,
+                    executor=self.executor,
+                    metrics=self.metrics,
+                    budget=self.budget,
+                )
+                if writers[key].fname is not None:
+                    self.logger.info(
+                        "Output file for read key {0} in fastq {1} is {2}".format(
+                            key, self.ibase, writers[key].fname
+                        )
+                    )
+            writers[key].write_records(records, b"".join(chunks) if chunks else None)
+
+        last_count = self.count
+        self.count += len(batch)
+        if self.progress is not None:
+            nbytes = batch.starts[-1] - batch.starts[0] if self.resolver else 0
+            reported = self.progress.add(len(batch), nbytes)
+        else:
+            log_itvl = options.log_itvl
+            reported = self.count // log_itvl != last_count // log_itvl
+            if reported:
+                self.logger.info(
+                    "Processed {0} records from {1}".format(self.count, self.ibase)
+                )
+        if reported and self.budget is not None:
+            self.logger.info(
+                "Write buffers of {0}: {1}".format(self.ibase, self.budget)
+            )
+        if self.checkpoint is not None:
+            self.offset += batch.end
+            interval = self.checkpoint.interval
+            if self.count // interval != last_count // interval:
+                self.checkpoint.save(
+                    writers, self.offset, self.count, run_index=self.run_index
+                )
+                self.pool.reset()
+                self.logger.info(
+                    "Saved checkpoint of {0} at {1} records".format(
+                        self.ibase, self.count
+                    )
+                )
+        return runs
+
+    def close(self):
+        """Close the writers, which writes their reports"""
+        try:
+            for key in self.writers:
+                self.writers[key].close()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+    def log_summary(self):
+        """Log how often the outputs were suspended and their buffers flushed"""
+        options = self.options
+        metrics = self.metrics
+        pool = self.pool
+        if pool.suspended:
+            self.logger.info(
+                "Suspended outputs {0} times to keep at most {1} open for {2}".format(
+                    pool.suspended, options.max_open_files, self.ibase
+                )
+            )
+            if metrics is not None:
+                metrics.count("suspended_writers", pool.suspended)
+        budget = self.budget
+        if budget is not None:
+            self.logger.info(
+                "Flushed write buffers {0} times for {1}, using at most {2} of {3}".format(
+                    budget.flushes,
+                    self.ibase,
+                    format_size(budget.peak),
+                    format_size(options.max_memory),
+                )
+            )
+            if metrics is not None:
+                metrics.count("buffer_max_bytes", options.max_memory)
+                metrics.count("buffer_peak_bytes", budget.peak)
+                metrics.count("buffer_flushes", budget.flushes)
+
+
+def split_batches(batches, output_prefix, ibase, logger, options=None, **kwargs):
+    """
+    Splits batches of records into separate readgroup level fastq files.
+
+    :param batches: iterable of lists or `FastqBatch` objects of records
+    :param output_prefix: output prefix
+    :param ibase: the basename of the input used in logs
+    :param logger: the logger to use
+    :param options: the `SplitOptions` of the split
+    :param kwargs: the other arguments of `BatchSplitter`, e.g. the
+    `resolver`, `metrics` or `checkpoint`
+    :return: a tuple containing the closed writers by read key and total counts
+    """
+    splitter = BatchSplitter(output_prefix, ibase, logger, options=options, **kwargs)
+    try:
+        for batch in batches:
+            splitter.add(batch)
+    finally:
+        splitter.close()
+    splitter.log_summary()
+    return (splitter.writers, splitter.count)
+
+
+def process_fastq(input_file, output_prefix, options=None):
     """
     Processes the provided fastq file and splits into 1 or more separate
     readgroup level fastq files.
 
+    A checkpointed split (`checkpoint_interval` or `resume`) is processed
+    serially. The ranges of `processes` share the `max_memory` budget, and
+    their progress is merged and reported by this process. A resumed split
+    only validates the records after its checkpoint. With `from_run_index`,
+    the fastq is split serially by copying the runs of its run index (see
+    `split_run_index`).
+
     :param input_file: input fastq file path
     :param output_prefix: output prefix
-    :param loggger_name: name of the logger created
-    :param log_itvl: print log every N records
+    :param options: the `SplitOptions` of the split
     :return: a tuple containing dictionary of report and total counts
     """
-    logger = get_logger(logger_name)
+    options = SplitOptions() if options is None else options
+    start = (time.perf_counter(), time.process_time())
+    metrics = StageMetrics() if options.metrics_json else None
+    logger = get_logger(options.logger_name)
     ibase = os.path.basename(input_file)
     logger.info("Processing fastq: {0}".format(ibase))
 
-    fq_cls = infer_fastq_type(input_file)
-    logger.info("Inferred fastq class {0} in fastq {1}".format(fq_cls[0], ibase))
+    processes = options.processes
+    checkpoint = None
+    if options.checkpoint_interval or options.resume:
+        if not is_seekable_file(input_file):
+            raise ValueError(
+                "Can not checkpoint fastq {0}, which is not a regular file".format(
+                    ibase
+                )
+            )
+        checkpoint = Checkpoint(
+            get_output_filename(output_prefix, input_file, ".checkpoint.json"),
+            input_file,
+            interval=options.checkpoint_interval or CHECKPOINT_INTERVAL,
+        )
+        if options.resume and checkpoint.load():
+            logger.info(
+                "Resuming fastq {0} from its checkpoint at {1} records".format(
+                    ibase, checkpoint.record_count
+                )
+            )
+        else:
+            # The outputs of an older checkpoint are about to be overwritten
+            checkpoint.remove()
+        if processes > 1:
+            logger.info(
+                "Fastq {0} is processed serially to save checkpoints".format(ibase)
+            )
+            processes = 1
 
-    reader = FastqReader(input_file, record_cls=fq_cls[1])
-    count = 0
+    progress = NULL_PROGRESS
+    if options.progress_interval or options.heartbeat:
+        progress = ProgressReporter(
+            ibase,
+            logger,
+            interval=options.progress_interval or PROGRESS_INTERVAL,
+            total_bytes=os.path.getsize(input_file)
+            if is_seekable_file(input_file)
+            else None,
+            heartbeat=get_output_filename(output_prefix, input_file, ".progress.json")
+            if options.heartbeat
+            else None,
+        )
+
+    with progress as progress:
+        if options.from_run_index:
+            data, count, fq_cls = split_run_index(
+                input_file, output_prefix, options, metrics=metrics, progress=progress
+            )
+            if options.metrics_json:
+                write_process_metrics(input_file, output_prefix, metrics, data, start)
+            if options.scan_only:
+                write_scan_summary(input_file, output_prefix, fq_cls[0], data, count)
+            return data, count
+
+        if options.raw and processes > 1:
+            ranges = plan_fastq_ranges(input_file, processes)
+            if ranges is not None:
+                fq_cls = infer_fastq_type(input_file)
+                logger.info(
+                    "Inferred fastq class {0} in fastq {1}".format(fq_cls[0], ibase)
+                )
+                results = process_fastq_ranges(
+                    input_file,
+                    output_prefix,
+                    fq_cls[1].raw_record_cls,
+                    ranges,
+                    options.share_memory(processes),
+                    progress=progress,
+                )
+                if options.validate:
+                    results[4].check(logger)
+                if options.metrics_json:
+                    write_process_metrics(
+                        input_file, output_prefix, results[2], results[0], start
+                    )
+                if options.scan_only:
+                    write_scan_summary(
+                        input_file, output_prefix, fq_cls[0], *results[:2]
+                    )
+                if options.write_run_index:
+                    write_runs(input_file, output_prefix, results[3], results[0])
+                return results[:2]
+            logger.info(
+                "Fastq {0} is not an uncompressed or BGZF file; processing it "
+                "serially".format(ibase)
+            )
+
+        raw = (
+            options.raw
+            or options.scan_only
+            or options.write_run_index
+            or options.validate
+            or checkpoint is not None
+        )
+        threads = options.threads
+        # The input is only opened once, so it can be stdin or a named pipe, and
+        # its first line is replayed after the type is inferred from it
+        fobj = open_fastq(
+            input_file,
+            threads=threads if raw else 1,
+            on_read=progress and progress.read,
+        )
+        try:
+            line, fobj = peek_line(fobj)
+            fq_cls = get_fastq_type(line.decode("utf-8"))
+        except BaseException:
+            fobj.close()
+            raise
+        logger.info("Inferred fastq class {0} in fastq {1}".format(fq_cls[0], ibase))
+
+        run_index = None
+        if options.write_run_index:
+            run_index = RunIndex() if checkpoint is None else checkpoint.run_index()
+        validator = None
+        if options.validate:
+            validator = RecordValidator(ibase)
+            if checkpoint is not None:
+                validator.record_count = checkpoint.record_count
+        resolver = None
+        if raw:
+            resolver = ReadKeyResolver(fq_cls[1].seqid_cls, strict=options.strict)
+            reader = FastqBlockReader(
+                input_file,
+                record_cls=fq_cls[1].raw_record_cls,
+                block_size=options.block_size,
+                metrics=metrics,
+                fobj=fobj,
+            )
+            if checkpoint is not None and checkpoint.offset:
+                reader.skip(checkpoint.offset)
+            batches = reader.batches()
+        else:
+            reader = FastqReader(input_file, record_cls=fq_cls[1], fobj=fobj)
+            batches = ([record] for record in reader)
+
+        try:
+            writers, count = split_batches(
+                batches,
+                output_prefix,
+                ibase,
+                logger,
+                options,
+                pipeline=raw and threads > 1 and not options.scan_only,
+                resolver=resolver,
+                metrics=metrics,
+                run_index=run_index,
+                checkpoint=checkpoint,
+                progress=progress,
+                validator=validator,
+            )
+        finally:
+            reader.close()
+
+        logger.info(
+            "Processed a total of {0} records from {1} and found {2} read keys".format(
+                count, ibase, len(writers)
+            )
+        )
+        if validator is not None:
+            validator.check(logger)
+
+        data = {key: writers[key].reporter.to_dict() for key in writers}
+        if options.metrics_json:
+            write_process_metrics(input_file, output_prefix, metrics, data, start)
+        if options.scan_only:
+            write_scan_summary(input_file, output_prefix, fq_cls[0], data, count)
+        if options.write_run_index:
+            write_runs(input_file, output_prefix, run_index, data)
+        if checkpoint is not None:
+            checkpoint.remove()
+        return (data, count)
+
+
+def get_output_filename(output_prefix, input_file, suffix):
+    """
+    Get the name of a per input output file, e.g. the metrics JSON, which is
+    the output prefix followed by the input basename without its extensions,
+    or by 'stdin' for stdin.
+    """
+    base = "stdin" if input_file == STDIN else os.path.basename(input_file)
+    for ext in (".gz", ".fastq", ".fq"):
+        if base.endswith(ext):
+            base = base[: -len(ext)]
+    return "{0}{1}{2}".format(output_prefix, base, suffix)
+
+
+def write_process_metrics(input_file, output_prefix, metrics, data, start):
+    """
+    Write the metrics JSON of one processed fastq.
+
+    :param metrics: the `StageMetrics` of the run
+    :param data: the dictionary of reports by read key, or a list of them
+    whose record counts are added up, e.g. for both mates of an interleaved
+    fastq
+    :param start: the (wall, cpu) time the run started at
+    """
+    read_keys = {}
+    for reports in data if isinstance(data, list) else [data]:
+        for key in reports:
+            count = reports[key]["metadata"]["record_count"]
+            read_keys[key] = read_keys.get(key, 0) + count
+    metrics_dict = metrics.to_dict()
+    counters = metrics_dict.pop("counters")
+    metrics_dict.update(
+        {
+            "fastq_filename": os.path.basename(input_file),
+            "wall_seconds": round(time.perf_counter() - start[0], 6),
+            "cpu_seconds": round(time.process_time() - start[1], 6),
+            "input": {
+                # The size of stdin and named pipes is not known
+                "compressed_bytes": os.path.getsize(input_file)
+                if is_seekable_file(input_file)
+                else None,
+                "uncompressed_bytes": counters.get("input_bytes", 0),
+            },
+            "output": {
+                "compressed_bytes": counters.get("compressed_output_bytes", 0),
+                "uncompressed_bytes": counters.get("output_bytes", 0),
+            },
+            "read_keys": read_keys,
+        }
+    )
+    if "buffer_max_bytes" in counters:
+        metrics_dict["buffers"] = {
+            "max_bytes": counters["buffer_max_bytes"],
+            "peak_bytes": counters["buffer_peak_bytes"],
+            "flushes": counters["buffer_flushes"],
+        }
+    fname = get_output_filename(output_prefix, input_file, ".metrics.json")
+    write_metrics_json(fname, metrics_dict)
+    get_logger("fastq_processing").info("Wrote metrics to {0}".format(fname))
+
+
+def write_scan_summary(input_file, output_prefix, fastq_type, data, count, label=""):
+    """
+    Write the summary JSON of a scanned fastq.
+
+    :param fastq_type: the name of the inferred fastq type
+    :param data: the dictionary of reports by read key
+    :param count: the total number of records
+    :param label: added to the file name, e.g. the mate of an interleaved fastq
+    """
+    summary = {
+        "fastq_filename": os.path.basename(input_file),
+        "fastq_type": fastq_type,
+        "record_count": count,
+        "read_groups": {key: data[key]["metadata"] for key in data},
+    }
+    fname = get_output_filename(output_prefix, input_file, label + ".summary.json")
+    with open(fname, "wt") as o:
+        json.dump(summary, o, indent=2, sort_keys=True)
+    get_logger("fastq_processing").info("Wrote summary to {0}".format(fname))
+
+
+def write_runs(input_file, output_prefix, run_index, data):
+    """
+    Write the `RunIndex` of a fastq to its sidecar TSV file, with the barcode
+    frequencies of its reports, so it can be split again from the index (see
+    `split_run_index`).
+
+    :param data: the dictionary of reports by read key
+    """
+    fname = get_output_filename(output_prefix, input_file, ".runs.tsv")
+    run_index.barcodes = {
+        key: data[key]["barcode_frequency"]
+        for key in data
+        if "barcode_frequency" in data[key]
+    }
+    run_index.write(fname, input_file if is_seekable_file(input_file) else None)
+    get_logger("fastq_processing").info(
+        "Wrote {0} runs of read keys to {1}".format(len(run_index), fname)
+    )
+
+
+def split_run_index(input_file, output_prefix, options, metrics=None, progress=None):
+    """
+    Splits a fastq by the runs of read keys of its run index, written by an
+    earlier split with `write_run_index`, without parsing its records. Each
+    run is copied to the output of its read key as one range of bytes. Only
+    the sequence identifier of the first record of each read key is parsed,
+    for the name of its output; the record counts and barcode frequencies of
+    the reports come from the index. The index must have been written for
+    this very fastq, with the same size and modification time.
+
+    :param input_file: input fastq file path, which must be a regular file
+    :param output_prefix: output prefix, which is also the prefix of the index
+    :param options: the `SplitOptions` of the split
+    :param metrics: a `StageMetrics` object to record the time spent per stage
+    :param progress: a `ProgressReporter` the records and bytes copied are
+    added to
+    :return: a tuple containing the dictionary of report, the total counts and
+    the inferred fastq type
+    """
+    logger = get_logger(options.logger_name)
+    ibase = os.path.basename(input_file)
+    if not is_seekable_file(input_file):
+        raise ValueError(
+            "Can not split fastq {0} from its run index, as it is not a regular "
+            "file".format(ibase)
+        )
+    fname = get_output_filename(output_prefix, input_file, ".runs.tsv")
+    run_index = RunIndex.read(fname, input_file)
+    logger.info(
+        "Splitting fastq {0} from the {1} runs of read keys of {2}".format(
+            ibase, len(run_index), fname
+        )
+    )
+
+    fobj = open_fastq(
+        input_file, threads=options.threads, on_read=progress and progress.read
+    )
+    try:
+        line, fobj = peek_line(fobj)
+        fq_cls = get_fastq_type(line.decode("utf-8"))
+    except BaseException:
+        fobj.close()
+        raise
+    reader = FastqBlockReader(
+        input_file,
+        record_cls=fq_cls[1].raw_record_cls,
+        block_size=options.block_size,
+        metrics=metrics,
+        fobj=fobj,
+    )
+    threads = options.threads
+    scan_only = options.scan_only
+    executor = ThreadPoolExecutor(threads) if threads > 1 else None
+    budget = (
+        BufferBudget(options.max_memory)
+        if options.max_memory and not scan_only
+        else None
+    )
+    stage = (NULL_METRICS if metrics is None else metrics).stage
+    record_counts = run_index.record_counts()
     writers = {}
+    pool = WriterPool(writers, max_open=options.max_open_files)
     try:
-        for record in reader:
-            count += 1
-            if count % log_itvl == 0:
-                logger.info("Processed {0} records from {1}".format(count, ibase))
-
-            key = record.read_key
-            if key not in writers:
-                logger.info("Found read key {0} in fastq {1}".format(key, ibase))
-                writer = FastqWriterWithReport.from_record_and_prefix(
-                    record, output_prefix
+        for key, offset, byte_length, _, record_count in run_index:
+            if scan_only and key in writers:
+                # The reports only need the first record of each read key
+                with stage("decompress"):
+                    remaining = byte_length
+                    while remaining:
+                        chunk = reader.f.read(min(options.block_size, remaining))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                if progress is not None:
+                    progress.add(record_count, byte_length)
+                continue
+            with stage("decompress"):
+                data = reader.f.read(byte_length)
+            if len(data) != byte_length or not data.endswith(b"\n"):
+                raise ValueError(
+                    "Run index {0} does not match fastq {1}".format(fname, ibase)
                 )
-                logger.info(
-                    "Output file for read key {0} in fastq {1} is {2}".format(
-                        key, ibase, writer.fname
+            pool.use(key)
+            if key not in writers:
+                header = data[: data.index(b"\n")].rstrip(b"\r")
+                record = reader.record_cls(b"", header)
+                if record.read_key != key:
+                    raise ValueError(
+                        "Record at byte {0} of fastq {1} is not of read key {2} "
+                        "of run index {3}".format(offset, ibase, key, fname)
                     )
+                writer = open_writer(
+                    record,
+                    output_prefix,
+                    options,
+                    executor=executor,
+                    metrics=metrics,
+                    budget=budget,
                 )
+                writer.reporter.record_counts = record_counts[key]
+                if key in run_index.barcodes:
+                    writer.reporter.barcode_frequency.update(run_index.barcodes[key])
                 writers[key] = writer
-            writers[key] += record
-
+            writers[key].write_records([], None if scan_only else data)
+            if progress is not None:
+                progress.add(record_count, byte_length)
     finally:
         reader.close()
         for key in writers:
             writers[key].close()
+        if executor is not None:
+            executor.shutdown()
+
+    logger.info(
+        "Copied a total of {0} records from {1} to {2} read keys".format(
+            run_index.record_count, ibase, len(writers)
+        )
+    )
+    data = {key: writers[key].reporter.to_dict() for key in writers}
+    return data, run_index.record_count, fq_cls
+
+
+def process_fastq_range(
+    input_file, output_prefix, record_cls, part, start, end, options, progress=None
+):
+    """
+    Processes one range of the provided fastq file (see `plan_fastq_ranges`)
+    and splits it into readgroup level part files.
+
+    :param record_cls: the raw record class of the fastq
+    :param part: the index of the range
+    :param start: the start of the range
+    :param end: the end of the range
+    :param options: the `SplitOptions` of the split
+    :param progress: a `SharedProgress` the records and bytes of the range are
+    added to, so the parent process reports the progress of all of the
+    ranges. If not set, the progress of the range is logged on its own.
+    :return: a tuple containing a dictionary of the part file and report of
+    each read key, the total counts, the `StageMetrics` if `metrics_json`, the
+    `RunIndex` of the range if `write_run_index` and the `RecordValidator` of
+    the range if `validate`
+    """
+    metrics = StageMetrics() if options.metrics_json else None
+    run_index = RunIndex() if options.write_run_index else None
+    logger = get_logger(options.logger_name)
+    ibase = "{0} (part {1})".format(os.path.basename(input_file), part)
+    if progress is None and (options.progress_interval or options.heartbeat):
+        progress = ProgressReporter(
+            ibase, logger, interval=options.progress_interval or PROGRESS_INTERVAL
+        )
+    block_size = options.block_size
+    on_read = progress and progress.read
+    if isinstance(start, tuple):
+        blocks = iter_bgzf_range(
+            input_file, start, end, block_size=block_size, on_read=on_read
+        )
+    else:
+        blocks = iter_file_range(
+            input_file, start, end, block_size=block_size, on_read=on_read
+        )
+    if metrics is not None:
+        blocks = iter_timed(blocks, metrics)
+
+    threads = options.threads
+    if threads > 1:
+        blocks = BackgroundIterator(blocks, name="reader-" + ibase)
+    validator = RecordValidator(ibase) if options.validate else None
+    try:
+        writers, count = split_batches(
+            iter_batches(
+                blocks, record_cls=record_cls, fname=input_file, metrics=metrics
+            ),
+            output_prefix,
+            ibase,
+            logger,
+            options,
+            pipeline=threads > 1 and not options.scan_only,
+            part=part,
+            resolver=ReadKeyResolver(record_cls.seqid_cls, strict=options.strict),
+            metrics=metrics,
+            run_index=run_index,
+            progress=progress,
+            validator=validator,
+        )
+    finally:
+        if threads > 1:
+            blocks.close()
+
+    return (
+        {key: (writers[key].fname, writers[key].reporter) for key in writers},
+        count,
+        metrics,
+        run_index,
+        validator,
+    )
+
+
+# The `SharedProgress` of the ranges processed by a worker process
+_range_progress = None
+
+
+def init_range_worker(progress):
+    """Initializer of the worker processes of `process_fastq_ranges`. Shared
+    memory can only be handed to the workers when they start."""
+    global _range_progress
+    _range_progress = progress
+
+
+def do_process_range(args):
+    """Helper function for multiprocessing map"""
+    return process_fastq_range(*args, progress=_range_progress)
+
+
+def process_fastq_ranges(
+    input_file, output_prefix, record_cls, ranges, options, progress=None
+):
+    """
+    Processes the ranges of the provided fastq file in parallel, then merges
+    the part files and reports of each read key in the order of the ranges.
+
+    :param record_cls: the raw record class of the fastq
+    :param ranges: the list of ranges from `plan_fastq_ranges`
+    :param options: the `SplitOptions` of each range, which are processed by
+    `processes` processes
+    :param progress: a `ProgressReporter` the counts of all of the ranges are
+    reported to while they are processed
+    :return: a tuple containing dictionary of report, total counts, the
+    merged `StageMetrics`, the merged `RunIndex` and the merged
+    `RecordValidator` of the ranges
+    """
+    logger = get_logger(options.logger_name)
+    ibase = os.path.basename(input_file)
+    processes = options.processes
+    logger.info(
+        "Splitting fastq {0} into {1} ranges using {2} processes".format(
+            ibase, len(ranges), processes
+        )
+    )
+
+    tasks = [
+        (input_file, output_prefix, record_cls, part, start, end, options)
+        for part, (start, end) in enumerate(ranges)
+    ]
+    shared = None if progress is None else SharedProgress()
+    pool = multiprocessing.Pool(
+        processes, initializer=init_range_worker, initargs=(shared,)
+    )
+    try:
+        result = pool.map_async(do_process_range, tasks)
+        done = shared is None
+        while not done:
+            # Poll more often than the interval so no report is skipped, and
+            # once more when the ranges are done for the final totals
+            result.wait(min(progress.interval, 1.0))
+            done = result.ready()
+            progress.update(*shared.totals())
+        results = result.get()
+    finally:
+        pool.close()
+        pool.join()
+
+    count = 0
+    merged = {}
+    metrics = StageMetrics()
+    run_index = RunIndex()
+    # The record numbers of the ranges follow each other too
+    validator = RecordValidator(ibase)
+    for data, part_count, part_metrics, part_index, part_validator in results:
+        count += part_count
+        if part_metrics is not None:
+            metrics.merge(part_metrics)
+        if part_validator is not None:
+            validator.merge(part_validator)
+        if part_index is not None:
+            # The ranges are contiguous, so their runs follow each other
+            run_index.extend(part_index)
+        for key, (fname, reporter) in data.items():
+            if key not in merged:
+                merged[key] = (reporter, [fname])
+            else:
+                merged[key][0].merge(reporter)
+                merged[key][1].append(fname)
+
+    for key, (reporter, parts) in merged.items():
+        if parts[0] is None:
+            # Scanned ranges have reports but no part files
+            reporter.write_to_json()
+            continue
+        fname = os.path.join(os.path.dirname(parts[0]), reporter.fastq_filename)
+        logger.info(
+            "Merging {0} parts of read key {1} in fastq {2} into {3}".format(
+                len(parts), key, ibase, fname
+            )
+        )
+        # Concatenated gzip members are still a valid gzip file. The first
+        # part is only read to compute the checksums of the merged output.
+        checksums = OutputChecksums(options.checksums)
+        os.replace(parts[0], fname)
+        if checksums.hashes or checksums.crc32 is not None:
+            checksums.update_from_file(fname)
+        else:
+            checksums.size = os.path.getsize(fname)
+        with open(fname, "ab") as o:
+            for part in parts[1:]:
+                with open(part, "rb") as fh:
+                    for chunk in iter(lambda: fh.read(4 * 1024 * 1024), b""):
+                        checksums.update(chunk)
+                        o.write(chunk)
+                os.remove(part)
+        reporter.set_output(
+            reporter.uncompressed_bytes, checksums.size, checksums.to_dict()
+        )
+        reporter.write_to_json()
 
     logger.info(
         "Processed a total of {0} records from {1} and found {2} read keys".format(
-            count, ibase, len(writers)
+            count, ibase, len(merged)
         )
     )
 
-    return ({key: writers[key].reporter.to_dict() for key in writers}, count)
+    return (
+        {key: merged[key][0].to_dict() for key in merged},
+        count,
+        metrics,
+        run_index,
+        validator,
+    )
+
+
+def process_paired_fastq(input_a, input_b, output_prefix, options=None):
+    """
+    Processes a pair of mate fastq files in lockstep in one process. Both
+    fastqs are read in batches that are cut to the same records, the read
+    names of the mates are checked record by record (see `iter_mate_batches`)
+    and each mate is split into its R1 or R2 outputs in its own thread, so the
+    two are compressed in parallel. A mismatch stops the split right away.
+
+    If `input_b` is None, `input_a` is an interleaved fastq where each first
+    mate is followed by its second mate (see `iter_interleaved_batches`),
+    which is split into the same outputs in a single pass. Its metrics JSON
+    covers both mates, and its scan summaries are written for each mate.
+
+    The `max_memory` budget of the write buffers is shared by both mates. The
+    progress of each input is reported on its own, like `process_fastq` does,
+    and the records of each mate are validated on their own with `validate`.
+    The `processes`, `profile` and checkpoint options do not apply.
+
+    :param input_a: the first mate fastq file path, or the interleaved one
+    :param input_b: the second mate fastq file path, or None
+    :param output_prefix: output prefix
+    :param options: the `SplitOptions` of the split
+    :return: a tuple containing a tuple of the dictionary of reports and the
+    total count of each mate, like `process_fastq` returns
+    """
+    options = SplitOptions() if options is None else options
+    start = (time.perf_counter(), time.process_time())
+    logger = get_logger(options.logger_name)
+    interleaved = input_b is None
+    if interleaved:
+        if options.write_run_index:
+            raise ValueError("Run indexes can not be written for interleaved fastqs")
+        inputs = (input_a,)
+        ibase = os.path.basename(input_a)
+        logger.info("Processing interleaved fastq: {0}".format(ibase))
+        mates = ("{0} R1".format(ibase), "{0} R2".format(ibase))
+    else:
+        inputs = (input_a, input_b)
+        mates = tuple(os.path.basename(input_file) for input_file in inputs)
+        logger.info("Processing paired fastqs in lockstep: {0}, {1}".format(*mates))
+    metrics = [StageMetrics() if options.metrics_json else None for _ in inputs]
+    progresses = [None for _ in inputs]
+    if options.progress_interval or options.heartbeat:
+        progresses = [
+            ProgressReporter(
+                os.path.basename(input_file),
+                logger,
+                interval=options.progress_interval or PROGRESS_INTERVAL,
+                total_bytes=os.path.getsize(input_file)
+                if is_seekable_file(input_file)
+                else None,
+                heartbeat=get_output_filename(
+                    output_prefix, input_file, ".progress.json"
+                )
+                if options.heartbeat
+                else None,
+            )
+            for input_file in inputs
+        ]
+        for progress in progresses:
+            progress.finish("running")
+
+    readers = []
+    consumers = []
+    status = "failed"
+    try:
+        for input_file, progress, input_metrics in zip(inputs, progresses, metrics):
+            fobj = open_fastq(
+                input_file, threads=options.threads, on_read=progress and progress.read
+            )
+            try:
+                line, fobj = peek_line(fobj)
+                fq_cls = get_fastq_type(line.decode("utf-8"))
+            except BaseException:
+                fobj.close()
+                raise
+            logger.info(
+                "Inferred fastq class {0} in fastq {1}".format(
+                    fq_cls[0], os.path.basename(input_file)
+                )
+            )
+            reader = FastqBlockReader(
+                input_file,
+                record_cls=fq_cls[1].raw_record_cls,
+                block_size=options.block_size,
+                metrics=input_metrics,
+                fobj=fobj,
+            )
+            readers.append((reader, fq_cls))
+
+        run_indexes = []
+        validators = [
+            RecordValidator(mate) if options.validate else None for mate in mates
+        ]
+        mate_options = options.share_memory(2)
+        for i, mate in enumerate(mates):
+            # Both mates of an interleaved fastq share its reader, metrics and
+            # progress
+            fq_cls = readers[0 if interleaved else i][1]
+            run_indexes.append(RunIndex() if options.write_run_index else None)
+            split = functools.partial(
+                split_batches,
+                output_prefix=output_prefix,
+                ibase=mate,
+                logger=logger,
+                options=mate_options,
+                pipeline=options.threads > 1 and not options.scan_only,
+                resolver=ReadKeyResolver(fq_cls[1].seqid_cls, strict=options.strict),
+                metrics=metrics[0 if interleaved else i],
+                run_index=run_indexes[i],
+                progress=progresses[0 if interleaved else i],
+                validator=validators[i],
+            )
+            consumers.append(BackgroundConsumer(split, name="split-" + mate))
+
+        if interleaved:
+            pairs = iter_interleaved_batches(readers[0][0].batches(), fname=ibase)
+        else:
+            pairs = iter_mate_batches(
+                readers[0][0].batches(), readers[1][0].batches(), fnames=mates
+            )
+        for batch_a, batch_b in pairs:
+            consumers[0].put(batch_a)
+            consumers[1].put(batch_b)
+        status = "done"
+    finally:
+        # The outputs written so far are closed even if the mates do not match
+        results = []
+        errors = []
+        for consumer in consumers:
+            try:
+                results.append(consumer.close())
+            except BaseException as e:
+                errors.append(e)
+        for reader in readers:
+            reader[0].close()
+        for progress in progresses:
+            if progress is not None:
+                progress.finish("failed" if errors else status)
+        if errors:
+            raise errors[0]
+
+    paired_results = []
+    for mate, (writers, count) in zip(mates, results):
+        logger.info(
+            "Processed a total of {0} records from {1} and found {2} read "
+            "keys".format(count, mate, len(writers))
+        )
+        paired_results.append(
+            ({key: writers[key].reporter.to_dict() for key in writers}, count)
+        )
+    for validator in validators:
+        if validator is not None:
+            validator.check(logger)
+
+    for i, (input_file, (_, fq_cls)) in enumerate(zip(inputs, readers)):
+        mate_results = paired_results if interleaved else [paired_results[i]]
+        if options.metrics_json:
+            write_process_metrics(
+                input_file,
+                output_prefix,
+                metrics[i],
+                [data for data, _ in mate_results],
+                start,
+            )
+        if options.scan_only:
+            for label, (data, count) in zip(("_R1", "_R2"), mate_results):
+                write_scan_summary(
+                    input_file,
+                    output_prefix,
+                    fq_cls[0],
+                    data,
+                    count,
+                    label=label if interleaved else "",
+                )
+        if options.write_run_index:
+            write_runs(input_file, output_prefix, run_indexes[i], mate_results[0][0])
+    return tuple(paired_results)
 
 
 def do_process(args):
-    """Helper function for multiprocessing map"""
-    return process_fastq(*args)
+    """Helper function for multiprocessing map. If the `profile` option is
+    set, the run is profiled with cProfile and the stats are dumped next to
+    the reports."""
+    input_file, output_prefix, options = args
+    if not options.profile:
+        return process_fastq(input_file, output_prefix, options)
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(process_fastq, input_file, output_prefix, options)
+    finally:
+        fname = get_output_filename(output_prefix, input_file, ".pstats")
+        profiler.dump_stats(fname)
+        get_logger("fastq_processing").info("Wrote profile to {0}".format(fname))
 
 
-def main_single(args):
+def main_single(args, options):
     """
     Main handler for single fastq files. It will check the returned metrics
     to make sure everything matches.
+
+    :param options: the `SplitOptions` of the split
     """
     logger = get_logger("single_handler")
-    results = process_fastq(args.fastq_a, args.output_prefix)
+    results = do_process((args.fastq_a, args.output_prefix, options))
     logger.info("Finished splitting; Validating results")
+    validate_single(results, logger)
+
+
+def validate_single(results, logger):
+    """
+    Check that the records of a single fastq were all written out.
 
+    :param results: the results of `process_fastq`
+    :param logger: the logger to log errors to
+    """
     input_total = results[1]
     data = results[0]
     counts = 0
@@ -97,20 +1199,51 @@ def main_single(args):
         raise ValueError(msg)
 
 
-def main_paired(args):
+def main_paired(args, options):
     """
     Main handler for paired fastq files. This will use 2 processors to parse
-    each fastq separately in parallel and aggregate the returned metrics to
-    make sure everything matches.
+    each fastq separately in parallel (or all `processes` for each fastq in
+    turn) and aggregate the returned metrics to make sure everything matches.
+    With the `lockstep` option, or for an interleaved fastq, both mates are
+    split together by `process_paired_fastq` instead.
+
+    :param options: the `SplitOptions` of the split
     """
     logger = get_logger("paired_handler")
-    pool = multiprocessing.Pool(2)
-    tasks = [(i, args.output_prefix) for i in [args.fastq_a, args.fastq_b]]
-    results = pool.map(do_process, tasks)
+    if getattr(args, "lockstep", False) or getattr(args, "interleaved", False):
+        results = process_paired_fastq(
+            args.fastq_a, args.fastq_b, args.output_prefix, options
+        )
+        logger.info("Finished splitting; Validating results")
+        validate_paired(*results, logger=logger)
+        return
+
+    # Pool workers can not start pools of their own, so each fastq is split
+    # across all of the processes in turn. Stdin is only readable in this
+    # process.
+    serial = options.processes > 1 or STDIN in (args.fastq_a, args.fastq_b)
+    if not serial:
+        # Both fastqs are split at the same time
+        options = options.share_memory(2)
+    tasks = [(i, args.output_prefix, options) for i in [args.fastq_a, args.fastq_b]]
+    if serial:
+        results = [do_process(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(2)
+        results = pool.map(do_process, tasks)
     logger.info("Finished splitting; Validating results")
+    validate_paired(*results, logger=logger)
 
-    # Validate the results
-    result_a, result_b = results
+
+def validate_paired(result_a, result_b, logger):
+    """
+    Check that the records of a pair of mate fastqs were all written out to
+    the same read groups.
+
+    :param result_a: the results of `process_fastq` for the first mate
+    :param result_b: the results of `process_fastq` for the second mate
+    :param logger: the logger to log errors to
+    """
     result_a_input_total = result_a[1]
     result_b_input_total = result_b[1]
 
@@ -172,16 +1305,163 @@ def main_paired(args):
         raise ValueError(msg)
 
 
+def do_manifest_task(args):
+    """Helper function for the multiprocessing map of `main_manifest`. Errors
+    are returned instead of raised, so one bad fastq does not stop the rest."""
+    index, input_file, output_prefix, options = args
+    try:
+        return (
+            index,
+            input_file,
+            do_process((input_file, output_prefix, options)),
+            None,
+        )
+    except Exception as e:
+        get_logger("manifest_handler").exception(
+            "Failed to split fastq {0}".format(input_file)
+        )
+        return (index, input_file, None, "{0}: {1}".format(type(e).__name__, e))
+
+
+def get_manifest_workers(args):
+    """Get the size of the shared worker pool of a manifest, which is
+    `processes` if it was set or the number of CPUs"""
+    processes = getattr(args, "processes", 1)
+    return processes if processes > 1 else (os.cpu_count() or 1)
+
+
+def main_manifest(args, options):
+    """
+    Main handler for a manifest of single and paired fastqs (see
+    `read_manifest`). Every fastq is split by one shared pool of worker
+    processes, largest first so the longest ones do not start last, then each
+    entry is validated like `main_single` and `main_paired` do and a combined
+    summary JSON is written.
+
+    :param options: the `SplitOptions` of the split of each fastq
+    """
+    logger = get_logger("manifest_handler")
+    entries = read_manifest(args.manifest)
+    workers = get_manifest_workers(args)
+    # Each fastq is split by a single worker of the shared pool, which share
+    # the memory budget
+    options = options.replace(processes=1).share_memory(workers)
+
+    tasks = []
+    for index, entry in enumerate(entries):
+        for input_file in (entry["fastq_a"], entry["fastq_b"]):
+            if input_file is not None:
+                tasks.append((index, input_file, entry["output_prefix"], options))
+    sizes = {
+        task[1]: os.path.getsize(task[1]) if os.path.exists(task[1]) else 0
+        for task in tasks
+    }
+    tasks.sort(key=lambda task: sizes[task[1]], reverse=True)
+    logger.info(
+        "Splitting {0} fastqs of {1} manifest entries using {2} processes".format(
+            len(tasks), len(entries), workers
+        )
+    )
+
+    results = [{} for _ in entries]
+    errors = [None for _ in entries]
+    pool = multiprocessing.Pool(min(workers, max(len(tasks), 1)))
+    try:
+        for index, input_file, result, error in pool.imap_unordered(
+            do_manifest_task, tasks
+        ):
+            results[index][input_file] = result
+            if error is not None:
+                errors[index] = errors[index] or error
+    finally:
+        pool.close()
+        pool.join()
+    logger.info("Finished splitting; Validating results")
+
+    summary_entries = []
+    for index, entry in enumerate(entries):
+        mates = [entry["fastq_a"]]
+        if entry["fastq_b"] is not None:
+            mates.append(entry["fastq_b"])
+        if errors[index] is None:
+            try:
+                if len(mates) == 1:
+                    validate_single(results[index][mates[0]], logger)
+                else:
+                    validate_paired(
+                        *[results[index][mate] for mate in mates], logger=logger
+                    )
+            except ValueError as e:
+                errors[index] = str(e)
+
+        fastqs = []
+        for mate in mates:
+            result = results[index].get(mate)
+            fastqs.append(
+                {
+                    "fastq_filename": os.path.basename(mate),
+                    "record_count": None if result is None else result[1],
+                    "read_groups": {}
+                    if result is None
+                    else {key: result[0][key]["metadata"] for key in result[0]},
+                }
+            )
+        summary_entry = dict(entry)
+        summary_entry.update(
+            {
+                "status": "failed" if errors[index] else "ok",
+                "error": errors[index],
+                "fastqs": fastqs,
+            }
+        )
+        summary_entries.append(summary_entry)
+
+    failed = sum(1 for error in errors if error)
+    summary = {
+        "manifest": os.path.basename(args.manifest),
+        "entry_count": len(entries),
+        "fastq_count": len(tasks),
+        "failed_count": failed,
+        "record_count": sum(
+            fastq["record_count"] or 0
+            for entry in summary_entries
+            for fastq in entry["fastqs"]
+        ),
+        "entries": summary_entries,
+    }
+    fname = get_summary_filename(args.manifest)
+    with open(fname, "wt") as o:
+        json.dump(summary, o, indent=2, sort_keys=True)
+    logger.info("Wrote manifest summary to {0}".format(fname))
+
+    if failed:
+        msg = "{0} of {1} manifest entries failed".format(failed, len(entries))
+        logger.error(msg)
+        raise ValueError(msg)
+
+
 def main_handler(args):
-    """Main entrypoint to pass either for single end parsing or
-    paired end parsing.
+    """Main entrypoint to pass either for single end parsing, paired end
+    parsing or a manifest of both. The `SplitOptions` of the split are created
+    once from `args` and handed to the workers.
     """
     logger = get_logger("handler")
+    options = SplitOptions.from_args(args)
 
-    if args.fastq_b:
-        assert args.fastq_a != args.fastq_b
-        logger.info("Running in paired mode")
-        main_paired(args)
-    else:
-        logger.info("Running in single mode")
-        main_single(args)
+    # A compressor program that exits early must fail with its error instead
+    # of killing the split with SIGPIPE
+    with pipe_errors(options.codec):
+        if getattr(args, "manifest", None):
+            logger.info("Running in manifest mode")
+            main_manifest(args, options)
+        elif getattr(args, "interleaved", False):
+            assert not args.fastq_b
+            logger.info("Running in interleaved mode")
+            main_paired(args, options)
+        elif args.fastq_b:
+            assert args.fastq_a != args.fastq_b
+            logger.info("Running in paired mode")
+            main_paired(args, options)
+        else:
+            logger.info("Running in single mode")
+            main_single(args, options)
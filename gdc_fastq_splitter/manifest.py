@@ -0,0 +1,101 @@
+"""Module containing the manifest of a batch of fastq files to split. Each
+entry of the manifest is a single fastq or a pair of mate fastqs with the
+output prefix to split it to.
+"""
+import json
+import os
+
+from gdc_fastq_splitter.fastq.compression import STDIN
+
+MANIFEST_COLUMNS = ("fastq_a", "fastq_b", "output_prefix")
+
+
+def make_entry(fastq_a, fastq_b, output_prefix, where):
+    """
+    Create and check a manifest entry.
+
+    :param where: the location of the entry used in error messages
+    :return: a dictionary with the `MANIFEST_COLUMNS` of the entry
+    """
+    if not fastq_a or not output_prefix:
+        raise ValueError("Manifest {0} needs fastq_a and output_prefix".format(where))
+    if fastq_a == fastq_b:
+        raise ValueError("Manifest {0} has the same fastq twice".format(where))
+    if STDIN in (fastq_a, fastq_b):
+        raise ValueError("Manifest {0} can not read a fastq from stdin".format(where))
+    return {
+        "fastq_a": fastq_a,
+        "fastq_b": fastq_b or None,
+        "output_prefix": output_prefix,
+    }
+
+
+def read_manifest(fname):
+    """
+    Read a manifest of fastqs to split. A manifest ending in .json is a list
+    of objects and any other manifest is a TSV with a header, both with the
+    `MANIFEST_COLUMNS` of each entry; `fastq_b` is empty or null for single
+    fastqs. Blank lines and lines starting with # are skipped in TSVs.
+
+    :param fname: the manifest file path
+    :return: the list of entries
+    """
+    entries = []
+    if fname.endswith(".json"):
+        with open(fname, "rt") as fh:
+            items = json.load(fh)
+        if not isinstance(items, list):
+            raise ValueError("Manifest {0} is not a list of entries".format(fname))
+        for i, item in enumerate(items):
+            entries.append(
+                make_entry(
+                    item.get("fastq_a"),
+                    item.get("fastq_b"),
+                    item.get("output_prefix"),
+                    "{0} entry {1}".format(fname, i),
+                )
+            )
+        return entries
+
+    with open(fname, "rt") as fh:
+        lines = [
+            (i, line.rstrip("\r\n"))
+            for i, line in enumerate(fh, 1)
+            if line.strip() and not line.startswith("#")
+        ]
+    if not lines:
+        return entries
+    header = lines[0][1].split("\t")
+    missing = set(MANIFEST_COLUMNS).difference(header)
+    if missing:
+        raise ValueError(
+            "Manifest {0} is missing the columns {1}".format(
+                fname, ",".join(sorted(missing))
+            )
+        )
+    for i, line in lines[1:]:
+        values = line.split("\t")
+        if len(values) != len(header):
+            raise ValueError(
+                "Manifest {0} line {1} has {2} columns instead of {3}".format(
+                    fname, i, len(values), len(header)
+                )
+            )
+        row = dict(zip(header, values))
+        entries.append(
+            make_entry(
+                row["fastq_a"],
+                row["fastq_b"],
+                row["output_prefix"],
+                "{0} line {1}".format(fname, i),
+            )
+        )
+    return entries
+
+
+def get_summary_filename(fname):
+    """Get the name of the combined summary JSON of a manifest"""
+    base, ext = os.path.splitext(fname)
+    if ext not in (".json", ".tsv", ".txt"):
+        base = fname
+    return "{0}.summary.json".format(base)
@@ -0,0 +1,179 @@
+"""Module containing classes for profiling where the time goes while
+splitting fastq files.
+"""
+import io
+import json
+import threading
+import time
+
+thread_time = getattr(time, "thread_time", time.process_time)
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class NullMetrics:
+    """Metrics object that records nothing. Used when metrics are disabled so
+    callers do not have to check."""
+
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class StageMetrics:
+    """Accumulates the wall and CPU time spent in named stages, and counters.
+    Stages can be nested; the time of a nested stage is only counted for the
+    nested stage, not for the one around it. Stages that run in different
+    threads are added together, so their totals can exceed the wall time of
+    the run."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {"stages": self.stages, "counters": self.counters}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.stages = state["stages"]
+        self.counters = state["counters"]
+
+    def stage(self, name):
+        """Context manager timing a stage"""
+        return _Stage(self, name)
+
+    def add(self, name, wall, cpu, calls=1):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = [wall, cpu, calls]
+            else:
+                stage[0] += wall
+                stage[1] += cpu
+                stage[2] += calls
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        """Add the stages and counters of another metrics object"""
+        for name, (wall, cpu, calls) in other.stages.items():
+            self.add(name, wall, cpu, calls=calls)
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def to_dict(self):
+        return {
+            "stages": {
+                name: {
+                    "wall_seconds": round(wall, 6),
+                    "cpu_seconds": round(cpu, 6),
+                    "calls": calls,
+                }
+                for name, (wall, cpu, calls) in self.stages.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "child", "wall", "cpu")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        local = self.metrics._local
+        stack = getattr(local, "stack", None)
+        if stack is None:
+            stack = local.stack = []
+        stack.append(self)
+        self.child = [0.0, 0.0]
+        self.wall = time.perf_counter()
+        self.cpu = thread_time()
+        return self
+
+    def __exit__(self, *args):
+        wall = time.perf_counter() - self.wall
+        cpu = thread_time() - self.cpu
+        stack = self.metrics._local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child[0] += wall
+            stack[-1].child[1] += cpu
+        self.metrics.add(self.name, wall - self.child[0], cpu - self.child[1])
+        return False
+
+
+class TimedFile(io.RawIOBase):
+    """Wraps a writable binary file object to time the writes and count the
+    bytes written."""
+
+    def __init__(self, fileobj, metrics, stage="write", counter="output_bytes"):
+        super().__init__()
+        self.fileobj = fileobj
+        self.metrics = metrics
+        self.stage = stage
+        self.counter = counter
+
+    @property
+    def name(self):
+        return self.fileobj.name
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        with self.metrics.stage(self.stage):
+            self.fileobj.write(data)
+        self.metrics.count(self.counter, len(data))
+        return len(data)
+
+    def flush(self):
+        with self.metrics.stage(self.stage):
+            self.fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+        finally:
+            self.fileobj.close()
+
+
+def iter_timed(chunks, metrics, stage="decompress", counter="input_bytes"):
+    """Generator of the chunks of bytes of an iterable, timing how long each
+    chunk took to produce and counting the bytes"""
+    chunks = iter(chunks)
+    while True:
+        with metrics.stage(stage):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        metrics.count(counter, len(chunk))
+        yield chunk
+
+
+def write_metrics_json(fname, data):
+    """Write a metrics dictionary to a JSON file"""
+    with open(fname, "wt") as o:
+        json.dump(data, o, indent=2, sort_keys=True)
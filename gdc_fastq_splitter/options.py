@@ -0,0 +1,163 @@
+"""Module containing the options of a split. They are created once, e.g. from
+the CLI options in `main_handler`, and handed as a whole to the functions
+that split each fastq and to their worker processes.
+"""
+import copy
+
+from gdc_fastq_splitter.fastq.compression import DEFAULT_CODEC, get_codec
+from gdc_fastq_splitter.fastq.writer import DEFAULT_CHECKSUMS
+
+
+class SplitOptions:
+    """The options of how fastqs are split. Every option has a default, so
+    only the ones that differ need to be given."""
+
+    def __init__(
+        self,
+        logger_name="fastq_processing",
+        log_itvl=1000000,
+        raw=True,
+        block_size=4 * 1024 * 1024,
+        threads=1,
+        processes=1,
+        strict=False,
+        metrics_json=False,
+        profile=False,
+        max_barcodes=None,
+        max_open_files=None,
+        scan_only=False,
+        write_run_index=False,
+        from_run_index=False,
+        checkpoint_interval=None,
+        resume=False,
+        checksums=DEFAULT_CHECKSUMS,
+        qc=False,
+        codec=None,
+        max_memory=None,
+        progress_interval=None,
+        heartbeat=False,
+        validate=False,
+    ):
+        """
+        Constructor.
+
+        :param logger_name: name of the logger created
+        :param log_itvl: print log every N records
+        :param raw: if True, records are kept as raw bytes and are written out
+        without being decoded and re-encoded
+        :param block_size: number of bytes read from the input at a time when
+        `raw` is True
+        :param threads: number of threads shared by the writers to compress the
+        outputs in parallel blocks, and used to decompress BGZF inputs. When
+        greater than 1 the input is decompressed in background threads and, if
+        `raw` is True, each writer also runs in its own thread
+        :param processes: if greater than 1, uncompressed and BGZF inputs are
+        split into byte ranges that are processed by this many processes
+        :param strict: if True, fully parse and validate the sequence identifier
+        of every record instead of caching read keys by prefix
+        :param metrics_json: if True, write the time spent per stage, the bytes
+        in and out and the records per read key to a metrics JSON file
+        :param profile: if True, profile the split of each fastq with cProfile
+        (see `do_process`)
+        :param max_barcodes: if set, the barcode frequencies of the reports are
+        approximated with a Space-Saving counter keeping at most this many
+        barcodes
+        :param max_open_files: if set, at most this many outputs are kept open
+        at once; the least recently used ones end their gzip member, are closed
+        and are reopened in append mode when more records come
+        :param scan_only: if True, only the reports and a summary JSON of the
+        read groups are written, from the sequence identifiers alone; no fastq
+        is written or compressed
+        :param write_run_index: if True, write the runs of read keys with their
+        offsets and lengths in bytes and records to a sidecar TSV index
+        :param from_run_index: if True, split each fastq by copying the runs of
+        the index written by an earlier split with `write_run_index` instead of
+        parsing its records (see `split_run_index`)
+        :param checkpoint_interval: if set, save a checkpoint every this many
+        records; the input is then processed serially
+        :param resume: if True, resume from the last checkpoint, if there is
+        one, and keep saving checkpoints
+        :param checksums: the checksums of each compressed output to compute
+        while it is written and add to its report, any of md5, sha256 and crc32
+        :param qc: if True, add the read length distribution, quality and GC
+        content of the records of each read group to its report; requires numpy
+        :param codec: the `Codec` that compresses the outputs, gzip by default
+        :param max_memory: if set, the records written to the outputs are
+        buffered in at most this many bytes in total, and each output gets a
+        share of it that follows its share of the records
+        :param progress_interval: if set, log the progress every this many
+        seconds instead of every `log_itvl` records (see `ProgressReporter`)
+        :param heartbeat: if True, also write the progress to
+        <output_prefix><fastq basename>.progress.json
+        :param validate: if True, check every record (see `check_batch`) and
+        raise an error listing the invalid ones once the fastq is split
+        """
+        self.logger_name = logger_name
+        self.log_itvl = log_itvl
+        self.raw = raw
+        self.block_size = block_size
+        self.threads = threads
+        self.processes = processes
+        self.strict = strict
+        self.metrics_json = metrics_json
+        self.profile = profile
+        self.max_barcodes = max_barcodes
+        self.max_open_files = max_open_files
+        self.scan_only = scan_only
+        self.write_run_index = write_run_index
+        self.from_run_index = from_run_index
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        self.checksums = checksums
+        self.qc = qc
+        self.codec = codec
+        self.max_memory = max_memory
+        self.progress_interval = progress_interval
+        self.heartbeat = heartbeat
+        self.validate = validate
+
+    @classmethod
+    def from_args(cls, args):
+        """Create the options of the CLI options. The options missing from
+        `args` keep their defaults."""
+        return cls(
+            threads=getattr(args, "threads", 1),
+            processes=getattr(args, "processes", 1),
+            strict=getattr(args, "strict", False),
+            metrics_json=getattr(args, "metrics_json", False),
+            profile=getattr(args, "profile", False),
+            max_barcodes=getattr(args, "max_barcodes", None),
+            max_open_files=getattr(args, "max_open_files", None),
+            scan_only=getattr(args, "scan_only", False),
+            write_run_index=getattr(args, "write_run_index", False),
+            from_run_index=getattr(args, "from_run_index", False),
+            checkpoint_interval=getattr(args, "checkpoint_interval", None),
+            resume=getattr(args, "resume", False),
+            checksums=getattr(args, "checksums", DEFAULT_CHECKSUMS),
+            qc=getattr(args, "qc", False),
+            codec=get_codec(
+                getattr(args, "codec", DEFAULT_CODEC),
+                level=getattr(args, "compression_level", None),
+            ),
+            max_memory=getattr(args, "max_memory", None),
+            progress_interval=getattr(args, "progress_interval", None),
+            heartbeat=getattr(args, "heartbeat", False),
+            validate=getattr(args, "validate", False),
+        )
+
+    def replace(self, **changes):
+        """Get a copy of the options with some of them changed, e.g. the share
+        of the memory budget of a worker"""
+        for name in changes:
+            if not hasattr(self, name):
+                raise TypeError("Unknown split option {0}".format(name))
+        options = copy.copy(self)
+        options.__dict__.update(changes)
+        return options
+
+    def share_memory(self, workers):
+        """Get a copy of the options with the memory budget split between this
+        many workers that split at the same time"""
+        if not self.max_memory:
+            return self
+        return self.replace(max_memory=self.max_memory // workers)
@@ -0,0 +1,186 @@
+"""Module containing the threaded stages used to pipeline the splitting of
+fastq files. The stages are joined by bounded queues so the memory used stays
+fixed no matter how large the input is.
+"""
+import queue
+import threading
+
+QUEUE_SIZE = 4
+
+_DONE = object()
+_SUSPEND = object()
+
+
+class BackgroundIterator:
+    """Consumes an iterable in a background thread and hands its items over
+    through a bounded queue."""
+
+    def __init__(self, iterable, maxsize=QUEUE_SIZE, name="background-iterator"):
+        self._queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, args=(iterable,), name=name, daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    return
+        except BaseException as e:
+            self._error = e
+        self._put(_DONE)
+
+    def _put(self, item):
+        """Put an item on the queue unless the consumer stopped listening"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def close(self):
+        """Stop the background thread and wait for it to finish"""
+        self._stop.set()
+        self._thread.join()
+
+
+class BackgroundConsumer:
+    """Runs a function that consumes an iterable in a background thread, and
+    hands the items of the iterable over to it through a bounded queue. An
+    error raised by the function is raised again by the next `put` or by
+    `close`."""
+
+    def __init__(self, func, maxsize=QUEUE_SIZE, name="background-consumer"):
+        """
+        Constructor.
+
+        :param func: the function called with the iterable of the items put
+        :param maxsize: the maximum number of items waiting in the queue
+        :param name: the name of the thread
+        """
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._done = False
+        self.result = None
+        self._thread = threading.Thread(
+            target=self._run, args=(func,), name=name, daemon=True
+        )
+        self._thread.start()
+
+    def _items(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                self._done = True
+                return
+            yield item
+
+    def _run(self, func):
+        try:
+            self.result = func(self._items())
+        except BaseException as e:
+            self._error = e
+            # Keep taking items so `put` never blocks
+            while not self._done:
+                self._done = self._queue.get() is _DONE
+
+    def put(self, item):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def close(self):
+        """
+        Wait for the function to consume every item put and return.
+
+        :return: the value returned by the function
+        """
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.result
+
+
+class ThreadedWriter:
+    """Wraps a writer so its batches of records are reported, compressed and
+    written by a dedicated worker thread. Errors raised by the worker are
+    raised again in the calling thread. The raw bytes queued count in the
+    `BufferBudget` of the writer, if it has one."""
+
+    def __init__(self, writer, maxsize=QUEUE_SIZE):
+        self.writer = writer
+        self.budget = getattr(writer, "budget", None)
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="writer-{0}".format(writer.fname), daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def fname(self):
+        return self.writer.fname
+
+    @property
+    def reporter(self):
+        return self.writer.reporter
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                self._queue.task_done()
+                return
+            if self.budget is not None and item is not _SUSPEND and item[1]:
+                self.budget.dequeue(len(item[1]))
+            if self._error is None:
+                try:
+                    if item is _SUSPEND:
+                        self.writer.suspend()
+                    else:
+                        self.writer.write_records(*item)
+                except BaseException as e:
+                    self._error = e
+            self._queue.task_done()
+
+    def write_records(self, records, data=None):
+        if self._error is not None:
+            raise self._error
+        if self.budget is not None and data is not None:
+            self.budget.queue(len(data))
+        self._queue.put((records, data))
+
+    def suspend(self):
+        """Suspend the writer once the records queued before are written"""
+        self._queue.put(_SUSPEND)
+
+    def wait(self):
+        """Wait for the queued records to be written"""
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Wait for the queued records to be written and close the writer"""
+        self._queue.put(_DONE)
+        self._thread.join()
+        try:
+            if self._error is not None:
+                raise self._error
+        finally:
+            self.writer.close()
@@ -0,0 +1,217 @@
+"""Module containing the progress reporting of the splitting of a fastq file.
+The progress is logged at a time interval with the rates since the last
+report, and can be written to a heartbeat JSON file that schedulers poll.
+"""
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+PROGRESS_INTERVAL = 60.0
+
+
+class ProgressReporter:
+    """Tracks the records and bytes split from a fastq and logs the progress
+    every `interval` seconds: the records per second and the uncompressed
+    and compressed input bytes per second since the last report, and the
+    percent done and the ETA from the offset in the compressed input when
+    its size is known. Counts can be added from several threads, e.g. by the
+    two mates of an interleaved fastq."""
+
+    def __init__(
+        self,
+        name,
+        logger,
+        interval=PROGRESS_INTERVAL,
+        total_bytes=None,
+        heartbeat=None,
+        clock=time.monotonic,
+    ):
+        """
+        Constructor.
+
+        :param name: the name of the fastq used in logs
+        :param logger: the logger to log the progress to
+        :param interval: the number of seconds between reports
+        :param total_bytes: the size of the compressed input, if it is known
+        :param heartbeat: if set, the path of the JSON file the progress is
+        written to at each report
+        :param clock: the function returning the time in seconds
+        """
+        self.name = name
+        self.logger = logger
+        self.interval = interval
+        self.total_bytes = total_bytes
+        self.heartbeat = heartbeat
+        self.clock = clock
+        self.records = 0
+        self.input_bytes = 0
+        self.compressed_bytes = 0
+        self.start = clock()
+        self._last = (self.start, 0, 0, 0)
+        self._lock = threading.Lock()
+
+    def read(self, size):
+        """Add compressed bytes read from the input (see `CountingReader`)"""
+        self.compressed_bytes += size
+
+    def add(self, records, input_bytes=0):
+        """
+        Add split records and their uncompressed bytes, and report the
+        progress if the interval has passed.
+
+        :return: True if the progress was reported
+        """
+        with self._lock:
+            self.records += records
+            self.input_bytes += input_bytes
+            now = self.clock()
+            if now - self._last[0] < self.interval:
+                return False
+            progress = self.to_dict(now)
+        self.report(progress)
+        return True
+
+    def update(self, records, input_bytes, compressed_bytes):
+        """
+        Set the totals split so far, e.g. by worker processes (see
+        `SharedProgress`), and report the progress if the interval has passed.
+
+        :return: True if the progress was reported
+        """
+        with self._lock:
+            self.records = records
+            self.input_bytes = input_bytes
+            self.compressed_bytes = compressed_bytes
+        return self.add(0)
+
+    def to_dict(self, now=None, status="running"):
+        """Get the progress, with the rates since the last report, or the
+        average rates since the start once the split is done or failed"""
+        now = self.clock() if now is None else now
+        last_time, last_records, last_input, last_compressed = self._last
+        if status in ("done", "failed"):
+            last_time, last_records, last_input, last_compressed = (self.start, 0, 0, 0)
+        seconds = max(now - last_time, 1e-9)
+        elapsed = now - self.start
+        progress = {
+            "fastq_filename": self.name,
+            "status": status,
+            "time": time.time(),
+            "elapsed_seconds": round(elapsed, 3),
+            "records": self.records,
+            "input_bytes": self.input_bytes,
+            "compressed_input_bytes": self.compressed_bytes,
+            "records_per_second": round((self.records - last_records) / seconds, 1),
+            "input_bytes_per_second": round(
+                (self.input_bytes - last_input) / seconds, 1
+            ),
+            "compressed_input_bytes_per_second": round(
+                (self.compressed_bytes - last_compressed) / seconds, 1
+            ),
+            "total_bytes": self.total_bytes,
+            "percent": None,
+            "eta_seconds": None,
+        }
+        if self.total_bytes:
+            done = min(self.compressed_bytes / self.total_bytes, 1.0)
+            progress["percent"] = round(100 * done, 2)
+            if done > 0 and status == "running":
+                progress["eta_seconds"] = round(elapsed * (1 - done) / done, 1)
+        self._last = (now, self.records, self.input_bytes, self.compressed_bytes)
+        return progress
+
+    def report(self, progress):
+        """Log the progress and write it to the heartbeat file"""
+        message = (
+            "Progress of {0}: {1} records, {2:.0f} records/s, {3:.1f} MiB/s".format(
+                self.name,
+                progress["records"],
+                progress["records_per_second"],
+                progress["input_bytes_per_second"] / 2**20,
+            )
+        )
+        if progress["compressed_input_bytes"]:
+            message += " ({0:.1f} MiB/s compressed)".format(
+                progress["compressed_input_bytes_per_second"] / 2**20
+            )
+        if progress["percent"] is not None:
+            message += ", {0:.1f}% done".format(progress["percent"])
+        if progress["eta_seconds"] is not None:
+            message += ", ETA {0:.0f}s".format(progress["eta_seconds"])
+        self.logger.info(message)
+        if self.heartbeat is not None:
+            write_heartbeat(self.heartbeat, progress)
+
+    def __enter__(self):
+        self.finish("running")
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.finish("done" if exc_type is None else "failed")
+        return False
+
+    def finish(self, status="done"):
+        """Write the final progress to the heartbeat file, e.g. 'done' or
+        'failed'"""
+        if self.heartbeat is not None:
+            with self._lock:
+                progress = self.to_dict(status=status)
+            write_heartbeat(self.heartbeat, progress)
+
+
+class SharedProgress:
+    """Counts of the records and bytes split by worker processes, e.g. from
+    the byte ranges of a fastq, in shared memory. The workers add to them
+    like to a `ProgressReporter` and the parent process reports their totals
+    with `ProgressReporter.update`."""
+
+    def __init__(self):
+        # The records, the uncompressed and the compressed input bytes
+        self.counts = multiprocessing.Array("q", 3)
+
+    def read(self, size):
+        """Add compressed bytes read from the input"""
+        with self.counts.get_lock():
+            self.counts[2] += size
+
+    def add(self, records, input_bytes=0):
+        """
+        Add split records and their uncompressed bytes.
+
+        :return: False, as the progress is reported by the parent process
+        """
+        with self.counts.get_lock():
+            self.counts[0] += records
+            self.counts[1] += input_bytes
+        return False
+
+    def totals(self):
+        """Get the records, uncompressed and compressed input bytes added by
+        all of the workers"""
+        with self.counts.get_lock():
+            return tuple(self.counts)
+
+
+class NullProgress:
+    """Context manager used when the progress is not reported, so callers do
+    not have to check"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_PROGRESS = NullProgress()
+
+
+def write_heartbeat(fname, progress):
+    """Write a progress dictionary to a JSON file, replacing the previous one
+    at once so a reader never sees a partial file"""
+    tmp = fname + ".tmp"
+    with open(tmp, "wt") as o:
+        json.dump(progress, o, indent=2, sort_keys=True)
+    os.replace(tmp, fname)
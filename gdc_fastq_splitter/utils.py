@@ -26,3 +26,17 @@ def get_logger(name):
             logger.addHandler(get_handler())
             logger.propagate = False
     return logger
+
+
+def format_size(nbytes):
+    """Format a number of bytes with the largest binary unit it has at least
+    one of, e.g. '512 B' or '1.5 MiB', so small sizes do not round to 0"""
+    for unit in ("B", "KiB", "MiB"):
+        if nbytes < 1024:
+            break
+        nbytes /= 1024
+    else:
+        unit = "GiB"
+    if unit == "B":
+        return "{0} B".format(nbytes)
+    return "{0:.1f} {1}".format(nbytes, unit)
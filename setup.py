@@ -17,6 +17,9 @@ setup(
         "gdc_fastq_splitter",
         "gdc_fastq_splitter.fastq",
     ],
+    extras_require = {
+        "qc": ["numpy"],
+    },
     classifiers = [
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Developers",
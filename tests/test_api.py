@@ -0,0 +1,142 @@
+import unittest
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from gdc_fastq_splitter.api import (
+    CallbackSink,
+    FastqSplitter,
+    FileSink,
+    MemorySink,
+    split_fastq,
+)
+from gdc_fastq_splitter.fastq.compression import get_codec
+from gdc_fastq_splitter.handler import process_fastq
+from gdc_fastq_splitter.options import SplitOptions
+from tests.utils import random_fastq_bytes
+
+
+class TestFastqSplitter(unittest.TestCase):
+    """Test the streaming API"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = random_fastq_bytes(1000)
+        self.fname = os.path.join(self.tmpdir, "input.fastq")
+        with open(self.fname, "wb") as o:
+            o.write(self.data)
+        self.prefix = os.path.join(self.tmpdir, "out_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def expected(self, options=None):
+        """The outputs and reports of `process_fastq`"""
+        reports, _ = process_fastq(self.fname, self.prefix, options)
+        outputs = {}
+        for key in reports:
+            with gzip.open("{0}{1}_R1.fq.gz".format(self.prefix, key), "rb") as fh:
+                outputs[key] = fh.read()
+        return outputs, reports
+
+    def test_iterate(self):
+        """Runs of records are yielded in order with live reports"""
+        outputs, reports = self.expected()
+        splitter = FastqSplitter(
+            io.BytesIO(self.data), options=SplitOptions(block_size=4096)
+        )
+        joined = []
+        for key, batch in splitter:
+            self.assertEqual(len(set(record.read_key for record in batch)), 1)
+            self.assertEqual(next(iter(batch)).read_key, key)
+            self.assertGreaterEqual(splitter.reports[key].record_counts, len(batch))
+            joined.append(batch.tobytes())
+        self.assertEqual(b"".join(joined), self.data)
+        self.assertEqual(splitter.record_count, 1000)
+        self.assertEqual(splitter.fastq_type[0], "IlluminaFastqRecord")
+        self.assertEqual(
+            {key: report.record_counts for key, report in splitter.reports.items()},
+            {
+                key: report["metadata"]["record_count"]
+                for key, report in reports.items()
+            },
+        )
+
+    def test_memory_sink(self):
+        outputs, _ = self.expected()
+        sink = MemorySink()
+        reports = split_fastq(
+            self.fname, sink=sink, options=SplitOptions(block_size=1000)
+        )
+        self.assertEqual(list(reports), list(outputs))
+        for key in outputs:
+            self.assertEqual(sink.getvalue(key), outputs[key])
+
+        # Compression is detected from the magic bytes, whatever the name
+        fname = os.path.join(self.tmpdir, "compressed.fastq")
+        with gzip.open(fname, "wb") as o:
+            o.write(self.data)
+        sink = MemorySink()
+        split_fastq(fname, sink=sink)
+        for key in outputs:
+            self.assertEqual(sink.getvalue(key), outputs[key])
+
+    def test_callback_sink(self):
+        outputs, _ = self.expected()
+        received = {}
+
+        def callback(key, data):
+            received[key] = received.get(key, b"") + data
+
+        split_fastq(io.BytesIO(self.data), sink=CallbackSink(callback))
+        self.assertEqual(received, outputs)
+
+    def test_file_sink(self):
+        """The file sink writes the same outputs and reports as the CLI"""
+        options = SplitOptions(checksums=("md5", "crc32"))
+        outputs, reports = self.expected(options)
+        for name in os.listdir(self.tmpdir):
+            if name.startswith("out_"):
+                os.remove(os.path.join(self.tmpdir, name))
+
+        for codec in (None, get_codec("none")):
+            result = split_fastq(
+                self.fname,
+                sink=FileSink(),
+                output_prefix=self.prefix,
+                options=options.replace(codec=codec, max_open_files=2),
+            )
+            for key, reporter in result.items():
+                with open(reporter._report_filename, "rt") as fh:
+                    self.assertEqual(json.load(fh), reporter.to_dict())
+                if codec is None:
+                    self.assertEqual(reporter.to_dict(), reports[key])
+                    with gzip.open(reporter._fastq_filename, "rb") as fh:
+                        self.assertEqual(fh.read(), outputs[key])
+                else:
+                    self.assertTrue(reporter._fastq_filename.endswith("_R1.fq"))
+                    with open(reporter._fastq_filename, "rb") as fh:
+                        self.assertEqual(fh.read(), outputs[key])
+
+    def test_stop_early(self):
+        """Closing the iteration early still closes the writers"""
+        splitter = FastqSplitter(self.fname, sink=FileSink(), output_prefix=self.prefix)
+        batches = iter(splitter)
+        key, _ = next(batches)
+        batches.close()
+        reporter = splitter.reports[key]
+        self.assertTrue(os.path.exists(reporter._report_filename))
+        with gzip.open(reporter._fastq_filename, "rb") as fh:
+            self.assertTrue(fh.read())
+
+    def test_empty(self):
+        splitter = FastqSplitter(io.BytesIO(b""))
+        self.assertEqual(list(splitter), [])
+        self.assertEqual(splitter.reports, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,295 @@
+import unittest
+import gzip
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from unittest import mock
+
+from gdc_fastq_splitter.fastq.compression import (
+    CODECS,
+    ParallelGzipWriter,
+    ProcessCodec,
+    ReadAheadReader,
+    BgzfReader,
+    get_codec,
+    open_fastq,
+    peek_line,
+    pipe_errors,
+)
+from tests.utils import random_fastq_bytes, write_bgzf
+
+
+class TestParallelGzipWriter(unittest.TestCase):
+    """Test the block parallel gzip writer"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, "test.fq.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        """Blocks are joined into a single readable gzip stream"""
+        data = random_fastq_bytes(2000)
+        writer = ParallelGzipWriter(self.fname, threads=3, block_size=4096)
+        for i in range(0, len(data), 1000):
+            writer.write(data[i : i + 1000])
+        writer.close()
+
+        with gzip.open(self.fname, "rb") as fh:
+            self.assertEqual(fh.read(), data)
+
+    def test_empty(self):
+        """An empty file is still a valid gzip file"""
+        ParallelGzipWriter(self.fname, threads=2).close()
+        with gzip.open(self.fname, "rb") as fh:
+            self.assertEqual(fh.read(), b"")
+
+    def test_append_member(self):
+        """Appending writes a new gzip member"""
+        data = random_fastq_bytes(200)
+        with ParallelGzipWriter(self.fname, threads=2, block_size=1000) as writer:
+            writer.write(data[:5000])
+        with ParallelGzipWriter(self.fname, mode="ab", threads=2) as writer:
+            writer.write(data[5000:])
+
+        with gzip.open(self.fname, "rb") as fh:
+            self.assertEqual(fh.read(), data)
+
+    @unittest.skipIf(shutil.which("gzip") is None, "gzip is not installed")
+    def test_gzip_cli(self):
+        """The output passes the gzip integrity test"""
+        data = random_fastq_bytes(500)
+        with ParallelGzipWriter(self.fname, threads=2, block_size=2048) as writer:
+            writer.write(data)
+        subprocess.check_call(["gzip", "-t", self.fname])
+        output = subprocess.check_output(["gzip", "-dc", self.fname])
+        self.assertEqual(output, data)
+
+
+class TestCodecs(unittest.TestCase):
+    """Test the output codecs"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def decompress(self, codec, fname):
+        if codec.extension == ".fq.zst":
+            return subprocess.check_output(["zstd", "-dc", fname])
+        if codec.extension == ".fq.gz":
+            with gzip.open(fname, "rb") as fh:
+                return fh.read()
+        with open(fname, "rb") as fh:
+            return fh.read()
+
+    def test_roundtrip(self):
+        """Each codec writes streams that are concatenated when appending"""
+        data = random_fastq_bytes(500)
+        for name, cls in CODECS.items():
+            if hasattr(cls, "available") and not cls.available():
+                continue
+            for threads in (1, 2):
+                with self.subTest(codec=name, threads=threads):
+                    codec = get_codec(name)
+                    fname = os.path.join(self.tmpdir, "test" + codec.extension)
+                    for mode, chunk in (("wb", data[:5000]), ("ab", data[5000:])):
+                        with open(fname, mode) as o:
+                            fobj = codec.open(o, fname, mode=mode, threads=threads)
+                            fobj.write(chunk)
+                            fobj.close()
+                    self.assertEqual(self.decompress(codec, fname), data)
+
+    def test_level(self):
+        self.assertEqual(get_codec().level, 6)
+        self.assertEqual(get_codec("fast").level, 1)
+        self.assertEqual(get_codec("gzip", level=9).level, 9)
+        self.assertIsNone(get_codec("none").level)
+        with self.assertRaises(ValueError):
+            get_codec("gzip", level=10)
+        with self.assertRaises(ValueError):
+            get_codec("none", level=1)
+        with self.assertRaises(ValueError):
+            get_codec("bzip2")
+
+    def test_missing_program(self):
+        cls = CODECS["zstd"]
+        with mock.patch.object(cls, "program", "not-a-zstd-program"):
+            self.assertFalse(cls.available())
+            with self.assertRaises(ValueError):
+                get_codec("zstd")
+
+    @unittest.skipIf(shutil.which("gzip") is None, "gzip is not installed")
+    def test_program_error(self):
+        """A compressor that fails raises when its output is closed"""
+        codec = get_codec("gzip-exe")
+        fname = os.path.join(self.tmpdir, "test.fq.gz")
+        with mock.patch.object(codec, "command", return_value=["gzip", "-X"]):
+            with open(fname, "wb") as o:
+                fobj = codec.open(o, fname)
+                with self.assertRaises(IOError):
+                    try:
+                        fobj.write(b"@r\nA\n+\nF\n")
+                    finally:
+                        fobj.close()
+
+    def test_program_exits_early(self):
+        """A compressor that exits while it is written to raises an error with
+        its exit status and stderr"""
+        codec = get_codec("gzip-exe")
+        fname = os.path.join(self.tmpdir, "test.fq.gz")
+        command = ["sh", "-c", "echo out of space >&2; exit 3"]
+        with mock.patch.object(codec, "command", return_value=command):
+            with open(fname, "wb") as o, pipe_errors(codec):
+                fobj = codec.open(o, fname)
+                with self.assertRaisesRegex(IOError, "status 3: out of space$"):
+                    try:
+                        for _ in range(100):
+                            fobj.write(random_fastq_bytes(100))
+                    finally:
+                        fobj.close()
+
+    def test_abstract_command(self):
+        """A program codec must have a command"""
+        with self.assertRaises(TypeError):
+            ProcessCodec()
+
+    def test_pipe_errors(self):
+        """SIGPIPE is only ignored while a program codec is used"""
+        previous = signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+        try:
+            with pipe_errors(get_codec("gzip")):
+                self.assertEqual(signal.getsignal(signal.SIGPIPE), signal.SIG_DFL)
+            with pipe_errors(get_codec("gzip-exe")):
+                self.assertEqual(signal.getsignal(signal.SIGPIPE), signal.SIG_IGN)
+            self.assertEqual(signal.getsignal(signal.SIGPIPE), signal.SIG_DFL)
+        finally:
+            signal.signal(signal.SIGPIPE, previous)
+
+
+class TestOpenFastq(unittest.TestCase):
+    """Test the decompression engines"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = random_fastq_bytes(1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_all(self, fname, threads):
+        fh = open_fastq(fname, threads=threads)
+        try:
+            chunks = []
+            while True:
+                chunk = fh.read(1000)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return fh, b"".join(chunks)
+        finally:
+            fh.close()
+
+    def test_gzip_read_ahead(self):
+        """Gzip inputs are read ahead in a background thread"""
+        fname = os.path.join(self.tmpdir, "test.fq.gz")
+        with gzip.open(fname, "wb") as o:
+            o.write(self.data)
+
+        fh, data = self.read_all(fname, 2)
+        self.assertIsInstance(fh, ReadAheadReader)
+        self.assertEqual(data, self.data)
+
+    def test_bgzf(self):
+        """BGZF inputs are inflated by a pool of threads"""
+        fname = os.path.join(self.tmpdir, "test.fq.gz")
+        write_bgzf(fname, self.data, block_size=1000)
+
+        fh, data = self.read_all(fname, 3)
+        self.assertIsInstance(fh, BgzfReader)
+        self.assertEqual(data, self.data)
+
+    def compress(self, kind):
+        if kind == "gzip":
+            return gzip.compress(self.data)
+        if kind == "bgzf":
+            fname = os.path.join(self.tmpdir, "bgzf")
+            write_bgzf(fname, self.data, block_size=1000)
+            with open(fname, "rb") as fh:
+                return fh.read()
+        return self.data
+
+    def test_magic_bytes(self):
+        """Gzip inputs are detected by their magic bytes, not their name"""
+        for kind, name in (("gzip", "test.fastq"), ("plain", "test.fq.gz")):
+            fname = os.path.join(self.tmpdir, name)
+            with open(fname, "wb") as o:
+                o.write(self.compress(kind))
+            for threads in (1, 2):
+                _, data = self.read_all(fname, threads)
+                self.assertEqual(data, self.data)
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "named pipes are not supported")
+    def test_fifo(self):
+        """Named pipes are only read once"""
+        fname = os.path.join(self.tmpdir, "test.fifo")
+        os.mkfifo(fname)
+        for kind in ("plain", "gzip", "bgzf"):
+            for threads in (1, 3):
+                with self.subTest(kind=kind, threads=threads):
+                    content = self.compress(kind)
+
+                    def feed():
+                        with open(fname, "wb") as o:
+                            o.write(content)
+
+                    writer = threading.Thread(target=feed)
+                    writer.start()
+                    _, data = self.read_all(fname, threads)
+                    writer.join()
+                    self.assertEqual(data, self.data)
+
+    def test_stdin(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(write_fd, "wb") as o:
+            o.write(gzip.compress(self.data[:10000]))
+        stdin = mock.Mock()
+        stdin.fileno.return_value = read_fd
+        try:
+            with mock.patch("sys.stdin", stdin):
+                _, data = self.read_all("-", 1)
+        finally:
+            os.close(read_fd)
+        self.assertEqual(data, self.data[:10000])
+
+    def test_peek_line(self):
+        """The first line is replayed and seeking still works"""
+        fname = os.path.join(self.tmpdir, "test.fq.gz")
+        with gzip.open(fname, "wb") as o:
+            o.write(self.data)
+        line, fh = peek_line(open_fastq(fname), block_size=10)
+        with fh:
+            self.assertEqual(line, self.data[: self.data.index(b"\n")])
+            self.assertEqual(fh.read(10), self.data[:10])
+            self.assertEqual(fh.tell(), 10)
+            fh.seek(5000)
+            self.assertEqual(fh.tell(), 5000)
+            self.assertEqual(fh.read(100), self.data[5000:5100])
+
+    def test_close_early(self):
+        """Closing before the end stops the background threads"""
+        fname = os.path.join(self.tmpdir, "test.fq.gz")
+        write_bgzf(fname, self.data, block_size=100)
+        fh = BgzfReader(open(fname, "rb"), threads=2, blocks_per_task=1, maxsize=1)
+        self.assertTrue(fh.read(10))
+        fh.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
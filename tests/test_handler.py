@@ -0,0 +1,740 @@
+import unittest
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import copy
+import hashlib
+import zlib
+from unittest import mock
+
+from gdc_fastq_splitter.options import SplitOptions
+from gdc_fastq_splitter.handler import (
+    do_process,
+    process_fastq,
+    process_paired_fastq,
+)
+from gdc_fastq_splitter.fastq.compression import get_codec
+from gdc_fastq_splitter.fastq.qc import qc_available
+from gdc_fastq_splitter.fastq.reader import FastqBatch
+from gdc_fastq_splitter.fastq.runs import RunIndex
+from tests.utils import get_test_file, random_fastq_bytes, write_bgzf
+
+OUTPUT_METADATA = ("uncompressed_bytes", "compressed_bytes", "md5")
+
+
+class TestProcessFastq(unittest.TestCase):
+    """Test splitting a fastq into read groups"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmpdir, "out_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_output(self, key, pair="1"):
+        fname = "{0}{1}_R{2}.fq.gz".format(self.prefix, key, pair)
+        with gzip.open(fname, "rb") as fh:
+            return fh.read()
+
+    def without_output(self, data, keys=("compressed_bytes", "md5")):
+        """The reports without the output metadata that depends on how the
+        outputs were compressed"""
+        data = copy.deepcopy(data)
+        for report in data.values():
+            for key in keys:
+                del report["metadata"][key]
+        return data
+
+    def read_report(self, key, pair="1"):
+        fname = "{0}{1}_R{2}.report.json".format(self.prefix, key, pair)
+        with open(fname, "rt") as fh:
+            return json.load(fh)
+
+    def test_split(self):
+        """Records are split by flowcell and lane"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        data, count = process_fastq(fil, self.prefix)
+
+        self.assertEqual(count, 6)
+        self.assertEqual(sorted(data), ["HTM2GBGXX_1", "HTM2GBGXX_2"])
+        self.assertEqual(data["HTM2GBGXX_1"]["metadata"]["record_count"], 4)
+        self.assertEqual(data["HTM2GBGXX_2"]["metadata"]["record_count"], 2)
+        self.assertEqual(
+            data["HTM2GBGXX_1"]["metadata"]["multiplex_barcode"],
+            "TAAGGCGA+ATAGAGAG",
+        )
+        self.assertEqual(self.read_report("HTM2GBGXX_1"), data["HTM2GBGXX_1"])
+        self.assertEqual(self.read_output("HTM2GBGXX_2").count(b"\n"), 8)
+
+    def test_raw_matches_decoded(self):
+        """The bytes-native path writes the same outputs as the decoded path"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        data, count = process_fastq(fil, self.prefix, SplitOptions(raw=False))
+        expected = {key: self.read_output(key) for key in data}
+
+        raw_data, raw_count = process_fastq(fil, self.prefix, SplitOptions(raw=True))
+        self.assertEqual(raw_count, count)
+        self.assertEqual(raw_data, data)
+        for key in raw_data:
+            self.assertEqual(self.read_output(key), expected[key])
+
+    def test_threads(self):
+        """Parallel compression writes the same records"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        data, count = process_fastq(fil, self.prefix)
+        expected = {key: self.read_output(key) for key in data}
+
+        for block_size in (64, 1 << 20):
+            threaded_data, threaded_count = process_fastq(
+                fil, self.prefix, SplitOptions(threads=3, block_size=block_size)
+            )
+            self.assertEqual(threaded_count, count)
+            self.assertEqual(
+                self.without_output(threaded_data), self.without_output(data)
+            )
+            for key in threaded_data:
+                self.assertEqual(self.read_output(key), expected[key])
+
+    def check_processes(self, fil):
+        data, count = process_fastq(fil, self.prefix)
+        expected = {key: self.read_output(key) for key in data}
+
+        ranged_data, ranged_count = process_fastq(
+            fil, self.prefix, SplitOptions(processes=3)
+        )
+        self.assertEqual(ranged_count, count)
+        self.assertEqual(self.without_output(ranged_data), self.without_output(data))
+        for key in ranged_data:
+            self.assertEqual(self.read_output(key), expected[key])
+            self.assertEqual(self.read_report(key), ranged_data[key])
+        self.assertFalse([f for f in os.listdir(self.tmpdir) if ".part" in f])
+
+    def test_processes_plain(self):
+        """Uncompressed fastqs are split in parallel ranges"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(random_fastq_bytes(1000))
+        self.check_processes(fil)
+
+    def test_processes_bgzf(self):
+        """BGZF fastqs are split in parallel ranges"""
+        fil = os.path.join(self.tmpdir, "input.fastq.gz")
+        write_bgzf(fil, random_fastq_bytes(1000))
+        self.check_processes(fil)
+
+    def test_checksums(self):
+        """The checksums and sizes of the outputs are in the reports"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(random_fastq_bytes(1000))
+        checksums = ("md5", "sha256", "crc32")
+        for kwargs in ({}, {"threads": 2}, {"processes": 3}, {"max_open_files": 1}):
+            data, _ = process_fastq(
+                fil,
+                self.prefix,
+                SplitOptions(block_size=4096, checksums=checksums, **kwargs),
+            )
+            for key, report in data.items():
+                fname = "{0}{1}_R1.fq.gz".format(self.prefix, key)
+                with open(fname, "rb") as fh:
+                    compressed = fh.read()
+                metadata = report["metadata"]
+                self.assertEqual(metadata["compressed_bytes"], len(compressed))
+                self.assertEqual(
+                    metadata["uncompressed_bytes"], len(self.read_output(key))
+                )
+                self.assertEqual(metadata["md5"], hashlib.md5(compressed).hexdigest())
+                self.assertEqual(
+                    metadata["sha256"], hashlib.sha256(compressed).hexdigest()
+                )
+                self.assertEqual(
+                    metadata["crc32"], "{0:08x}".format(zlib.crc32(compressed))
+                )
+
+        data, _ = process_fastq(fil, self.prefix, SplitOptions(checksums=()))
+        for report in data.values():
+            self.assertNotIn("md5", report["metadata"])
+            self.assertIn("compressed_bytes", report["metadata"])
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "named pipes are not supported")
+    def test_streamed_input(self):
+        """Named pipes and stdin are split like files, without a second open"""
+        data = random_fastq_bytes(1000)
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(data)
+        expected, _ = process_fastq(fil, self.prefix, SplitOptions(block_size=4096))
+        outputs = {key: self.read_output(key) for key in expected}
+
+        fifo = os.path.join(self.tmpdir, "input.fifo")
+        os.mkfifo(fifo)
+        for kwargs in ({}, {"threads": 2}, {"processes": 3}, {"raw": False}):
+
+            def feed():
+                with open(fifo, "wb") as o:
+                    o.write(gzip.compress(data))
+
+            writer = threading.Thread(target=feed)
+            writer.start()
+            result, count = process_fastq(
+                fifo, self.prefix, SplitOptions(block_size=4096, **kwargs)
+            )
+            writer.join()
+            self.assertEqual(count, 1000)
+            self.assertEqual(self.without_output(result), self.without_output(expected))
+            for key in result:
+                self.assertEqual(self.read_output(key), outputs[key])
+
+        # Small enough to fit in the pipe buffer
+        head = data.index(b"@A00", 5000)
+        read_fd, write_fd = os.pipe()
+        writer = threading.Thread(
+            target=lambda: os.write(write_fd, data[:head]) and os.close(write_fd)
+        )
+        writer.start()
+        stdin = mock.Mock()
+        stdin.fileno.return_value = read_fd
+        try:
+            with mock.patch("sys.stdin", stdin):
+                _, count = process_fastq(
+                    "-", self.prefix, SplitOptions(metrics_json=True)
+                )
+        finally:
+            writer.join()
+            os.close(read_fd)
+        self.assertEqual(count, data[:head].count(b"\n") // 4)
+        self.assertTrue(os.path.exists(self.prefix + "stdin.metrics.json"))
+        with self.assertRaises(ValueError):
+            process_fastq("-", self.prefix, SplitOptions(resume=True))
+
+    def test_codecs(self):
+        """Outputs are written with the extension and compression of the codec"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(random_fastq_bytes(1000))
+        expected, _ = process_fastq(fil, self.prefix, SplitOptions(block_size=4096))
+        outputs = {key: self.read_output(key) for key in expected}
+
+        keys = OUTPUT_METADATA + ("fastq_filename",)
+        codecs = [get_codec("none"), get_codec("fast"), get_codec("gzip", level=1)]
+        if shutil.which("zstd"):
+            codecs.append(get_codec("zstd"))
+        for codec in codecs:
+            for kwargs in ({}, {"processes": 3}, {"max_open_files": 1}):
+                data, _ = process_fastq(
+                    fil,
+                    self.prefix,
+                    SplitOptions(block_size=4096, codec=codec, **kwargs),
+                )
+                self.assertEqual(
+                    self.without_output(data, keys=keys),
+                    self.without_output(expected, keys=keys),
+                )
+                for key, report in data.items():
+                    fname = "{0}{1}_R1{2}".format(self.prefix, key, codec.extension)
+                    self.assertEqual(
+                        report["metadata"]["fastq_filename"], os.path.basename(fname)
+                    )
+                    if codec.name == "zstd":
+                        output = subprocess.check_output(["zstd", "-dc", fname])
+                    elif codec.name == "none":
+                        with open(fname, "rb") as fh:
+                            output = fh.read()
+                    else:
+                        with gzip.open(fname, "rb") as fh:
+                            output = fh.read()
+                    self.assertEqual(output, outputs[key])
+                    os.remove(fname)
+
+    @unittest.skipUnless(qc_available(), "numpy is not installed")
+    def test_qc(self):
+        """QC statistics are the same however the fastq is split"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(random_fastq_bytes(1000))
+        data, _ = process_fastq(
+            fil, self.prefix, SplitOptions(block_size=4096, qc=True)
+        )
+        for key, report in data.items():
+            self.assertEqual(
+                report["qc"]["read_count"], report["metadata"]["record_count"]
+            )
+            self.assertEqual(self.read_report(key)["qc"], report["qc"])
+
+        for kwargs in ({"processes": 3}, {"threads": 2}, {"raw": False}):
+            other, _ = process_fastq(fil, self.prefix, SplitOptions(qc=True, **kwargs))
+            self.assertEqual(
+                {key: other[key]["qc"] for key in other},
+                {key: data[key]["qc"] for key in data},
+            )
+
+    def test_max_open_files(self):
+        """Suspended outputs are appended to as multi-member gzip files"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(random_fastq_bytes(1000))
+        data, count = process_fastq(fil, self.prefix, SplitOptions(block_size=512))
+        expected = {key: self.read_output(key) for key in data}
+
+        for kwargs in ({}, {"threads": 2}, {"processes": 3}):
+            pooled_data, pooled_count = process_fastq(
+                fil,
+                self.prefix,
+                SplitOptions(block_size=512, max_open_files=1, **kwargs),
+            )
+            self.assertEqual(pooled_count, count)
+            self.assertEqual(
+                self.without_output(pooled_data), self.without_output(data)
+            )
+            for key in pooled_data:
+                self.assertEqual(self.read_output(key), expected[key])
+                self.assertEqual(self.read_report(key), pooled_data[key])
+
+    def test_scan_only(self):
+        """Scanning writes the same reports and a summary but no fastqs"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(random_fastq_bytes(1000))
+        data, count = process_fastq(fil, self.prefix)
+        for key in data:
+            os.remove(self.prefix + key + "_R1.fq.gz")
+
+        for kwargs in ({}, {"threads": 2}, {"processes": 3}, {"raw": False}):
+            scan_data, scan_count = process_fastq(
+                fil, self.prefix, SplitOptions(scan_only=True, **kwargs)
+            )
+            self.assertEqual(scan_count, count)
+            self.assertEqual(scan_data, self.without_output(data, OUTPUT_METADATA))
+            for key in data:
+                self.assertEqual(self.read_report(key), scan_data[key])
+            self.assertFalse(
+                [f for f in os.listdir(self.tmpdir) if f.endswith(".fq.gz")]
+            )
+
+            with open(self.prefix + "input.summary.json", "rt") as fh:
+                summary = json.load(fh)
+            self.assertEqual(summary["record_count"], 1000)
+            self.assertEqual(summary["fastq_type"], "IlluminaFastqRecord")
+            self.assertEqual(
+                summary["read_groups"],
+                {key: scan_data[key]["metadata"] for key in data},
+            )
+
+    def test_run_index(self):
+        """The runs of the index cover the input and match the outputs"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        raw = random_fastq_bytes(1000)
+        with open(fil, "wb") as o:
+            o.write(raw)
+
+        for kwargs in ({}, {"processes": 3}):
+            data, count = process_fastq(
+                fil,
+                self.prefix,
+                SplitOptions(block_size=4096, write_run_index=True, **kwargs),
+            )
+            index = RunIndex.read(self.prefix + "input.runs.tsv", fil)
+            self.assertEqual(index.byte_count, len(raw))
+            self.assertEqual(index.record_count, count)
+            self.assertEqual(
+                index.barcodes, {key: data[key]["barcode_frequency"] for key in data}
+            )
+            outputs = {key: [] for key in data}
+            for key, offset, length, _, records in index:
+                outputs[key].append(raw[offset : offset + length])
+                self.assertEqual(outputs[key][-1].count(b"\n"), 4 * records)
+            for key in data:
+                self.assertEqual(self.read_output(key), b"".join(outputs[key]))
+
+    def test_from_run_index(self):
+        """A split from the run index of an earlier split has the same outputs
+        and reports"""
+        raw = random_fastq_bytes(1000)
+        for name in ("input.fastq", "input.fq.gz"):
+            fil = os.path.join(self.tmpdir, name)
+            with (gzip.open if name.endswith(".gz") else open)(fil, "wb") as o:
+                o.write(raw)
+            data, count = process_fastq(
+                fil, self.prefix, SplitOptions(block_size=4096, write_run_index=True)
+            )
+            expected = {key: self.read_output(key) for key in data}
+
+            for kwargs in ({}, {"threads": 2, "max_memory": 4096}):
+                index_data, index_count = process_fastq(
+                    fil, self.prefix, SplitOptions(from_run_index=True, **kwargs)
+                )
+                self.assertEqual(index_count, count)
+                self.assertEqual(
+                    self.without_output(index_data), self.without_output(data)
+                )
+                for key in data:
+                    self.assertEqual(self.read_output(key), expected[key])
+
+            # Only the reports and the summary
+            scan_data, scan_count = process_fastq(
+                fil, self.prefix, SplitOptions(from_run_index=True, scan_only=True)
+            )
+            self.assertEqual(scan_count, count)
+            self.assertEqual(scan_data, self.without_output(data, OUTPUT_METADATA))
+            with open(self.prefix + "input.summary.json", "rt") as fh:
+                self.assertEqual(json.load(fh)["record_count"], count)
+
+            # The index of a fastq that changed since is stale
+            stat = os.stat(fil)
+            os.utime(fil, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            with self.assertRaisesRegex(ValueError, "changed since its run index"):
+                process_fastq(fil, self.prefix, SplitOptions(from_run_index=True))
+
+    def test_resume(self):
+        """A split interrupted after a checkpoint resumes with the same outputs"""
+        raw = random_fastq_bytes(1000)
+        for name, kwargs in (("input.fastq", {}), ("input.fq.gz", {"threads": 2})):
+            fil = os.path.join(self.tmpdir, name)
+            with (gzip.open if name.endswith(".gz") else open)(fil, "wb") as o:
+                o.write(raw)
+            data, count = process_fastq(fil, self.prefix, SplitOptions(block_size=4096))
+            expected = {key: self.read_output(key) for key in data}
+
+            from_block = FastqBatch.from_block
+            calls = []
+
+            def interrupted(*args, **kw):
+                calls.append(1)
+                if len(calls) == 10:
+                    raise KeyboardInterrupt()
+                return from_block(*args, **kw)
+
+            with mock.patch.object(FastqBatch, "from_block", interrupted):
+                with self.assertRaises(KeyboardInterrupt):
+                    process_fastq(
+                        fil,
+                        self.prefix,
+                        SplitOptions(
+                            block_size=4096,
+                            checkpoint_interval=100,
+                            write_run_index=True,
+                            **kwargs
+                        ),
+                    )
+            checkpoint = self.prefix + "input.checkpoint.json"
+            with open(checkpoint, "rt") as fh:
+                self.assertGreater(json.load(fh)["record_count"], 0)
+
+            resumed_data, resumed_count = process_fastq(
+                fil,
+                self.prefix,
+                SplitOptions(
+                    block_size=4096, resume=True, write_run_index=True, **kwargs
+                ),
+            )
+            self.assertEqual(resumed_count, count)
+            self.assertEqual(
+                self.without_output(resumed_data), self.without_output(data)
+            )
+            for key in data:
+                self.assertEqual(self.read_output(key), expected[key])
+            for key in data:
+                fname = "{0}{1}_R1.fq.gz".format(self.prefix, key)
+                with open(fname, "rb") as fh:
+                    self.assertEqual(
+                        resumed_data[key]["metadata"]["md5"],
+                        hashlib.md5(fh.read()).hexdigest(),
+                    )
+            self.assertFalse(os.path.exists(checkpoint))
+            index = RunIndex.read(self.prefix + "input.runs.tsv", fil)
+            self.assertEqual(index.record_count, count)
+            self.assertEqual(index.byte_count, len(raw))
+
+    def test_resume_changed_input(self):
+        """A checkpoint of a fastq that changed since is not resumed"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        raw = random_fastq_bytes(1000)
+        with open(fil, "wb") as o:
+            o.write(raw)
+
+        from_block = FastqBatch.from_block
+        calls = []
+
+        def interrupted(*args, **kw):
+            calls.append(1)
+            if len(calls) == 10:
+                raise KeyboardInterrupt()
+            return from_block(*args, **kw)
+
+        with mock.patch.object(FastqBatch, "from_block", interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                process_fastq(
+                    fil,
+                    self.prefix,
+                    SplitOptions(block_size=4096, checkpoint_interval=100),
+                )
+        checkpoint = self.prefix + "input.checkpoint.json"
+        with open(checkpoint, "rt") as fh:
+            saved = fh.read()
+
+        # Touched, then rewritten with other records of the same size
+        stat = os.stat(fil)
+        os.utime(fil, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with self.assertRaisesRegex(ValueError, "different fastq"):
+            process_fastq(fil, self.prefix, SplitOptions(resume=True))
+        with open(checkpoint, "wt") as o:
+            o.write(saved)
+        with open(fil, "wb") as o:
+            o.write(raw.replace(b"A", b"C"))
+        os.utime(fil, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+        self.assertEqual(os.path.getsize(fil), stat.st_size)
+        with self.assertRaisesRegex(ValueError, "different fastq"):
+            process_fastq(fil, self.prefix, SplitOptions(resume=True))
+
+    def test_metrics_json(self):
+        """Stage times, bytes and records per read key are written"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        process_fastq(fil, self.prefix, SplitOptions(metrics_json=True))
+
+        with open(self.prefix + "fake_MultipleReadGroups.metrics.json", "rt") as fh:
+            metrics = json.load(fh)
+        self.assertEqual(metrics["read_keys"], {"HTM2GBGXX_1": 4, "HTM2GBGXX_2": 2})
+        self.assertEqual(metrics["input"]["uncompressed_bytes"], os.path.getsize(fil))
+        self.assertEqual(metrics["output"]["uncompressed_bytes"], os.path.getsize(fil))
+        for stage in ("decompress", "parse", "report", "compress", "write"):
+            self.assertIn(stage, metrics["stages"])
+
+    def test_profile(self):
+        """Profile stats are dumped next to the reports"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        data, count = do_process((fil, self.prefix, SplitOptions(profile=True)))
+        self.assertEqual(count, 6)
+        self.assertTrue(os.path.exists(self.prefix + "fake_MultipleReadGroups.pstats"))
+
+    def test_max_barcodes(self):
+        """Reports keep at most max_barcodes barcodes, also across ranges"""
+        fil = os.path.join(self.tmpdir, "in.fq")
+        with open(fil, "wb") as o:
+            barcodes = ["ACGT"] * 8 + ["ACGA", "ACGC", "ACGG", "ACGN"]
+            o.write(random_fastq_bytes(1000, seed=3, barcodes=barcodes))
+        exact, _ = process_fastq(fil, self.prefix + "exact_")
+        for processes in (1, 3):
+            data, _ = process_fastq(
+                fil, self.prefix, SplitOptions(processes=processes, max_barcodes=2)
+            )
+            for key, report in data.items():
+                self.assertEqual(len(exact[key]["barcode_frequency"]), 5)
+                self.assertLessEqual(len(report["barcode_frequency"]), 2)
+                self.assertEqual(
+                    report["metadata"]["multiplex_barcode"],
+                    exact[key]["metadata"]["multiplex_barcode"],
+                )
+
+    def test_lockstep(self):
+        """Mates split in lockstep match splitting each mate on its own"""
+        data = random_fastq_bytes(1000)
+        fastqs = []
+        for name, mate in (("a.fq", data), ("b.fq.gz", data)):
+            fil = os.path.join(self.tmpdir, name)
+            if name.endswith(".gz"):
+                mate = gzip.compress(mate.replace(b" 1:N:0:", b" 2:N:0:"))
+            with open(fil, "wb") as o:
+                o.write(mate)
+            fastqs.append(fil)
+        expected = [
+            process_fastq(fil, self.prefix, SplitOptions(block_size=4096))
+            for fil in fastqs
+        ]
+        outputs = {
+            (key, pair): self.read_output(key, pair)
+            for (data, _), pair in zip(expected, "12")
+            for key in data
+        }
+
+        results = process_paired_fastq(
+            *fastqs, self.prefix, SplitOptions(block_size=3000)
+        )
+        self.assertEqual(
+            [(self.without_output(data), count) for data, count in results],
+            [(self.without_output(data), count) for data, count in expected],
+        )
+        for key, pair in outputs:
+            self.assertEqual(self.read_output(key, pair), outputs[(key, pair)])
+            self.assertEqual(
+                self.read_report(key, pair), results[int(pair) - 1][0][key]
+            )
+
+        # Swapped records fail at the first mismatch
+        lines = data.replace(b" 1:N:0:", b" 2:N:0:").split(b"\n")
+        lines[400:404], lines[404:408] = lines[404:408], lines[400:404]
+        with open(fastqs[1], "wb") as o:
+            o.write(b"\n".join(lines))
+        with self.assertRaisesRegex(ValueError, "record 101 of fastqs"):
+            process_paired_fastq(*fastqs, self.prefix, SplitOptions(block_size=3000))
+
+    def test_interleaved(self):
+        """An interleaved fastq is split like its two mate fastqs"""
+        data = random_fastq_bytes(1000)
+        mate = data.replace(b" 1:N:0:", b" 2:N:0:")
+        fastqs = []
+        for name, content in (("a.fq", data), ("b.fq", mate)):
+            fastqs.append(os.path.join(self.tmpdir, name))
+            with open(fastqs[-1], "wb") as o:
+                o.write(content)
+        expected = process_paired_fastq(*fastqs, self.prefix)
+        outputs = {
+            (key, pair): self.read_output(key, pair)
+            for (data, _), pair in zip(expected, "12")
+            for key in data
+        }
+
+        lines_a = data.split(b"\n")
+        lines_b = mate.split(b"\n")
+        fil = os.path.join(self.tmpdir, "in.fq.gz")
+        with gzip.open(fil, "wb") as o:
+            for i in range(0, len(lines_a) - 1, 4):
+                o.write(b"\n".join(lines_a[i : i + 4] + lines_b[i : i + 4]) + b"\n")
+        results = process_paired_fastq(
+            fil, None, self.prefix, SplitOptions(block_size=3001, metrics_json=True)
+        )
+        self.assertEqual(
+            [(self.without_output(data), count) for data, count in results],
+            [(self.without_output(data), count) for data, count in expected],
+        )
+        for key, pair in outputs:
+            self.assertEqual(self.read_output(key, pair), outputs[(key, pair)])
+        with open(self.prefix + "in.metrics.json", "rt") as fh:
+            metrics = json.load(fh)
+        self.assertEqual(sum(metrics["read_keys"].values()), 2000)
+
+        process_paired_fastq(fil, None, self.prefix, SplitOptions(scan_only=True))
+        for pair in "12":
+            fname = "{0}in_R{1}.summary.json".format(self.prefix, pair)
+            with open(fname, "rt") as fh:
+                self.assertEqual(json.load(fh)["record_count"], 1000)
+
+    def test_max_memory(self):
+        """Buffered outputs are the same and the buffers are in the metrics"""
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(random_fastq_bytes(1000))
+        expected, _ = process_fastq(fil, self.prefix, SplitOptions(block_size=4096))
+        outputs = {key: self.read_output(key) for key in expected}
+
+        for kwargs in ({}, {"threads": 2}, {"processes": 3}, {"max_open_files": 1}):
+            data, count = process_fastq(
+                fil,
+                self.prefix,
+                SplitOptions(
+                    block_size=4096, max_memory=32 * 1024, metrics_json=True, **kwargs
+                ),
+            )
+            self.assertEqual(count, 1000)
+            self.assertEqual(self.without_output(data), self.without_output(expected))
+            for key in data:
+                self.assertEqual(self.read_output(key), outputs[key])
+            with open(self.prefix + "input.metrics.json", "rt") as fh:
+                buffers = json.load(fh)["buffers"]
+            # Divided between the ranges of the processes
+            self.assertAlmostEqual(buffers["max_bytes"], 32 * 1024, delta=2)
+            self.assertGreater(buffers["peak_bytes"], 0)
+            self.assertGreater(buffers["flushes"], 0)
+
+    def test_heartbeat(self):
+        """The progress of each fastq is written to its heartbeat file"""
+        data = random_fastq_bytes(1000)
+        fastqs = []
+        for name, content in (("a.fq.gz", data), ("b.fq.gz", data)):
+            if name.startswith("b"):
+                content = content.replace(b" 1:N:0:", b" 2:N:0:")
+            fastqs.append(os.path.join(self.tmpdir, name))
+            with open(fastqs[-1], "wb") as o:
+                o.write(gzip.compress(content))
+
+        def read_heartbeat(fil):
+            fname = "{0}{1}.progress.json".format(self.prefix, os.path.basename(fil))
+            with open(fname.replace(".fq.gz", ""), "rt") as fh:
+                return json.load(fh)
+
+        for kwargs in ({}, {"threads": 2}):
+            _, count = process_fastq(
+                fastqs[0],
+                self.prefix,
+                SplitOptions(
+                    block_size=4096, progress_interval=1e-6, heartbeat=True, **kwargs
+                ),
+            )
+            progress = read_heartbeat(fastqs[0])
+            self.assertEqual(progress["status"], "done")
+            self.assertEqual(progress["records"], count)
+            self.assertEqual(progress["input_bytes"], len(data))
+            self.assertEqual(
+                progress["compressed_input_bytes"], os.path.getsize(fastqs[0])
+            )
+            self.assertEqual(progress["percent"], 100)
+            self.assertGreater(progress["records_per_second"], 0)
+
+        process_paired_fastq(*fastqs, self.prefix, SplitOptions(heartbeat=True))
+        for fil in fastqs:
+            self.assertEqual(read_heartbeat(fil)["records"], 1000)
+
+        with open(fastqs[1], "wb") as o:
+            mate = data.replace(b" 1:N:0:", b" 2:N:0:")
+            o.write(gzip.compress(mate[: mate.rindex(b"@A00")]))
+        with self.assertRaises(ValueError):
+            process_paired_fastq(*fastqs, self.prefix, SplitOptions(heartbeat=True))
+        self.assertEqual(read_heartbeat(fastqs[0])["status"], "failed")
+
+    def test_heartbeat_ranges(self):
+        """The progress of the ranges of the processes is merged"""
+        data = random_fastq_bytes(2000) * 2
+        fil = os.path.join(self.tmpdir, "in.fq")
+        with open(fil, "wb") as o:
+            o.write(data)
+        options = SplitOptions(block_size=4096, processes=2, heartbeat=True)
+        with self.assertLogs("fastq_processing", "INFO") as logs:
+            _, count = process_fastq(fil, self.prefix, options)
+        self.assertTrue([line for line in logs.output if "2 ranges" in line])
+        with open(self.prefix + "in.progress.json", "rt") as fh:
+            progress = json.load(fh)
+        self.assertEqual(progress["status"], "done")
+        self.assertEqual(progress["records"], count)
+        self.assertEqual(progress["input_bytes"], len(data))
+        self.assertEqual(progress["compressed_input_bytes"], len(data))
+        self.assertEqual(progress["percent"], 100)
+
+    def test_validate(self):
+        """Invalid records fail the split once it is written"""
+        data = random_fastq_bytes(1000)
+        fil = os.path.join(self.tmpdir, "input.fastq")
+        with open(fil, "wb") as o:
+            o.write(data)
+        for kwargs in ({}, {"threads": 2}, {"processes": 3}):
+            _, count = process_fastq(
+                fil, self.prefix, SplitOptions(block_size=4096, validate=True, **kwargs)
+            )
+            self.assertEqual(count, 1000)
+
+        lines = data.split(b"\n")
+        for record in (7, 900):
+            lines[4 * (record - 1) + 3] = b"I"
+        with open(fil, "wb") as o:
+            o.write(b"\n".join(lines))
+        for kwargs in ({}, {"threads": 2}, {"processes": 3}):
+            with self.assertRaisesRegex(ValueError, "2 invalid records .*: 7, 900$"):
+                process_fastq(
+                    fil,
+                    self.prefix,
+                    SplitOptions(block_size=4096, validate=True, **kwargs),
+                )
+            self.assertTrue(os.listdir(self.tmpdir))
+
+        mate = os.path.join(self.tmpdir, "mate.fastq")
+        with open(mate, "wb") as o:
+            o.write(data.replace(b" 1:N:0:", b" 2:N:0:"))
+        with self.assertRaisesRegex(ValueError, "Fastq input.fastq has 2 invalid"):
+            process_paired_fastq(fil, mate, self.prefix, SplitOptions(validate=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,7 @@ from gdc_fastq_splitter.fastq.illumina import (
     IlluminaSequenceIdentifierNoBarcode,
     IlluminaSequenceIdentifier,
     IlluminaNoBarcodeFastqRecord,
+    ReadKeyResolver,
     infer_fastq_type,
 )
 
@@ -69,6 +70,36 @@ class TestIlluminaFastqRecord(unittest.TestCase):
         self.assertTrue(sobj.seqid.instrument_name == "NS500106")
 
 
+class TestIlluminaRawFastqRecord(unittest.TestCase):
+    """Test the fields of raw fastq records"""
+
+    def test_read_pair(self):
+        """The read pair is None if the sequence identifier has none"""
+        for record_cls, header, read_pair in (
+            (
+                IlluminaFastqRecord.raw_record_cls,
+                b"@NS500106:131:HTM2GBGXX:1:11101:18568:1043 2:N:0:TAAGGCGA",
+                "2",
+            ),
+            (
+                IlluminaFastqRecord.raw_record_cls,
+                b"@NS500106:131:HTM2GBGXX:1:11101:18568:1043",
+                None,
+            ),
+            (
+                IlluminaNoBarcodeFastqRecord.raw_record_cls,
+                b"@D00761:79:C9E9CANXX:7:1208:2524:17753/1",
+                "1",
+            ),
+            (
+                IlluminaNoBarcodeFastqRecord.raw_record_cls,
+                b"@D00761:79:C9E9CANXX:7:1208:2524:17753",
+                None,
+            ),
+        ):
+            self.assertEqual(record_cls(b"", header).read_pair, read_pair)
+
+
 class TestInferFastqType(unittest.TestCase):
     """Test the infer_fastq_type functionality"""
 
@@ -99,5 +130,48 @@ class TestInferFastqType(unittest.TestCase):
             m = infer_fastq_type(fil)
 
 
+class TestReadKeyResolver(unittest.TestCase):
+    """Test resolving read keys by sequence identifier prefix"""
+
+    headers = [
+        b"@NS500106:131:HTM2GBGXX:1:11101:18568:1043 2:N:0:TAAGGCGA+ATAGAGAG",
+        b"@NS500106:131:HTM2GBGXX:1:11101:18569:1043 2:N:0:TAAGGCGA+ATAGAGAG",
+        b"@NS500106:131:HTM2GBGXX:2:11101:18570:1043 2:N:0:TAAGGCGA+ATAGAGAG",
+        b"@NS500106:1310:HTM2GBGXY:1:11101:18570:1043 2:N:0:TAAGGCGA",
+        b"@NS500106:131:HTM2GBGXX:1:11102:18571:1043 2:N:0:TAAGGCGA+ATAGAGAG",
+    ]
+
+    def test_cached(self):
+        """Read keys are only parsed once per prefix"""
+        resolver = ReadKeyResolver(IlluminaSequenceIdentifier)
+        keys = [resolver(header) for header in self.headers]
+        self.assertEqual(
+            keys,
+            ["HTM2GBGXX_1", "HTM2GBGXX_1", "HTM2GBGXX_2", "HTM2GBGXY_1", "HTM2GBGXX_1"],
+        )
+        self.assertEqual(resolver.misses, 3)
+
+    def test_nobarcode(self):
+        """The prefix cache works for identifiers without barcodes"""
+        resolver = ReadKeyResolver(IlluminaSequenceIdentifierNoBarcode)
+        self.assertEqual(
+            resolver(b"@D00761:79:C9E9CANXX:7:1208:2524:17753/1"), "C9E9CANXX_7"
+        )
+        self.assertEqual(
+            resolver(b"@D00761:79:C9E9CANXX:7:1209:2524:17754/1"), "C9E9CANXX_7"
+        )
+        self.assertEqual(resolver.misses, 1)
+
+    def test_strict(self):
+        """Strict mode parses and validates every identifier"""
+        resolver = ReadKeyResolver(IlluminaSequenceIdentifier, strict=True)
+        for header in self.headers:
+            resolver(header)
+        self.assertEqual(resolver.misses, len(self.headers))
+
+        with self.assertRaises(AssertionError):
+            resolver(b"@NS500106:131:HTM2GBGXX:1:11101:18568 2:N:0:TAAGGCGA")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+from gdc_fastq_splitter.handler import main_handler
+from gdc_fastq_splitter.manifest import get_summary_filename, read_manifest
+from tests.utils import random_fastq_bytes
+
+
+class TestReadManifest(unittest.TestCase):
+    """Test reading manifests"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text):
+        fname = os.path.join(self.tmpdir, name)
+        with open(fname, "wt") as o:
+            o.write(text)
+        return fname
+
+    def test_tsv(self):
+        fname = self.write(
+            "manifest.tsv",
+            "# submission\n"
+            "output_prefix\tfastq_a\tfastq_b\n"
+            "out/a_\ta.fq.gz\t\n"
+            "\n"
+            "out/b_\tb_1.fq.gz\tb_2.fq.gz\n",
+        )
+        self.assertEqual(
+            read_manifest(fname),
+            [
+                {"fastq_a": "a.fq.gz", "fastq_b": None, "output_prefix": "out/a_"},
+                {
+                    "fastq_a": "b_1.fq.gz",
+                    "fastq_b": "b_2.fq.gz",
+                    "output_prefix": "out/b_",
+                },
+            ],
+        )
+        self.assertEqual(
+            get_summary_filename(fname),
+            os.path.join(self.tmpdir, "manifest.summary.json"),
+        )
+
+    def test_json(self):
+        entries = [
+            {"fastq_a": "a.fq.gz", "output_prefix": "a_"},
+            {"fastq_a": "b_1.fq.gz", "fastq_b": "b_2.fq.gz", "output_prefix": "b_"},
+        ]
+        fname = self.write("manifest.json", json.dumps(entries))
+        result = read_manifest(fname)
+        self.assertEqual(result[0]["fastq_b"], None)
+        self.assertEqual(result[1]["fastq_b"], "b_2.fq.gz")
+
+    def test_invalid(self):
+        for name, text in (
+            ("missing.tsv", "fastq_a\tfastq_b\na.fq\t\n"),
+            ("columns.tsv", "fastq_a\tfastq_b\toutput_prefix\na.fq\t\n"),
+            ("same.tsv", "fastq_a\tfastq_b\toutput_prefix\na.fq\ta.fq\tx_\n"),
+            ("dict.json", '{"fastq_a": "a.fq"}'),
+            ("prefix.json", '[{"fastq_a": "a.fq"}]'),
+        ):
+            with self.subTest(manifest=name):
+                with self.assertRaises(ValueError):
+                    read_manifest(self.write(name, text))
+
+
+class TestMainManifest(unittest.TestCase):
+    """Test splitting the fastqs of a manifest"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        data = random_fastq_bytes(600)
+        self.inputs = {}
+        for name, content in (
+            ("single.fastq", random_fastq_bytes(200, seed=1)),
+            ("pair_1.fastq", data),
+            ("pair_2.fastq", data.replace(b" 1:N:0:", b" 2:N:0:")),
+        ):
+            fname = os.path.join(self.tmpdir, name)
+            with open(fname, "wb") as o:
+                o.write(content)
+            self.inputs[name] = fname
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_manifest(self, entries):
+        manifest = os.path.join(self.tmpdir, "manifest.json")
+        with open(manifest, "wt") as o:
+            json.dump(entries, o)
+        args = argparse.Namespace(
+            manifest=manifest, fastq_a=None, fastq_b=None, processes=2
+        )
+        try:
+            main_handler(args)
+        finally:
+            with open(get_summary_filename(manifest), "rt") as fh:
+                self.summary = json.load(fh)
+
+    def test_manifest(self):
+        self.run_manifest(
+            [
+                {
+                    "fastq_a": self.inputs["single.fastq"],
+                    "output_prefix": os.path.join(self.tmpdir, "single_"),
+                },
+                {
+                    "fastq_a": self.inputs["pair_1.fastq"],
+                    "fastq_b": self.inputs["pair_2.fastq"],
+                    "output_prefix": os.path.join(self.tmpdir, "pair_"),
+                },
+            ]
+        )
+        self.assertEqual(self.summary["entry_count"], 2)
+        self.assertEqual(self.summary["fastq_count"], 3)
+        self.assertEqual(self.summary["failed_count"], 0)
+        self.assertEqual(self.summary["record_count"], 1400)
+        single, pair = self.summary["entries"]
+        self.assertEqual(single["status"], "ok")
+        self.assertEqual(
+            [fastq["record_count"] for fastq in pair["fastqs"]], [600, 600]
+        )
+        for key, metadata in pair["fastqs"][1]["read_groups"].items():
+            self.assertEqual(
+                metadata["fastq_filename"], "pair_{0}_R2.fq.gz".format(key)
+            )
+            self.assertTrue(
+                os.path.exists(os.path.join(self.tmpdir, metadata["fastq_filename"]))
+            )
+        self.assertTrue(
+            os.path.exists(os.path.join(self.tmpdir, "single_FC0_1_R1.fq.gz"))
+        )
+
+    def test_failed_entry(self):
+        """Entries that fail do not stop the others and are in the summary"""
+        with self.assertRaises(ValueError):
+            self.run_manifest(
+                [
+                    {
+                        "fastq_a": self.inputs["pair_1.fastq"],
+                        "fastq_b": self.inputs["single.fastq"],
+                        "output_prefix": os.path.join(self.tmpdir, "bad_"),
+                    },
+                    {
+                        "fastq_a": os.path.join(self.tmpdir, "missing.fastq"),
+                        "output_prefix": os.path.join(self.tmpdir, "missing_"),
+                    },
+                    {
+                        "fastq_a": self.inputs["single.fastq"],
+                        "output_prefix": os.path.join(self.tmpdir, "single_"),
+                    },
+                ]
+            )
+        self.assertEqual(self.summary["failed_count"], 2)
+        bad, missing, single = self.summary["entries"]
+        self.assertIn("different number of records", bad["error"])
+        self.assertIn("FileNotFoundError", missing["error"])
+        self.assertIsNone(missing["fastqs"][0]["record_count"])
+        self.assertEqual(single["status"], "ok")
+        self.assertIsNone(single["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
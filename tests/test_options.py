@@ -0,0 +1,39 @@
+import unittest
+import argparse
+import pickle
+
+from gdc_fastq_splitter.options import SplitOptions
+
+
+class TestSplitOptions(unittest.TestCase):
+    """Test the options of a split"""
+
+    def test_from_args(self):
+        """Options missing from the CLI options keep their defaults"""
+        args = argparse.Namespace(
+            threads=4, codec="none", compression_level=None, max_memory=1000
+        )
+        options = SplitOptions.from_args(args)
+        self.assertEqual(options.threads, 4)
+        self.assertEqual(options.codec.name, "none")
+        self.assertEqual(options.max_memory, 1000)
+        self.assertEqual(options.processes, 1)
+        self.assertEqual(options.block_size, SplitOptions().block_size)
+        self.assertEqual(
+            SplitOptions.from_args(argparse.Namespace()).codec.name, "gzip"
+        )
+
+    def test_replace(self):
+        """Replaced options are a copy"""
+        options = SplitOptions(max_memory=1000, processes=4)
+        shared = options.replace(processes=1).share_memory(3)
+        self.assertEqual((shared.processes, shared.max_memory), (1, 333))
+        self.assertEqual((options.processes, options.max_memory), (4, 1000))
+        self.assertIs(SplitOptions().share_memory(2).max_memory, None)
+        with self.assertRaises(TypeError):
+            options.replace(unknown=True)
+
+    def test_pickle(self):
+        """Options are handed to worker processes"""
+        options = pickle.loads(pickle.dumps(SplitOptions(threads=2, qc=True)))
+        self.assertEqual((options.threads, options.qc), (2, True))
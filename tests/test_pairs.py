@@ -0,0 +1,147 @@
+import unittest
+
+from gdc_fastq_splitter.fastq.pairs import (
+    iter_interleaved_batches,
+    iter_mate_batches,
+    mate_names,
+)
+from gdc_fastq_splitter.fastq.illumina import IlluminaRawFastqRecord
+from gdc_fastq_splitter.fastq.reader import iter_batches
+from tests.utils import random_fastq_bytes
+
+
+def mate_data(data):
+    return data.replace(b" 1:N:0:", b" 2:N:0:")
+
+
+def records(data):
+    lines = data.split(b"\n")
+    return [b"\n".join(lines[i : i + 4]) + b"\n" for i in range(0, len(lines) - 1, 4)]
+
+
+def interleave(data_a, data_b):
+    return b"".join(a + b for a, b in zip(records(data_a), records(data_b)))
+
+
+def blocks(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestMateBatches(unittest.TestCase):
+    """Test reading mate fastqs in lockstep"""
+
+    def test_mate_names(self):
+        self.assertEqual(
+            mate_names([b"@A:1:FC:1:1:2:3 1:N:0:ACGT", b"@A:1:FC:1:1:2:4"]),
+            [b"@A:1:FC:1:1:2:3", b"@A:1:FC:1:1:2:4"],
+        )
+        self.assertEqual(mate_names([b"@read1/1", b"@read2/1"]), [b"@read1", b"@read2"])
+        self.assertEqual(mate_names([b"@read1/2"]), [b"@read1"])
+        self.assertEqual(mate_names([]), [])
+
+    def test_lockstep(self):
+        """Batches of different sizes are cut to the same records"""
+        data = random_fastq_bytes(500)
+        pairs = list(
+            iter_mate_batches(
+                iter_batches(blocks(data, 1000)),
+                iter_batches(blocks(mate_data(data), 3000)),
+            )
+        )
+        for batch_a, batch_b in pairs:
+            self.assertEqual(len(batch_a), len(batch_b))
+            self.assertEqual(
+                batch_a.tobytes(), batch_b.tobytes().replace(b" 2:N", b" 1:N")
+            )
+        self.assertEqual(b"".join(a.tobytes() for a, _ in pairs), data)
+        self.assertEqual(sum(len(a) for a, _ in pairs), 500)
+
+    def test_mismatch(self):
+        """A mismatch fails at the first record that differs"""
+        data = random_fastq_bytes(500)
+        lines = mate_data(data).split(b"\n")
+        del lines[1200:1204]
+        pairs = iter_mate_batches(
+            iter_batches(blocks(data, 2000)),
+            iter_batches(blocks(b"\n".join(lines), 2000)),
+            fnames=("a.fq", "b.fq"),
+        )
+        with self.assertRaisesRegex(ValueError, "record 301 of fastqs a.fq and b.fq"):
+            list(pairs)
+
+    def test_different_counts(self):
+        data = random_fastq_bytes(100)
+        for mate, message in (
+            (mate_data(data)[: data.index(b"@A00:1:FC1:1:1:51:")], "a.fq has more"),
+            (mate_data(data) + mate_data(data)[:300], "b.fq has more"),
+        ):
+            with self.assertRaisesRegex(ValueError, message):
+                list(
+                    iter_mate_batches(
+                        iter_batches([data]), iter_batches([mate]), ("a.fq", "b.fq")
+                    )
+                )
+
+
+class TestInterleavedBatches(unittest.TestCase):
+    """Test reading the mates of an interleaved fastq"""
+
+    def test_deinterleave(self):
+        """Odd sized batches carry their last first mate over"""
+        data = random_fastq_bytes(500)
+        mate = mate_data(data)
+        for size in (1000, 3001, len(data) * 2):
+            pairs = list(
+                iter_interleaved_batches(
+                    iter_batches(
+                        blocks(interleave(data, mate), size),
+                        record_cls=IlluminaRawFastqRecord,
+                    )
+                )
+            )
+            self.assertEqual(b"".join(a.tobytes() for a, _ in pairs), data)
+            self.assertEqual(b"".join(b.tobytes() for _, b in pairs), mate)
+            for batch_a, batch_b in pairs:
+                self.assertEqual(len(batch_a), len(batch_b))
+                self.assertEqual([r.header for r in batch_a], batch_a.headers)
+
+    def test_alternation(self):
+        """Mates out of order fail with their record number"""
+        data = random_fastq_bytes(100)
+        mate = mate_data(data)
+        for interleaved, message in (
+            (
+                interleave(mate, data),
+                "Record 1 of interleaved fastq in.fq is not mate 1",
+            ),
+            (
+                interleave(data, data),
+                "Record 2 of interleaved fastq in.fq is not mate 2",
+            ),
+            (
+                interleave(data, b"".join(records(mate)[1:2] + records(mate)[1:])),
+                "Mates do not match at records 1 and 2 of interleaved fastq in.fq",
+            ),
+            (
+                interleave(data, mate.replace(b" 2:N:0:ACGT", b"", 1)),
+                "Record 2 of interleaved fastq in.fq is not mate 2",
+            ),
+            (
+                interleave(data, mate)[: -len(records(mate)[-1])],
+                "no mate for its last record 199",
+            ),
+        ):
+            with self.assertRaisesRegex(ValueError, message):
+                list(
+                    iter_interleaved_batches(
+                        iter_batches(
+                            blocks(interleaved, 1000),
+                            record_cls=IlluminaRawFastqRecord,
+                        ),
+                        fname="in.fq",
+                    )
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
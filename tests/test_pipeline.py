@@ -0,0 +1,153 @@
+import unittest
+
+from gdc_fastq_splitter.pipeline import (
+    BackgroundConsumer,
+    BackgroundIterator,
+    ThreadedWriter,
+)
+from gdc_fastq_splitter.fastq.writer import BufferBudget
+
+
+class FakeWriter:
+    fname = "fake.fq.gz"
+    reporter = None
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.records = []
+        self.closed = False
+
+    def write_records(self, records, data=None):
+        if records == self.fail_on:
+            raise ValueError("bad records")
+        self.records.extend(records)
+
+    def suspend(self):
+        self.records.append("suspended")
+
+    def close(self):
+        self.closed = True
+
+
+class TestBackgroundIterator(unittest.TestCase):
+    """Test iterating in a background thread"""
+
+    def test_items(self):
+        """Items are handed over in order"""
+        items = BackgroundIterator(iter(range(100)), maxsize=2)
+        self.assertEqual(list(items), list(range(100)))
+        items.close()
+
+    def test_suspend(self):
+        """Writers are suspended after the records queued before"""
+        fake = FakeWriter()
+        writer = ThreadedWriter(fake, maxsize=1)
+        writer.write_records([1])
+        writer.suspend()
+        writer.write_records([2])
+        writer.close()
+        self.assertEqual(fake.records, [1, "suspended", 2])
+
+    def test_error(self):
+        """Errors in the background thread are raised by the consumer"""
+
+        def gen():
+            yield 1
+            raise ValueError("broken")
+
+        items = BackgroundIterator(gen())
+        with self.assertRaises(ValueError):
+            list(items)
+        items.close()
+
+    def test_close_early(self):
+        """Closing stops a producer blocked on a full queue"""
+        items = BackgroundIterator(iter(range(1000)), maxsize=1)
+        self.assertEqual(next(iter(items)), 0)
+        items.close()
+
+
+class TestBackgroundConsumer(unittest.TestCase):
+    """Test consuming items in a background thread"""
+
+    def test_items(self):
+        """The function gets every item put and its result is returned"""
+        consumer = BackgroundConsumer(sum, maxsize=1)
+        for i in range(100):
+            consumer.put(i)
+        self.assertEqual(consumer.close(), sum(range(100)))
+
+    def test_error(self):
+        """Errors of the function are raised by put or close"""
+
+        def fail(items):
+            for item in items:
+                if item == 3:
+                    raise ValueError("broken")
+
+        consumer = BackgroundConsumer(fail, maxsize=1)
+        with self.assertRaises(ValueError):
+            for i in range(1000):
+                consumer.put(i)
+            consumer.close()
+
+
+class TestThreadedWriter(unittest.TestCase):
+    """Test writing in a worker thread"""
+
+    def test_write(self):
+        """Records are written in order and the writer is closed"""
+        fake = FakeWriter()
+        writer = ThreadedWriter(fake, maxsize=1)
+        for i in range(50):
+            writer.write_records([i, i])
+        writer.close()
+        self.assertEqual(fake.records, [i for i in range(50) for _ in range(2)])
+        self.assertTrue(fake.closed)
+
+    def test_suspend(self):
+        """Writers are suspended after the records queued before"""
+        fake = FakeWriter()
+        writer = ThreadedWriter(fake, maxsize=1)
+        writer.write_records([1])
+        writer.suspend()
+        writer.write_records([2])
+        writer.close()
+        self.assertEqual(fake.records, [1, "suspended", 2])
+
+    def test_budget(self):
+        """The bytes queued count in the budget until they are written"""
+        budget = BufferBudget(1000)
+        queued = []
+
+        class BudgetWriter(FakeWriter):
+            def write_records(self, records, data=None):
+                queued.append(budget.queued)
+
+        fake = BudgetWriter()
+        fake.budget = budget
+        writer = ThreadedWriter(fake)
+        writer.write_records([1], b"x" * 100)
+        writer.write_records([2], b"x" * 50)
+        writer.close()
+        # The second write may not be queued yet when the first is written
+        self.assertIn(queued, ([50, 0], [0, 0]))
+        self.assertEqual((budget.used, budget.queued), (0, 0))
+        self.assertGreaterEqual(budget.peak, 100)
+
+    def test_error(self):
+        """Errors in the worker are raised on close"""
+        fake = FakeWriter(fail_on=[3])
+        writer = ThreadedWriter(fake)
+        for i in range(10):
+            try:
+                writer.write_records([i])
+            except ValueError:
+                break
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertTrue(fake.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from gdc_fastq_splitter.progress import ProgressReporter, SharedProgress
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressReporter(unittest.TestCase):
+    """Test reporting the progress of a split"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.heartbeat = os.path.join(self.tmpdir, "in.progress.json")
+        self.clock = FakeClock()
+        self.logger = mock.Mock()
+        self.progress = ProgressReporter(
+            "in.fq.gz",
+            self.logger,
+            interval=10,
+            total_bytes=1000,
+            heartbeat=self.heartbeat,
+            clock=self.clock,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_heartbeat(self):
+        with open(self.heartbeat, "rt") as fh:
+            return json.load(fh)
+
+    def test_interval(self):
+        """The progress is reported once the interval has passed"""
+        self.progress.read(100)
+        self.clock.now += 5
+        self.assertFalse(self.progress.add(500, 5000))
+        self.logger.info.assert_not_called()
+
+        self.progress.read(150)
+        self.clock.now += 5
+        self.assertTrue(self.progress.add(500, 5000))
+        self.logger.info.assert_called_once()
+        self.assertIn("25.0% done, ETA 30s", self.logger.info.call_args[0][0])
+        progress = self.read_heartbeat()
+        self.assertEqual(progress["status"], "running")
+        self.assertEqual(progress["records"], 1000)
+        self.assertEqual(progress["records_per_second"], 100)
+        self.assertEqual(progress["input_bytes_per_second"], 1000)
+        self.assertEqual(progress["compressed_input_bytes_per_second"], 25)
+        self.assertEqual(progress["percent"], 25)
+        self.assertEqual(progress["eta_seconds"], 30)
+
+        # The rates are since the last report
+        self.progress.read(750)
+        self.clock.now += 20
+        self.assertTrue(self.progress.add(3000, 30000))
+        progress = self.read_heartbeat()
+        self.assertEqual(progress["records_per_second"], 150)
+        self.assertEqual(progress["percent"], 100)
+        self.assertEqual(progress["eta_seconds"], 0)
+
+    def test_status(self):
+        """The heartbeat has the status of the split"""
+        with self.progress:
+            self.assertEqual(self.read_heartbeat()["status"], "running")
+        self.assertEqual(self.read_heartbeat()["status"], "done")
+
+        with self.assertRaises(ValueError):
+            with self.progress:
+                raise ValueError("broken")
+        self.assertEqual(self.read_heartbeat()["status"], "failed")
+
+    def test_finish(self):
+        """The final progress has the average rates since the start"""
+        self.clock.now += 10
+        self.progress.add(1000, 10000)
+        self.clock.now += 10
+        self.progress.add(3000, 30000)
+        self.progress.finish()
+        progress = self.read_heartbeat()
+        self.assertEqual(progress["status"], "done")
+        self.assertEqual(progress["records_per_second"], 200)
+        self.assertEqual(progress["input_bytes_per_second"], 2000)
+
+    def test_update(self):
+        """Totals counted by worker processes are reported"""
+        shared = SharedProgress()
+        shared.add(300, 3000)
+        shared.read(400)
+        shared.add(200, 2000)
+        self.assertEqual(shared.totals(), (500, 5000, 400))
+        self.assertFalse(self.progress.update(*shared.totals()))
+        self.clock.now += 10
+        self.assertTrue(self.progress.update(*shared.totals()))
+        progress = self.read_heartbeat()
+        self.assertEqual(progress["records"], 500)
+        self.assertEqual(progress["records_per_second"], 50)
+        self.assertEqual(progress["percent"], 40)
+
+    def test_unknown_size(self):
+        """Streamed inputs have no percent or ETA"""
+        progress = ProgressReporter("-", self.logger, interval=0, clock=self.clock)
+        self.assertTrue(progress.add(10, 100))
+        self.assertNotIn("done", self.logger.info.call_args[0][0])
+        self.assertIsNone(progress.to_dict()["percent"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from collections import Counter
+
+from gdc_fastq_splitter.fastq.qc import QcStats, qc_available
+from tests.utils import random_fastq_bytes
+
+
+@unittest.skipUnless(qc_available(), "numpy is not installed")
+class TestQcStats(unittest.TestCase):
+    """Test the QC statistics of records"""
+
+    def expected(self, data):
+        lines = data.decode("utf-8").splitlines()
+        seqs, quals = lines[1::4], lines[3::4]
+        bases = sum(len(seq) for seq in seqs)
+        scores = [ord(c) - 33 for qual in quals for c in qual]
+        return {
+            "read_count": len(seqs),
+            "base_count": bases,
+            "lengths": Counter(len(seq) for seq in seqs),
+            "mean_quality": round(sum(scores) / bases, 3),
+            "first_position": round(
+                sum(ord(qual[0]) - 33 for qual in quals) / len(quals), 3
+            ),
+            "gc_content": round(
+                sum(seq.count(c) for seq in seqs for c in "GC") / bases, 5
+            ),
+        }
+
+    def check(self, stats, data):
+        expected = self.expected(data)
+        result = stats.to_dict()
+        self.assertEqual(result["read_count"], expected["read_count"])
+        self.assertEqual(result["base_count"], expected["base_count"])
+        self.assertEqual(
+            result["read_length"]["distribution"],
+            {str(k): v for k, v in expected["lengths"].items()},
+        )
+        self.assertEqual(result["read_length"]["min"], min(expected["lengths"]))
+        self.assertEqual(result["read_length"]["max"], max(expected["lengths"]))
+        self.assertEqual(result["mean_quality"], expected["mean_quality"])
+        self.assertEqual(
+            result["per_position_mean_quality"][0], expected["first_position"]
+        )
+        self.assertEqual(
+            len(result["per_position_mean_quality"]), max(expected["lengths"])
+        )
+        self.assertEqual(result["gc_content"], expected["gc_content"])
+        self.assertEqual(
+            sum(result["read_gc_percent_distribution"].values()),
+            expected["read_count"],
+        )
+
+    def test_add(self):
+        data = random_fastq_bytes(500)
+        stats = QcStats()
+        stats.add(data)
+        self.check(stats, data)
+
+    def test_merge_and_state(self):
+        """Statistics of chunks are merged and restored from their state"""
+        data = random_fastq_bytes(500)
+        lines = data.splitlines(True)
+        first, second = QcStats(), QcStats()
+        first.add(b"".join(lines[:400]))
+        second.add(b"".join(lines[400:]))
+        first.merge(QcStats.from_state(second.get_state()))
+        self.check(first, data)
+
+    def test_crlf(self):
+        data = random_fastq_bytes(50)
+        stats = QcStats()
+        stats.add(data.replace(b"\n", b"\r\n"))
+        self.check(stats, data)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            QcStats().add(b"@r\nACGT\n+\nFF\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+
+from gdc_fastq_splitter.fastq.compression import is_bgzf
+from gdc_fastq_splitter.fastq.illumina import IlluminaFastqRecord
+from gdc_fastq_splitter.fastq.ranges import (
+    find_record_start,
+    plan_fastq_ranges,
+    iter_file_range,
+    iter_bgzf_range,
+)
+from gdc_fastq_splitter.fastq.reader import iter_batches
+from tests.utils import random_fastq_bytes, write_bgzf
+
+
+class TestFindRecordStart(unittest.TestCase):
+    """Test finding record boundaries"""
+
+    def test_quality_starts_with_at(self):
+        """Quality lines starting with '@' are not record starts"""
+        data = b"@r1\nACGT\n+\n@@@@\n@r2\nACGT\n+\n++++\n"
+        self.assertEqual(find_record_start(data, 0), 0)
+        self.assertEqual(find_record_start(data, 1), 16)
+        self.assertEqual(find_record_start(data, 11), 16)
+        self.assertEqual(find_record_start(data, 17), -1)
+
+
+class TestPlanFastqRanges(unittest.TestCase):
+    """Test splitting fastq files into ranges"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = random_fastq_bytes(1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_ranges(self, ranges, iter_range, fname):
+        records = []
+        for start, end in ranges:
+            blocks = iter_range(fname, start, end, block_size=777)
+            for batch in iter_batches(blocks, IlluminaFastqRecord.raw_record_cls):
+                records.extend(bytes(record) for record in batch)
+        self.assertEqual(len(records), 1000)
+        self.assertEqual(b"".join(records), self.data)
+
+    def test_plain(self):
+        """Uncompressed fastqs are split on record boundaries"""
+        fname = os.path.join(self.tmpdir, "test.fastq")
+        with open(fname, "wb") as o:
+            o.write(self.data)
+
+        ranges = plan_fastq_ranges(fname, 7)
+        self.assertEqual(len(ranges), 7)
+        for start, end in ranges:
+            self.assertEqual(find_record_start(self.data, start), start)
+        self.check_ranges(ranges, iter_file_range, fname)
+
+    def test_bgzf(self):
+        """BGZF fastqs are split on block boundaries"""
+        fname = os.path.join(self.tmpdir, "test.fastq.gz")
+        write_bgzf(fname, self.data)
+        self.assertTrue(is_bgzf(fname))
+
+        ranges = plan_fastq_ranges(fname, 5)
+        self.assertEqual(len(ranges), 5)
+        self.check_ranges(ranges, iter_bgzf_range, fname)
+
+    def test_gzip(self):
+        """Gzip fastqs can not be split"""
+        fname = os.path.join(self.tmpdir, "test.fastq.gz")
+        with gzip.open(fname, "wb") as o:
+            o.write(self.data)
+        self.assertFalse(is_bgzf(fname))
+        self.assertIsNone(plan_fastq_ranges(fname, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from gdc_fastq_splitter.fastq.illumina import (
+    IlluminaFastqRecord,
+    IlluminaNoBarcodeFastqRecord,
+)
+from gdc_fastq_splitter.fastq.reader import (
+    FastqReader,
+    RawFastqReader,
+    FastqBlockReader,
+)
+from tests.utils import get_test_file
+
+
+class TestRawFastqReader(unittest.TestCase):
+    """Test the bytes-native fastq reader"""
+
+    def test_raw_bytes_untouched(self):
+        """The raw records concatenate back to the input file"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        reader = RawFastqReader(fil, record_cls=IlluminaFastqRecord.raw_record_cls)
+        try:
+            data = b"".join(bytes(record) for record in reader)
+        finally:
+            reader.close()
+
+        with open(fil, "rb") as fh:
+            self.assertEqual(data, fh.read())
+
+    def test_matches_parsed_records(self):
+        """The raw record fields match the fully parsed records"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        raw_reader = RawFastqReader(fil, record_cls=IlluminaFastqRecord.raw_record_cls)
+        reader = FastqReader(fil, record_cls=IlluminaFastqRecord)
+        try:
+            for raw, record in zip(raw_reader, reader):
+                self.assertEqual(bytes(raw), bytes(record))
+                self.assertEqual(raw.read_key, record.read_key)
+                self.assertEqual(raw.read_pair, record.read_pair)
+                self.assertEqual(raw.flowcell, record.flowcell)
+                self.assertEqual(raw.lane, record.lane)
+                self.assertEqual(raw.index, record.index)
+        finally:
+            raw_reader.close()
+            reader.close()
+
+    def test_nobarcode(self):
+        """Raw records without a barcode have no index"""
+        fil = get_test_file("fake_IlluminaSequenceIdentifierNoBarcode.fastq")
+        reader = RawFastqReader(
+            fil, record_cls=IlluminaNoBarcodeFastqRecord.raw_record_cls
+        )
+        try:
+            records = list(reader)
+        finally:
+            reader.close()
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].read_key, "C9E9CANXX_7")
+        self.assertEqual(records[0].read_pair, "1")
+        self.assertFalse(hasattr(records[0], "index"))
+        self.assertEqual(records[0].seqid.instrument_name, "D00761")
+
+
+class TestFastqBlockReader(unittest.TestCase):
+    """Test the block based fastq reader"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.record_cls = IlluminaFastqRecord.raw_record_cls
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_fastq(self, data):
+        fname = os.path.join(self.tmpdir, "test.fastq")
+        with open(fname, "wb") as o:
+            o.write(data)
+        return fname
+
+    def read_batches(self, fname, block_size):
+        reader = FastqBlockReader(
+            fname, record_cls=self.record_cls, block_size=block_size
+        )
+        try:
+            return list(reader.batches())
+        finally:
+            reader.close()
+
+    def test_block_sizes(self):
+        """Records are carried over correctly for any block size"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        with open(fil, "rb") as fh:
+            expected = fh.read()
+
+        for block_size in (1, 7, 64, 200, 1 << 20):
+            batches = self.read_batches(fil, block_size)
+            self.assertEqual(sum(len(batch) for batch in batches), 6)
+            data = b"".join(bytes(r) for batch in batches for r in batch)
+            self.assertEqual(data, expected)
+
+    def test_iterate_records(self):
+        """Iterating the reader yields single records"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        reader = FastqBlockReader(fil, record_cls=self.record_cls, block_size=100)
+        try:
+            keys = [record.read_key for record in reader]
+        finally:
+            reader.close()
+        self.assertEqual(len(keys), 6)
+        self.assertEqual(keys[3], "HTM2GBGXX_2")
+
+    def test_missing_final_newline(self):
+        """The last record does not need a trailing newline"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        with open(fil, "rb") as fh:
+            expected = fh.read()
+        fname = self.write_fastq(expected.rstrip(b"\n"))
+
+        batches = self.read_batches(fname, 64)
+        data = b"".join(bytes(r) for batch in batches for r in batch)
+        self.assertEqual(data, expected)
+
+    def test_crlf_headers(self):
+        """Headers are stripped of carriage returns"""
+        fil = get_test_file("fake_IlluminaSequenceIdentifier.fastq")
+        with open(fil, "rb") as fh:
+            data = fh.read().replace(b"\n", b"\r\n")
+        fname = self.write_fastq(data)
+
+        batches = self.read_batches(fname, 1 << 20)
+        record = list(batches[0])[0]
+        self.assertEqual(bytes(record), data)
+        self.assertEqual(record.index, "TAAGGCGA+ATAGAGAG")
+
+    def test_truncated(self):
+        """A truncated final record raises an error"""
+        fil = get_test_file("fake_MultipleReadGroups.fastq")
+        with open(fil, "rb") as fh:
+            data = fh.read()
+        fname = self.write_fastq(data[:-20])
+
+        with self.assertRaises(ValueError):
+            self.read_batches(fname, 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
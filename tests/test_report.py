@@ -0,0 +1,140 @@
+import unittest
+import json
+import random
+from collections import Counter
+
+from gdc_fastq_splitter.fastq.report import (
+    BaseReport,
+    ReportWithBarcodes,
+    SpaceSavingCounter,
+    report_from_state,
+)
+
+
+class _Record:
+    def __init__(self, index):
+        self.index = index
+
+
+class TestSpaceSavingCounter(unittest.TestCase):
+    """Test the bounded approximate counter"""
+
+    def stream(self, n=20000, seed=0):
+        rng = random.Random(seed)
+        items = []
+        for _ in range(n):
+            if rng.random() < 0.6:
+                items.append("AAAAAAAA")
+            elif rng.random() < 0.5:
+                items.append("CCCCCCCC")
+            else:
+                items.append("".join(rng.choice("ACGTN") for _ in range(8)))
+        return items
+
+    def test_exact_under_capacity(self):
+        """Counts are exact while there are fewer items than the capacity"""
+        counter = SpaceSavingCounter(10)
+        counter.update(["A", "B", "A", "C"])
+        self.assertEqual(dict(counter), {"A": 2, "B": 1, "C": 1})
+        self.assertEqual(counter.max_error, 0)
+
+    def test_bounds(self):
+        """Counts are upper bounds within their errors and the size is capped"""
+        items = self.stream()
+        exact = Counter(items)
+        counter = SpaceSavingCounter(50)
+        for i in range(0, len(items), 1000):
+            counter.update(items[i : i + 1000])
+
+        self.assertEqual(len(counter), 50)
+        self.assertEqual(counter.total, len(items))
+        self.assertEqual(sum(counter.values()), len(items))
+        for item, count in counter.items():
+            self.assertGreaterEqual(count, exact[item])
+            self.assertLessEqual(count - counter.errors[item], exact[item])
+        self.assertLessEqual(counter.max_error, len(items) // 50)
+        self.assertEqual(counter.most_common(2)[0][0], "AAAAAAAA")
+        self.assertEqual(counter.most_common(2)[1][0], "CCCCCCCC")
+
+    def test_single_adds(self):
+        """Adding one item at a time keeps the same guarantees"""
+        items = self.stream(n=5000, seed=1)
+        exact = Counter(items)
+        counter = SpaceSavingCounter(20)
+        for item in items:
+            counter.add(item)
+        for item, count in counter.items():
+            self.assertGreaterEqual(count, exact[item])
+            self.assertLessEqual(count - counter.errors[item], exact[item])
+
+    def test_merge(self):
+        """Merged counters keep the frequent items and upper bounds"""
+        items = self.stream()
+        exact = Counter(items)
+        first, second = SpaceSavingCounter(50), SpaceSavingCounter(50)
+        first.update(items[:10000])
+        second.update(items[10000:])
+        first.update(second)
+
+        self.assertEqual(len(first), 50)
+        self.assertEqual(first.total, len(items))
+        self.assertEqual(first.most_common(1)[0][0], "AAAAAAAA")
+        for item, count in first.items():
+            self.assertGreaterEqual(count, exact[item])
+            self.assertLessEqual(count - first.errors[item], exact[item])
+
+    def test_invalid_capacity(self):
+        with self.assertRaises(ValueError):
+            SpaceSavingCounter(0)
+
+
+class TestReportWithBarcodes(unittest.TestCase):
+    """Test the barcode frequencies of reports"""
+
+    def records(self):
+        return [_Record("ACGT+TTGA")] * 90 + [
+            _Record("ACG{0}+TTGA".format(c)) for c in "ACGN" * 5
+        ]
+
+    def test_exact(self):
+        report = ReportWithBarcodes("r.json", "f.fq.gz")
+        report.add_records(self.records())
+        data = report.to_dict()
+        self.assertEqual(len(data["barcode_frequency"]), 5)
+        self.assertEqual(data["barcode_frequency"]["ACGT+TTGA"], 90)
+        self.assertNotIn("barcode_frequency_error", data)
+
+    def test_bounded(self):
+        report = ReportWithBarcodes("r.json", "f.fq.gz", max_barcodes=2)
+        report.add_records(self.records())
+        report += _Record("ACGC+TTGA")
+        data = report.to_dict()
+        self.assertEqual(len(data["barcode_frequency"]), 2)
+        self.assertEqual(data["metadata"]["multiplex_barcode"], "ACGT+TTGA")
+        self.assertEqual(data["metadata"]["record_count"], 111)
+        self.assertEqual(data["barcode_frequency_error"]["max_barcodes"], 2)
+        self.assertGreater(data["barcode_frequency_error"]["max_error"], 0)
+
+        other = ReportWithBarcodes("r.json", "f.fq.gz", max_barcodes=2)
+        other.add_records(self.records())
+        report.merge(other)
+        self.assertEqual(report.record_counts, 221)
+        self.assertEqual(report.most_common_barcode, "ACGT+TTGA")
+        self.assertEqual(len(report.barcode_frequency), 2)
+
+    def test_state(self):
+        """Reports are restored from their state"""
+        for max_barcodes in (None, 2):
+            report = ReportWithBarcodes(
+                "r.json", "f.fq.gz", "FC", 1, max_barcodes=max_barcodes
+            )
+            report.add_records(self.records())
+            restored = report_from_state(json.loads(json.dumps(report.get_state())))
+            self.assertIsInstance(restored, ReportWithBarcodes)
+            self.assertEqual(restored.to_dict(), report.to_dict())
+
+        report = BaseReport("r.json", "f.fq.gz", "FC", 1)
+        report.add_records(self.records())
+        restored = report_from_state(report.get_state())
+        self.assertIsInstance(restored, BaseReport)
+        self.assertEqual(restored.to_dict(), report.to_dict())
@@ -0,0 +1,84 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from gdc_fastq_splitter.fastq.runs import RunIndex, find_runs
+
+
+class TestFindRuns(unittest.TestCase):
+    """Test finding runs of read keys"""
+
+    def test_runs(self):
+        keys = ["a", "a", "b", "a", "a", "a", "c"]
+        self.assertEqual(
+            find_runs(keys), [("a", 0, 2), ("b", 2, 3), ("a", 3, 6), ("c", 6, 7)]
+        )
+
+    def test_single_run(self):
+        self.assertEqual(find_runs(["a"] * 5), [("a", 0, 5)])
+
+    def test_empty(self):
+        self.assertEqual(find_runs([]), [])
+
+
+class TestRunIndex(unittest.TestCase):
+    """Test the run-length index of read keys"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_add(self):
+        """Runs of the same read key are joined"""
+        index = RunIndex()
+        index.add("a", 100, 2)
+        index.add("a", 50, 1)
+        index.add("b", 10, 1)
+        self.assertEqual(index.runs, [["a", 0, 150, 0, 3], ["b", 150, 10, 3, 1]])
+        self.assertEqual((index.byte_count, index.record_count), (160, 4))
+
+    def test_extend(self):
+        """The runs of a following part are shifted"""
+        first, second = RunIndex(), RunIndex()
+        first.add("a", 100, 2)
+        second.add("a", 50, 1)
+        second.add("b", 10, 1)
+        first.extend(second)
+        self.assertEqual(first.runs, [["a", 0, 150, 0, 3], ["b", 150, 10, 3, 1]])
+
+    def test_write_read(self):
+        """The index is read back for the fastq it was written for"""
+        fastq = os.path.join(self.tmpdir, "in.fq")
+        with open(fastq, "wb") as o:
+            o.write(b"@r\nA\n+\nF\n" * 3)
+        index = RunIndex()
+        index.add("FC_1", 100, 2)
+        index.add("FC_2", 10, 1)
+        index.barcodes = {"FC_1": {"ACGT": 1, "ACGA": 1}}
+        fname = os.path.join(self.tmpdir, "runs.tsv")
+        index.write(fname, fastq)
+        read = RunIndex.read(fname, fastq)
+        self.assertEqual(read.runs, index.runs)
+        self.assertEqual(read.barcodes, index.barcodes)
+        self.assertEqual(read.record_counts(), {"FC_1": 2, "FC_2": 1})
+
+        with open(fastq, "ab") as o:
+            o.write(b"@r\nA\n+\nF\n")
+        with self.assertRaisesRegex(ValueError, "changed since"):
+            RunIndex.read(fname, fastq)
+        # The index of a stream has no size to check
+        index.write(fname)
+        with self.assertRaisesRegex(ValueError, "not written for a regular file"):
+            RunIndex.read(fname, fastq)
+
+        with open(fname, "wt") as o:
+            o.write("something\\else\n")
+        with self.assertRaises(ValueError):
+            RunIndex.read(fname, fastq)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+
+from gdc_fastq_splitter.fastq.validate import RecordValidator, check_batch
+from gdc_fastq_splitter.fastq.reader import iter_batches
+from tests.utils import random_fastq_bytes
+
+
+def batches(data, size=4096):
+    return list(iter_batches([data[i : i + size] for i in range(0, len(data), size)]))
+
+
+def corrupt(data, record, line, value):
+    """Replace a line of a 1-based record"""
+    lines = data.split(b"\n")
+    lines[4 * (record - 1) + line] = value
+    return b"\n".join(lines)
+
+
+class TestCheckBatch(unittest.TestCase):
+    """Test checking batches of records"""
+
+    def test_valid(self):
+        """Valid records have no issues"""
+        data = random_fastq_bytes(200)
+        for batch in batches(data):
+            self.assertEqual(check_batch(batch), [])
+        data = b"@r1\nACGTN.acgtn\n+r1\n!~IIIIIIIII\n"
+        self.assertEqual(check_batch(batches(data)[0]), [])
+
+    def test_issues(self):
+        """Each kind of invalid record is found by its index"""
+        data = random_fastq_bytes(20)
+        data = corrupt(data, 2, 2, b"-")
+        data = corrupt(data, 5, 1, b"ACGT")
+        data = corrupt(data, 5, 3, b"III")
+        data = corrupt(data, 9, 1, b"ACXT")
+        data = corrupt(data, 9, 3, b"IIII")
+        data = corrupt(data, 12, 3, b"II I")
+        data = corrupt(data, 12, 1, b"ACGT")
+        issues = check_batch(batches(data, len(data))[0])
+        self.assertEqual([i for i, _ in issues], [1, 4, 8, 11])
+        self.assertIn("separator", issues[0][1])
+        self.assertIn("lengths differ", issues[1][1])
+        self.assertIn("invalid bases 'X'", issues[2][1])
+        self.assertIn("invalid qualities ' '", issues[3][1])
+
+    def test_mismatched_separator(self):
+        """A separator line with another sequence identifier is invalid"""
+        data = b"@r1\nACGT\n+r2\nIIII\n@r2\nACGT\n+r2\nIIII\n"
+        issues = check_batch(batches(data)[0])
+        self.assertEqual([i for i, _ in issues], [0])
+
+    def test_crlf(self):
+        """Windows line endings are not part of the lines"""
+        data = b"@r1\r\nACGT\r\n+\r\nIIII\r\n@r2\r\nACGT\r\n+\r\nIII\r\n"
+        issues = check_batch(batches(data)[0])
+        self.assertEqual([i for i, _ in issues], [1])
+
+
+class TestRecordValidator(unittest.TestCase):
+    """Test validating the records of a fastq"""
+
+    def test_record_numbers(self):
+        """Invalid records are numbered across batches"""
+        data = random_fastq_bytes(500)
+        for record in (3, 250, 498):
+            data = corrupt(data, record, 1, b"ACGT")
+        validator = RecordValidator("in.fq")
+        for batch in batches(data):
+            validator.add(batch)
+        self.assertEqual(validator.record_count, 500)
+        self.assertEqual([record for record, _ in validator.issues], [3, 250, 498])
+        with self.assertRaisesRegex(
+            ValueError, "Fastq in.fq has 3 invalid records out of 500: 3, 250, 498$"
+        ):
+            validator.check()
+
+    def test_merge(self):
+        """Merged validators follow each other"""
+        data = corrupt(random_fastq_bytes(100), 10, 1, b"ACGT")
+        first = RecordValidator("in.fq")
+        second = RecordValidator("in.fq (part 1)", max_issues=1)
+        for validator in (first, second):
+            for batch in batches(data):
+                validator.add(batch)
+        second.add(batches(corrupt(random_fastq_bytes(5), 2, 1, b"A"))[0])
+
+        first.merge(second)
+        self.assertEqual(first.record_count, 205)
+        self.assertEqual(first.invalid_count, 3)
+        self.assertEqual([record for record, _ in first.issues], [10, 110])
+
+    def test_max_issues(self):
+        """Only the first invalid records are kept, all are counted"""
+        data = random_fastq_bytes(50)
+        for record in range(1, 51):
+            data = corrupt(data, record, 2, b"-")
+        validator = RecordValidator("in.fq", max_issues=20)
+        for batch in batches(data):
+            validator.add(batch)
+        self.assertEqual(validator.invalid_count, 50)
+        self.assertEqual(len(validator.issues), 20)
+        with self.assertRaisesRegex(
+            ValueError, "50 invalid records .*, 10, \\.\\.\\.$"
+        ):
+            validator.check()
+        RecordValidator("in.fq").check()
@@ -0,0 +1,96 @@
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+
+from gdc_fastq_splitter.fastq.writer import BufferBudget, FastqWriter
+
+
+class TestBufferBudget(unittest.TestCase):
+    """Test sharing a memory budget between write buffers"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_shares(self):
+        """Writers get a share of the budget that follows their traffic"""
+        budget = BufferBudget(1000, min_buffer=10)
+        writers = ["a", "b", "c", "d"]
+        for writer in writers:
+            budget.register(writer)
+        self.assertEqual(budget.add("a", 90, 90), [])
+        self.assertEqual(budget.add("b", 10, 10), [])
+        self.assertEqual(budget.limit(90), 900)
+        self.assertEqual(budget.limit(10), 100)
+        self.assertEqual(budget.limit(0), 10)
+        # Full at its share of the budget
+        self.assertEqual(budget.add("a", 990, 900), ["a"])
+        budget.release("a", 990)
+        self.assertEqual(budget.add("b", 20, 10), ["b"])
+        self.assertEqual((budget.used, budget.peak, budget.flushes), (20, 1000, 1))
+
+    def test_evict_largest(self):
+        """Over the budget, the largest buffers are flushed until it fits"""
+        budget = BufferBudget(1000, min_buffer=10)
+        for writer in "abc":
+            budget.register(writer)
+        self.assertEqual(budget.add("a", 100, 100), [])
+        self.assertEqual(budget.add("b", 300, 300), [])
+        self.assertEqual(budget.add("c", 400, 400), [])
+        # The records queued for writer threads count, and make room for
+        # themselves by flushing the largest buffers
+        budget.queue(650)
+        self.assertEqual(budget.add("a", 110, 10), ["c", "b"])
+        self.assertEqual((budget.used, budget.queued, budget.peak), (1460, 650, 1460))
+        budget.dequeue(650)
+        self.assertEqual(budget.used, 810)
+
+    def test_str(self):
+        """Small budgets are shown in the unit of their size"""
+        budget = BufferBudget(3 * 2**19, min_buffer=10)
+        budget.register("a")
+        budget.add("a", 700, 700)
+        budget.queue(2048)
+        self.assertEqual(
+            str(budget),
+            "2.7 KiB of 1.5 MiB buffered by 1 writers, 2.0 KiB queued (peak 2.7 KiB)",
+        )
+        budget.dequeue(2048)
+        self.assertEqual(
+            str(budget).split(",")[0], "700 B of 1.5 MiB buffered by 1 writers"
+        )
+
+    def test_writers(self):
+        """Buffered writers write the same outputs within the budget"""
+        budget = BufferBudget(4096, min_buffer=512)
+        writers = [
+            FastqWriter(os.path.join(self.tmpdir, "{0}.fq.gz".format(i)), budget=budget)
+            for i in range(3)
+        ]
+        expected = [b"", b"", b""]
+        for i in range(300):
+            data = "@read{0}\nACGT\n+\nFFFF\n".format(i).encode("utf-8")
+            # Most of the records go to the first output
+            writer = 0 if i % 5 else i % 3
+            writers[writer].write_records(None, data)
+            expected[writer] += data
+            self.assertLessEqual(budget.used, 4096)
+        for writer in writers:
+            writer.close()
+
+        self.assertEqual(budget.used, 0)
+        # The buffers of the other outputs are flushed to make room too
+        self.assertTrue(all(writer.output_bytes for writer in writers))
+        self.assertGreater(budget.flushes, 3)
+        for i, data in enumerate(expected):
+            with gzip.open(writers[i].fname, "rb") as fh:
+                self.assertEqual(fh.read(), data)
+            self.assertEqual(writers[i].output_bytes, len(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""Helpers for creating test fastq files"""
+import os
+import random
+import struct
+import zlib
+
+
+def get_test_file(name):
+    return os.path.join(os.path.dirname(__file__), "etc", name)
+
+
+def random_fastq_bytes(n, seed=0, barcodes=None):
+    """Records whose quality lines often start with '@' or '+'. If a list of
+    `barcodes` is given, the barcode of each record is picked from it."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        length = rng.randint(5, 60)
+        seq = "".join(rng.choice("ACGTN") for _ in range(length))
+        qual = rng.choice("@+") + "".join(
+            rng.choice("@+#<AF") for _ in range(length - 1)
+        )
+        barcode = rng.choice(barcodes) if barcodes else "ACGT"
+        lines.append(
+            "@A00:1:FC{0}:{1}:1:{2}:1 1:N:0:{3}\n{4}\n+\n{5}\n".format(
+                i % 2, 1 + i // 300, i, barcode, seq, qual
+            )
+        )
+    return "".join(lines).encode("utf-8")
+
+
+def write_bgzf(fname, data, block_size=4000):
+    """Write BGZF blocks the same way bgzip does"""
+    with open(fname, "wb") as o:
+        for i in range(0, len(data) + 1, block_size):
+            chunk = data[i : i + block_size]
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+            cdata = compressor.compress(chunk) + compressor.flush()
+            header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+            o.write(header + struct.pack("<H", len(cdata) + 25))
+            o.write(cdata + struct.pack("<II", zlib.crc32(chunk), len(chunk)))